@@ -0,0 +1,218 @@
+import networkx as nx
+from Fib import area_key
+
+
+def partition_areas(graph, seed=0):
+    """
+    Split a graph into areas of densely connected nodes.
+
+    Parameters:
+    graph (networkx.Graph): The network graph.
+    seed (int): The random seed for the community detection. Default is 0.
+
+    Returns:
+    dict: The area ID of every node name.
+    """
+    communities = nx.community.louvain_communities(graph, weight=None, seed=seed)
+    communities = sorted(communities, key=lambda members: min(members))
+    return {name: str(area) for area, members in enumerate(communities) for name in members}
+
+
+class HierarchicalRouting:
+    """
+    Area-based routing tables for large topologies.
+
+    Every router gets full paths to the nodes of its own area and one summary
+    route per remote area. A summary route leads to the first node outside the
+    local area on the cheapest way toward the remote area, using border nodes
+    and summarized distances over a backbone of border nodes. Intra-area paths
+    are cached per area, so a change inside one area only recomputes that area.
+    """
+
+    def __init__(self, network, areas=None):
+        """
+        Initialize the routing.
+
+        Parameters:
+        network (Network): The network object.
+        areas (dict): The area ID of every node name. Default is a community partition of the graph.
+        """
+        self.areas = dict(areas) if areas is not None else partition_areas(network.graph)
+        self.area_cache = {}
+        self.recomputed_areas = []
+
+    def area_of(self, graph, node_name):
+        """
+        Get the configured area of a node.
+
+        Nodes added after the partition join the area of their first neighbor.
+
+        Parameters:
+        graph (networkx.Graph): The network graph.
+        node_name (str): The name of the node.
+
+        Returns:
+        str: The area ID.
+        """
+        if node_name not in self.areas:
+            neighbors = [self.areas[n] for n in graph.neighbors(node_name) if n in self.areas]
+            self.areas[node_name] = neighbors[0] if neighbors else node_name
+        return self.areas[node_name]
+
+    def effective_areas(self, graph):
+        """
+        Group the nodes into areas, splitting areas that a failure disconnected.
+
+        Parameters:
+        graph (networkx.Graph): The network graph.
+
+        Returns:
+        dict: The set of node names in every area.
+        """
+        grouped = {}
+        for node_name in graph.nodes:
+            grouped.setdefault(self.area_of(graph, node_name), set()).add(node_name)
+        areas = {}
+        for area, members in grouped.items():
+            components = sorted(nx.connected_components(graph.subgraph(members)), key=min)
+            if len(components) == 1:
+                areas[area] = components[0]
+            else:
+                for index, component in enumerate(components):
+                    areas[f"{area}.{index}"] = component
+        return areas
+
+    def intra_area_routes(self, graph, members):
+        """
+        Get the shortest paths and distances inside one area, reusing cached results.
+
+        Parameters:
+        graph (networkx.Graph): The network graph.
+        members (set): The node names in the area.
+
+        Returns:
+        tuple: The signature of the area and its (distances, paths).
+        """
+        subgraph = graph.subgraph(members)
+        signature = (frozenset(members),
+                     frozenset((*sorted((u, v)), data['weight']) for u, v, data in subgraph.edges(data=True)))
+        routes = self.area_cache.get(signature)
+        if routes is None:
+            distances, paths = {}, {}
+            for source, (source_distances, source_paths) in nx.all_pairs_dijkstra(subgraph, weight='weight'):
+                distances[source] = source_distances
+                paths[source] = source_paths
+            routes = (distances, paths)
+            self.recomputed_areas.append(min(members))
+        return signature, routes
+
+    def build_routing_tables(self, network):
+        """
+        Build the area-local and summary routing tables of every node.
+
+        Parameters:
+        network (Network): The network object.
+
+        Returns:
+        dict: The routing tables keyed by node name, as stored in HSF.json, with
+        the area of each node.
+        """
+        graph = network.graph
+        self.recomputed_areas = []
+        areas = self.effective_areas(graph)
+        node_area = {name: area for area, members in areas.items() for name in members}
+        intra = {}
+        cache = {}
+        for area, members in areas.items():
+            signature, routes = self.intra_area_routes(graph, members)
+            intra[area] = routes
+            cache[signature] = routes
+        # Keep only the areas that still exist
+        self.area_cache = cache
+
+        # Every inter-area link leaves one area from a border node
+        exits = {area: [] for area in areas}
+        for u, v, data in graph.edges(data=True):
+            if node_area[u] != node_area[v]:
+                exits[node_area[u]].append((u, v, data['weight']))
+                exits[node_area[v]].append((v, u, data['weight']))
+
+        # Backbone of border nodes: inter-area links plus summarized intra-area distances
+        backbone = nx.Graph()
+        for area, links in exits.items():
+            distances = intra[area][0]
+            borders = sorted({border for border, _, _ in links})
+            for border, neighbor, weight in links:
+                backbone.add_edge(border, neighbor, weight=weight)
+            for index, first in enumerate(borders):
+                for second in borders[index + 1:]:
+                    if second in distances[first]:
+                        backbone.add_edge(first, second, weight=distances[first][second])
+        to_area = {}
+        for area, links in exits.items():
+            if links:
+                borders = {border for border, _, _ in links}
+                to_area[area] = nx.multi_source_dijkstra_path_length(backbone, borders, weight='weight')
+
+        # Cheapest way out of each area toward each remote area, per border node
+        best_exits = {}
+        for area, links in exits.items():
+            for remote in to_area:
+                if remote == area:
+                    continue
+                by_border = {}
+                for border, neighbor, weight in links:
+                    remote_distance = 0 if node_area[neighbor] == remote else to_area[remote].get(neighbor)
+                    if remote_distance is None:
+                        continue
+                    cost = weight + remote_distance
+                    if border not in by_border or cost < by_border[border][0]:
+                        by_border[border] = (cost, neighbor)
+                best_exits[area, remote] = list(by_border.items())
+
+        nodes_by_name = {node.name: node for node in network.nodes.values()}
+        routing_tables = {}
+        for node_name, area in node_area.items():
+            if node_name not in nodes_by_name:
+                continue
+            distances, paths = intra[area]
+            node_distances = distances[node_name]
+            routing_table = dict(paths[node_name])
+            for remote in to_area:
+                if remote == area:
+                    continue
+                best = None
+                for border, (cost, neighbor) in best_exits[area, remote]:
+                    cost += node_distances[border]
+                    if best is None or cost < best[0]:
+                        best = (cost, border, neighbor)
+                if best is not None:
+                    routing_table[area_key(remote)] = paths[node_name][best[1]] + [best[2]]
+            node = nodes_by_name[node_name]
+            routing_tables[node_name] = {
+                'ip': node.ip_address,
+                'port': node.port,
+                'node_id': node.node_id,
+                'area': area,
+                'routing_table': routing_table,
+                'links': {neighbor: data['bandwidth'] for neighbor, data in graph[node_name].items()}
+            }
+        return routing_tables
+
+
+def area_members(routing_tables):
+    """
+    Get the ports in every area of a set of hierarchical routing tables.
+
+    Parameters:
+    routing_tables (dict): The routing tables as stored in HSF.json.
+
+    Returns:
+    dict or None: The ports in every area, or None if the tables are flat.
+    """
+    members = {}
+    for node_data in routing_tables.values():
+        if 'area' not in node_data:
+            return None
+        members.setdefault(node_data['area'], []).append(node_data['port'])
+    return members
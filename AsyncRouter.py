@@ -0,0 +1,497 @@
+import asyncio
+import sys
+import time
+from Compression import SUPPORTED_CODECS, make_codec
+from ConnectionPool import ConnectionPool
+from Fib import ForwardingTable
+from Metrics import REGISTRY, MetricsServer
+from Packet import CLASS_OFFSET, MAGIC, TTL_OFFSET, destination_of, packet_size
+from Profiling import PROFILER, is_control, span
+from Shaping import DEFAULT_SCALE
+from Protocol import read_frame
+from StreamBuffer import StreamBuffer
+from TableCache import CACHE_DIRECTORY, TableCache
+from Visualization import VisualizationWorker
+
+EXPIRED = REGISTRY.counter('router_packets_expired_total', 'Packets dropped because their TTL ran out.', ('router',))
+
+
+class TCPClient:
+    """
+    The controller session of a router, run as a task on the router's event loop.
+    """
+
+    def __init__(self, server_host, server_port, client_ip, client_port, node_id, codecs=None,
+                 heartbeat_interval=1.0, max_reconnect_delay=30.0, controllers=None, batch_size=64, flush_deadline=0.0,
+                 link_scale=DEFAULT_SCALE, shaper=None, pool=None, cache=None):
+        """
+        Initialize the session.
+
+        Parameters:
+        server_host (str): The host address of the controller.
+        server_port (int): The port of the controller.
+        client_ip (str): The IP address the router is registered with.
+        client_port (int): The port of the router.
+        node_id (int): The ID of the router.
+        codecs (list): The codecs offered to the controller. Default is every supported codec.
+        heartbeat_interval (float): Seconds between heartbeats. Default is 1.0.
+        max_reconnect_delay (float): The longest wait between reconnect attempts. Default is 30.0.
+        controllers (list): (host, port) of every controller replica. Default is the one controller.
+        batch_size (int): Messages per neighbor that trigger a write. Default is 64.
+        flush_deadline (float): The longest a forwarded message waits to be written, in seconds. Default is 0.0.
+        link_scale (float): Bytes per second emulated per unit of link bandwidth; None disables shaping. Default is 1000.
+        shaper (LinkShaper): The timer waking throttled links, shared by routers on one loop. Default is a new one.
+        pool (ConnectionPool): The connections to the neighbors. Default is a new pool.
+        cache (TableCache): Keeps the last table on disk for a warm restart. Default is None, which keeps none.
+        """
+        self.server_host = server_host
+        self.server_port = server_port
+        self.client_ip = client_ip
+        self.client_port = client_port
+        self.node_id = node_id
+        self.codecs = SUPPORTED_CODECS if codecs is None else codecs
+        self.codec = None
+        self.heartbeat_interval = heartbeat_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        # Controller replicas to fail over between; routers spread across them by node ID
+        self.controllers = controllers or [(server_host, server_port)]
+        self.controller_index = node_id % len(self.controllers)
+        self.link_scale = link_scale
+        # The current table; only ever replaced as a whole, never modified
+        self.fib = ForwardingTable({}, client_port)
+        # Set once the first routing table is installed
+        self.ready = asyncio.Event()
+        # Persistent connections to the neighbors, shared with the server
+        self.pool = pool or ConnectionPool(client_port, shaper=shaper, batch_size=batch_size,
+                                           flush_deadline=flush_deadline)
+        self.cache = cache
+
+    async def connect_to_controller(self):
+        """
+        Connects to the controller and installs every routing table it sends.
+        Reconnects with exponential backoff whenever the session is lost, moving on
+        to the next controller replica each time.
+        """
+        # Forward with the table from before a restart until the controller sends the current one
+        self.load_cached_table()
+        reconnect_delay = 1.0
+        while True:
+            self.server_host, self.server_port = self.controllers[self.controller_index]
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.server_host, self.server_port)
+                print(f"Connected to controller at {self.server_host}:{self.server_port}")
+                await self.negotiate_codec(reader, writer)
+                reconnect_delay = 1.0
+
+                sender = asyncio.get_running_loop().create_task(self.send_messages(writer))
+                try:
+                    while True:
+                        # Receive the routing table from the controller
+                        frame = await read_frame(reader)
+                        if frame is None:
+                            break
+                        self.install_table(self.codec.decompress(frame).decode())
+                finally:
+                    sender.cancel()
+
+            except Exception as e:
+                print(f"Error connecting to controller: {e}")
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            self.controller_index = (self.controller_index + 1) % len(self.controllers)
+            print(f"Reconnecting to controller in {reconnect_delay:.0f}s")
+            await asyncio.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
+
+    async def negotiate_codec(self, reader, writer):
+        """
+        Offers the supported codecs to the controller and applies the one it picks.
+
+        Parameters:
+        reader (asyncio.StreamReader): The session stream reader.
+        writer (asyncio.StreamWriter): The session stream writer.
+        """
+        writer.write(f"hello-{','.join(self.codecs)}\n".encode())
+        reply = (await read_frame(reader)).decode()
+        codec_name = reply.split("-", 1)[1]
+        dictionary = await read_frame(reader) if codec_name == 'zdict' else b''
+        self.codec = make_codec(codec_name, dictionary)
+        print(f"Negotiated codec {self.codec.name} with controller")
+
+    def install_table(self, data):
+        """
+        Parses a routing table payload and swaps in its forwarding table.
+
+        Parameters:
+        data (str): The decompressed payload.
+        """
+        current = self.fib
+        # The periodic request returns the same table until the topology changes, and a
+        # warm-started router usually gets the table it cached
+        if data != current.payload:
+            with span('router.read_table'):
+                fib = ForwardingTable.from_payload(data, self.client_port, current.version + 1)
+            self.use_table(fib)
+            if self.cache is not None:
+                self.cache.store_later(data, fib.version)
+            print(f"Installed routing table version {fib.version} with {len(fib.routing_table)} route(s)")
+        self.ready.set()
+
+    def load_cached_table(self):
+        """
+        Forwards with the cached table, if there is one and no table has been installed yet.
+
+        Returns:
+        bool: True if the cached table was installed.
+        """
+        if self.cache is None or self.fib.payload is not None:
+            return False
+        cached = self.cache.load()
+        if cached is None:
+            return False
+        data, version = cached
+        self.use_table(ForwardingTable.from_payload(data, self.client_port, version))
+        print(f"Forwarding with cached routing table version {version} until the controller answers")
+        return True
+
+    def use_table(self, fib):
+        """
+        Swaps in a forwarding table and prepares the links it uses.
+
+        Parameters:
+        fib (ForwardingTable): The new table.
+        """
+        # One reference swap publishes the new version; a packet being forwarded keeps the one it looked up
+        self.fib = fib
+        if self.link_scale is not None:
+            self.pool.shape({port: bandwidth * self.link_scale for port, bandwidth in fib.links.items()})
+        self.pool.warm(fib.next_hops)
+
+    def telemetry_message(self, interval):
+        """
+        Build the telemetry report of the load on every neighbor link.
+
+        The report is one line, telemetry-<node ID>-<interval ms>- followed by
+        <port>:<bytes>:<messages>:<queued bytes> for every link, comma separated.
+
+        Parameters:
+        interval (float): Seconds since the last report.
+
+        Returns:
+        bytes or None: The report, or None if the router has no neighbor links yet.
+        """
+        links = self.pool.telemetry()
+        if not links:
+            return None
+        counters = ",".join(f"{port}:{sent}:{messages}:{queued}" for port, sent, messages, queued in links)
+        return f"telemetry-{self.node_id}-{int(interval * 1000)}-{counters}\n".encode()
+
+    async def send_messages(self, writer):
+        """
+        Sends heartbeats, link telemetry and requests for the routing table until the session closes.
+
+        Parameters:
+        writer (asyncio.StreamWriter): The session stream writer.
+        """
+        next_request = 0
+        # Load from before this session is not reported
+        self.pool.telemetry()
+        last_report = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() >= next_request:
+                    # Send a request to the controller for the routing table
+                    writer.write(f"data-{self.client_ip}-{self.client_port}-{self.node_id}\n".encode())
+                    next_request = time.monotonic() + 5  # Wait 5 seconds before sending the next request
+                now = time.monotonic()
+                report = self.telemetry_message(now - last_report)
+                last_report = now
+                if report is not None:
+                    writer.write(report)
+                writer.write(f"heartbeat-{self.node_id}\n".encode())
+                await writer.drain()
+                await asyncio.sleep(self.heartbeat_interval)
+        except OSError as e:
+            print(f"Stopped sending to controller: {e}")
+
+
+class RouterProtocol(asyncio.BufferedProtocol):
+    """
+    One host or neighbor connection of a router's data plane.
+
+    The event loop receives straight into the connection's StreamBuffer with
+    recv_into(). Only the fixed header of each packet is read, in place, and
+    the packet is forwarded as a memoryview of the buffer, so its bytes are
+    never copied on the way through. Text lines on the same connection are
+    the neighbor hello and profiling control messages.
+    """
+
+    def __init__(self, server, buffer_size=16384):
+        """
+        Initialize the connection.
+
+        Parameters:
+        server (TCPServer): The router's data plane.
+        buffer_size (int): The initial size of the receive buffer; it grows for larger packets. Default is 16384.
+        """
+        self.server = server
+        self.stream = StreamBuffer(buffer_size)
+        self.neighbor = False
+        self.paused = False
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        print(f"Connection established with {transport.get_extra_info('peername')}")
+        self.server.connected(self)
+
+    def connection_lost(self, exc):
+        self.server.disconnected(self)
+
+    def get_buffer(self, sizehint):
+        return self.stream.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        stream = self.stream
+        stream.buffer_updated(nbytes)
+        buffer = stream.buffer
+        start, end = stream.start, stream.end
+        while start < end:
+            if buffer[start] == MAGIC:
+                size = packet_size(buffer, start, end)
+                if size is None or end - start < size:
+                    break
+                self.server.handle_packet(self, start, size)
+                start += size
+            else:
+                newline = buffer.find(b"\n", start, end)
+                if newline < 0:
+                    if NEIGHBOR_HELLO.startswith(bytes(buffer[start:end])):
+                        break
+                    # Control messages are sent on their own, without a newline
+                    newline = end - 1
+                self.server.handle_line(self, bytes(buffer[start:newline + 1]).decode(errors='replace').strip())
+                start = newline + 1
+        # Packets forwarded as views are written or copied before the next read
+        stream.consume(start - stream.start)
+
+    def wait_for(self, connection):
+        """
+        Stop reading until a congested neighbor connection drains.
+
+        Parameters:
+        connection (NeighborConnection): The congested connection.
+        """
+        if not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+            connection.on_drained(self.resume)
+
+    def resume(self):
+        """
+        Start reading again.
+        """
+        if self.paused:
+            self.paused = False
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+
+# The first line of every neighbor connection
+NEIGHBOR_HELLO = b"neighbor-"
+
+
+class TCPServer:
+    """
+    The data plane of a router: accepts hosts and neighbors and forwards their
+    messages, all on one event loop. Neighbors open their connection with a
+    `neighbor-<port>` line; the newest connection that has not sent one is
+    the host, and packets for this router are delivered to it.
+    """
+
+    def __init__(self, host, port, tcp_client, backlog=1024, visualizer=None):
+        """
+        Initialize the server.
+
+        Parameters:
+        host (str): The host address to listen on.
+        port (int): The port to listen on.
+        tcp_client (TCPClient): The controller session holding the forwarding table.
+        backlog (int): The listen backlog. Default is 1024.
+        visualizer (VisualizationWorker): The worker rendering delivered paths. Default is a new worker.
+        """
+        self.host = host
+        self.port = port
+        self.tcp_client = tcp_client
+        self.backlog = backlog
+        self.visualizer = visualizer or VisualizationWorker()
+        self.server = None
+        # Connections that have not identified as neighbors, newest last; the newest is the host
+        self.host_protocols = []
+        self.host_protocol = None
+
+    async def listen(self):
+        """
+        Starts accepting connections.
+        """
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: RouterProtocol(self), self.host, self.port, backlog=self.backlog)
+        print(f"Server listening on {self.host}:{self.port}...")
+
+    async def start(self):
+        """
+        Starts the server and serves connections until cancelled.
+        """
+        if self.server is None:
+            await self.listen()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def connected(self, protocol):
+        """
+        Make a new connection the host until it identifies as a neighbor.
+
+        Parameters:
+        protocol (RouterProtocol): The new connection.
+        """
+        self.host_protocols.append(protocol)
+        self.host_protocol = protocol
+
+    def disconnected(self, protocol):
+        """
+        Forget a closed connection.
+
+        Parameters:
+        protocol (RouterProtocol): The closed connection.
+        """
+        self.forget_host(protocol)
+
+    def forget_host(self, protocol):
+        """
+        Stop treating a connection as the host; the newest remaining one takes over.
+
+        Parameters:
+        protocol (RouterProtocol): The connection.
+        """
+        if protocol in self.host_protocols:
+            self.host_protocols.remove(protocol)
+            self.host_protocol = self.host_protocols[-1] if self.host_protocols else None
+
+    def handle_line(self, protocol, line):
+        """
+        Handles a text line: the neighbor hello or a profiling control message.
+
+        Parameters:
+        protocol (RouterProtocol): The connection the line arrived on.
+        line (str): The line, without its newline.
+        """
+        data_split = line.split("-")
+        if line.startswith(NEIGHBOR_HELLO.decode()):
+            protocol.neighbor = True
+            self.forget_host(protocol)
+        elif is_control(data_split):
+            protocol.transport.write(PROFILER.handle_control(line).encode())
+        else:
+            print(f"Ignoring unknown message: {line}")
+
+    def handle_packet(self, protocol, start, size):
+        """
+        Forwards one packet toward its destination, or delivers it to the host.
+
+        Parameters:
+        protocol (RouterProtocol): The connection the packet arrived on.
+        start (int): The offset of the packet in the connection's buffer.
+        size (int): The size of the packet.
+        """
+        buffer = protocol.stream.buffer
+        with span('router.next_hop'):
+            destination = destination_of(buffer, start)
+            route = self.tcp_client.fib.lookup(destination)
+        if route is None:
+            print(f"No route to port {destination}")
+            return
+        indicator, next_hop = route
+        packet = protocol.stream.view[start:start + size]
+        if next_hop is not None:
+            # Transient loops while tables change cannot circulate packets for long
+            ttl = buffer[start + TTL_OFFSET]
+            if ttl <= 1:
+                EXPIRED.labels(self.tcp_client.client_port).inc()
+                print(f"Dropped packet to port {destination}: TTL expired")
+                return
+            buffer[start + TTL_OFFSET] = ttl - 1
+            with span('router.forward'):
+                self.forward_data(next_hop, packet, protocol, buffer[start + CLASS_OFFSET])
+        else:
+            # If next_hop is None, it means the data has reached its destination node
+            print(f"Send message to host.")
+            with span('router.send_to_host'):
+                self.send_to_host(bytes(packet))
+            # Rendering happens in the worker, after the host has the packet
+            with span('router.visualize'):
+                self.visualizer.submit(indicator)
+
+    def forward_data(self, next_hop, packet, protocol, traffic_class):
+        """
+        Forwards a packet to the next hop without copying it.
+
+        Parameters:
+        next_hop (int): The next hop port.
+        packet (memoryview): The packet, as received.
+        protocol (RouterProtocol): The connection the packet arrived on.
+        traffic_class (int): The QoS traffic class of the packet.
+        """
+        pool = self.tcp_client.pool
+        if not pool.send(next_hop, packet, traffic_class=traffic_class):
+            print(f"Dropped data for unreachable next hop {next_hop}")
+            return
+        connection = pool.get(next_hop)
+        if connection.congested():
+            protocol.wait_for(connection)
+
+    def send_to_host(self, data):
+        """
+        Sends data to the connected host.
+
+        Parameters:
+        data (bytes): The packet to be sent.
+        """
+        if self.host_protocol is None or self.host_protocol.transport.is_closing():
+            print(f"No host connected for data: {data}")
+            return
+        self.host_protocol.transport.write(data)
+
+
+async def run_router(controller_host, controller_port, client_ip, client_port, node_id, controllers=None,
+                     cache_directory=CACHE_DIRECTORY, metrics_port=None):
+    """
+    Run a router's controller session and data plane on the current event loop.
+
+    Parameters:
+    controller_host (str): The host address of the controller.
+    controller_port (int): The port of the controller.
+    client_ip (str): The IP address the router is registered with.
+    client_port (int): The port of the router.
+    node_id (int): The ID of the router.
+    controllers (list): (host, port) of every controller replica. Default is the one controller.
+    cache_directory (str): The directory of the table cache; None disables it. Default is ~/.cache/nsfnet.
+    metrics_port (int): The port serving the router's metrics. Default is None, which serves none.
+    """
+    if metrics_port is not None:
+        MetricsServer(REGISTRY, 'localhost', metrics_port).start()
+    cache = TableCache(node_id, client_port, cache_directory) if cache_directory is not None else None
+    client = TCPClient(controller_host, controller_port, client_ip, client_port, node_id, controllers=controllers,
+                       cache=cache)
+    server = TCPServer("localhost", client_port, client)
+    await asyncio.gather(client.connect_to_controller(), server.start())
+
+
+# Example usage
+if __name__ == "__main__":
+    # python AsyncRouter.py <ip> <port> <node_id> [controller_port] [metrics_port]
+    ip, port, node = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    asyncio.run(run_router("localhost", int(sys.argv[4]) if len(sys.argv) > 4 else 8888, ip, port, node,
+                           metrics_port=int(sys.argv[5]) if len(sys.argv) > 5 else None))
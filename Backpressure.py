@@ -0,0 +1,228 @@
+import collections
+import selectors
+import socket
+import threading
+import time
+
+
+class SendBuffer:
+    """
+    A size-limited queue of outgoing messages for one session.
+    """
+
+    def __init__(self, sock, limit):
+        """
+        Initialize the buffer.
+
+        Parameters:
+        sock (socket.socket): The session socket.
+        limit (int): The most bytes that may wait to be sent.
+        """
+        self.sock = sock
+        self.limit = limit
+        self.messages = collections.deque()
+        self.size = 0
+        self.offset = 0
+        self.stalled_since = None
+        self.closed = False
+        self.released = False
+        self.lock = threading.Lock()
+
+    def push(self, data, replaceable=False):
+        """
+        Queue a message. Must be called with the lock held.
+
+        Parameters:
+        data (bytes): The message.
+        replaceable (bool): Whether a newer replaceable message supersedes this one. Default is False.
+
+        Returns:
+        bool: False if the message does not fit in the buffer.
+        """
+        if replaceable:
+            # Only the newest routing table matters; drop older ones not yet started
+            kept = collections.deque()
+            for index, (message, message_replaceable) in enumerate(self.messages):
+                if message_replaceable and not (index == 0 and self.offset):
+                    self.size -= len(message)
+                else:
+                    kept.append((message, message_replaceable))
+            self.messages = kept
+        if self.size + len(data) > self.limit:
+            return False
+        self.messages.append((data, replaceable))
+        self.size += len(data)
+        if self.stalled_since is None:
+            self.stalled_since = time.monotonic()
+        return True
+
+    def flush(self):
+        """
+        Send as much as the socket accepts without blocking. Must be called with the lock held.
+
+        Returns:
+        bool: True if the buffer is empty afterwards.
+        """
+        while self.messages:
+            message = self.messages[0][0]
+            try:
+                sent = self.sock.send(memoryview(message)[self.offset:], socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.stalled_since = time.monotonic()
+            self.offset += sent
+            if self.offset == len(message):
+                self.messages.popleft()
+                self.size -= len(message)
+                self.offset = 0
+        self.stalled_since = None
+        return True
+
+
+class SessionWriter:
+    """
+    Flush the send buffers of every session from a single thread.
+
+    Messages are sent inline when the socket accepts them; whatever is left is
+    flushed when the socket becomes writable. A session whose buffer overflows
+    or makes no progress for `write_timeout` seconds is disconnected, so one
+    slow consumer never holds a thread or unbounded memory.
+    """
+
+    def __init__(self, write_timeout=5.0):
+        """
+        Initialize the writer.
+
+        Parameters:
+        write_timeout (float): Seconds a buffer may wait without progress. Default is 5.0.
+        """
+        self.write_timeout = write_timeout
+        self.selector = selectors.DefaultSelector()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.thread = None
+
+    def start(self):
+        """
+        Start the writer thread.
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, buffer, data, replaceable=False):
+        """
+        Queue a message on a session and send what the socket accepts right away.
+
+        Parameters:
+        buffer (SendBuffer): The session buffer.
+        data (bytes): The message.
+        replaceable (bool): Whether a newer replaceable message supersedes this one. Default is False.
+
+        Returns:
+        bool: False if the session was disconnected as a slow consumer.
+        """
+        with buffer.lock:
+            if buffer.closed:
+                return False
+            if not buffer.push(data, replaceable):
+                overflow = True
+            else:
+                overflow = False
+                try:
+                    if buffer.flush():
+                        return True
+                except OSError:
+                    overflow = True
+        if overflow:
+            self.disconnect(buffer, "send buffer full")
+            return False
+        # Let the writer thread finish the message
+        with self.lock:
+            self.pending.add(buffer)
+        self.wake_writer.send(b'\0')
+        return True
+
+    def disconnect(self, buffer, reason):
+        """
+        Disconnect a slow session. Its reader sees the connection close and cleans up.
+
+        Parameters:
+        buffer (SendBuffer): The session buffer.
+        reason (str): Why the session is disconnected.
+        """
+        with buffer.lock:
+            if buffer.closed:
+                return
+            buffer.closed = True
+        print(f"Disconnecting slow consumer: {reason}")
+        try:
+            buffer.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def release(self, buffer):
+        """
+        Hand a finished session to the writer thread, which closes its socket.
+
+        Parameters:
+        buffer (SendBuffer): The session buffer.
+        """
+        with buffer.lock:
+            buffer.closed = True
+            buffer.released = True
+        with self.lock:
+            self.pending.add(buffer)
+        self.wake_writer.send(b'\0')
+
+    def run(self):
+        """
+        Flush buffers as their sockets become writable and drop stalled sessions.
+        """
+        registered = set()
+        while True:
+            for key, _ in self.selector.select(timeout=min(1.0, self.write_timeout / 2)):
+                if key.fileobj is self.wake_reader:
+                    try:
+                        while self.wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                buffer = key.data
+                with buffer.lock:
+                    try:
+                        done = buffer.closed or buffer.flush()
+                    except OSError:
+                        done = True
+                if done:
+                    self.selector.unregister(buffer.sock)
+                    registered.discard(buffer)
+            with self.lock:
+                pending, self.pending = self.pending, set()
+            for buffer in pending:
+                if buffer.released:
+                    # Unregister before closing so the descriptor cannot be reused while registered
+                    if buffer in registered:
+                        self.selector.unregister(buffer.sock)
+                        registered.discard(buffer)
+                    buffer.sock.close()
+                elif buffer not in registered and not buffer.closed:
+                    try:
+                        self.selector.register(buffer.sock, selectors.EVENT_WRITE, buffer)
+                        registered.add(buffer)
+                    except (ValueError, OSError):
+                        pass
+            now = time.monotonic()
+            for buffer in list(registered):
+                stalled_since = buffer.stalled_since
+                if buffer.closed or (stalled_since is not None and now - stalled_since > self.write_timeout):
+                    if not buffer.closed:
+                        self.disconnect(buffer, f"no progress for {self.write_timeout}s")
+                    try:
+                        self.selector.unregister(buffer.sock)
+                    except (KeyError, ValueError, OSError):
+                        pass
+                    registered.discard(buffer)
@@ -0,0 +1,521 @@
+import random
+import sys
+import time
+from Controler import Network, build_nsfnet
+from Snapshot import build_table_payload
+from Compression import CODECS, build_dictionary
+
+
+def build_synthetic(node_count, degree=3, seed=1):
+    """
+    Build a random connected topology for scaling experiments.
+
+    Parameters:
+    node_count (int): The number of nodes.
+    degree (int): The number of extra links per node. Default is 3.
+    seed (int): The random seed. Default is 1.
+
+    Returns:
+    Network: The synthetic network.
+    """
+    rng = random.Random(seed)
+    network = Network()
+    for node_id in range(1, node_count + 1):
+        network.add_node(node_id, f'N{node_id}', ip_address='127.0.0.1', port=10000 + node_id)
+    for node_id in range(2, node_count + 1):
+        # A random spanning tree keeps the graph connected
+        network.add_link(node_id, rng.randint(1, node_id - 1), rng.randint(3, 48) * 100)
+    for node_id in range(1, node_count + 1):
+        for _ in range(degree - 1):
+            peer = rng.randint(1, node_count)
+            if peer != node_id:
+                network.add_link(node_id, peer, rng.randint(3, 48) * 100)
+    return network
+
+
+def bench_compression(network, rounds=20):
+    """
+    Report the bytes saved and the CPU spent by each table codec.
+
+    Parameters:
+    network (Network): The network whose routing tables are encoded.
+    rounds (int): How many times each payload is encoded. Default is 20.
+    """
+    routing_tables = network.build_routing_tables(network)
+    dictionary = build_dictionary(routing_tables)
+    payloads = [build_table_payload(routing_tables, name, {"message": "ASK"}) for name in routing_tables]
+    raw_bytes = sum(len(payload) for payload in payloads)
+    print(f"{len(payloads)} tables, {raw_bytes} raw bytes, dictionary {len(dictionary)} bytes")
+    print(f"{'codec':<8}{'bytes':>12}{'saved':>9}{'compress us':>14}{'decompress us':>16}")
+    for name, codec_class in CODECS.items():
+        codec = codec_class(dictionary)
+        start = time.process_time()
+        for _ in range(rounds):
+            encoded = [codec.compress(payload) for payload in payloads]
+        compress_time = (time.process_time() - start) / (rounds * len(payloads))
+        start = time.process_time()
+        for _ in range(rounds):
+            for payload in encoded:
+                codec.decompress(payload)
+        decompress_time = (time.process_time() - start) / (rounds * len(payloads))
+        encoded_bytes = sum(len(payload) for payload in encoded)
+        saved = 1 - encoded_bytes / raw_bytes
+        print(f"{name:<8}{encoded_bytes:>12}{saved:>9.1%}{compress_time * 1e6:>14.1f}{decompress_time * 1e6:>16.1f}")
+
+
+def walk_route(routing_tables, area_of, source, destination, limit=1000):
+    """
+    Follow hop-by-hop routes from a source to a destination.
+
+    Parameters:
+    routing_tables (dict): The routing tables as stored in HSF.json.
+    area_of (dict): The area key of every node name, for hierarchical tables.
+    source (str): The name of the source node.
+    destination (str): The name of the destination node.
+    limit (int): The hop limit that flags a routing loop. Default is 1000.
+
+    Returns:
+    list or None: The nodes visited, or None if the route loops or is missing.
+    """
+    visited = [source]
+    while visited[-1] != destination and len(visited) < limit:
+        table = routing_tables[visited[-1]]['routing_table']
+        path = table.get(destination) or table.get(area_of.get(destination))
+        if path is None:
+            return None
+        visited.append(path[1])
+    return visited if visited[-1] == destination else None
+
+
+def bench_hierarchical(network):
+    """
+    Compare flat and hierarchical routing: build time, table size, path stretch
+    and recompute time after a failure inside one area.
+
+    Parameters:
+    network (Network): The network object.
+    """
+    from Areas import HierarchicalRouting, area_key
+
+    def path_cost(path):
+        return sum(network.graph[u][v]['weight'] for u, v in zip(path, path[1:]))
+
+    start = time.perf_counter()
+    flat = network.build_routing_tables(network)
+    flat_time = time.perf_counter() - start
+    start = time.perf_counter()
+    routing = HierarchicalRouting(network)
+    hierarchical = routing.build_routing_tables(network)
+    hierarchical_time = time.perf_counter() - start
+    area_of = {name: area_key(data['area']) for name, data in hierarchical.items()}
+
+    names = sorted(flat)
+    stretch = []
+    failures = 0
+    for source in names:
+        for destination in names[::max(1, len(names) // 50)]:
+            route = walk_route(hierarchical, area_of, source, destination)
+            if route is None:
+                failures += 1
+            elif source != destination:
+                stretch.append(path_cost(route) / path_cost(flat[source]['routing_table'][destination]))
+    entries = lambda tables: sum(len(data['routing_table']) for data in tables.values()) / len(tables)
+    print(f"{len(names)} nodes, {len(set(area_of.values()))} areas")
+    print(f"flat:         build {flat_time * 1e3:8.1f} ms, {entries(flat):8.1f} entries per router")
+    print(f"hierarchical: build {hierarchical_time * 1e3:8.1f} ms, {entries(hierarchical):8.1f} entries per router")
+    print(f"hierarchical routes: {failures} undeliverable, mean stretch {sum(stretch) / len(stretch):.3f}, max {max(stretch):.3f}")
+
+    # Fail a node inside one area and rebuild
+    victim = names[len(names) // 2]
+    network.remove_node(hierarchical[victim]['node_id'])
+    start = time.perf_counter()
+    network.build_routing_tables(network)
+    flat_time = time.perf_counter() - start
+    start = time.perf_counter()
+    routing.build_routing_tables(network)
+    hierarchical_time = time.perf_counter() - start
+    print(f"after failure of {victim}: flat {flat_time * 1e3:.1f} ms, "
+          f"hierarchical {hierarchical_time * 1e3:.1f} ms recomputing {len(routing.recomputed_areas)} area(s)")
+
+
+def bench_batching(messages=200000, settings=((1, 0.0), (16, 0.0), (64, 0.0), (64, 0.0005), (256, 0.002)),
+                   producers=8):
+    """
+    Report neighbor link throughput and latency percentiles at different
+    write batching settings.
+
+    Parameters:
+    messages (int): The number of messages sent per setting. Default is 200000.
+    settings (tuple): (batch_size, flush_deadline) pairs to compare.
+    producers (int): Concurrent tasks forwarding traffic onto the link. Default is 8.
+    """
+    import asyncio
+    from ConnectionPool import NeighborConnection
+
+    async def run(batch_size, flush_deadline):
+        loop = asyncio.get_running_loop()
+        latencies = []
+        done = loop.create_future()
+
+        async def sink(reader, writer):
+            pending = b''
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                now = time.perf_counter()
+                pending += data
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    if not line.startswith(b"neighbor-"):
+                        latencies.append(now - float(line))
+                if len(latencies) >= messages:
+                    done.set_result(None)
+                    break
+
+        server = await asyncio.start_server(sink, 'localhost', 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = NeighborConnection('localhost', port, 0, batch_size=batch_size, flush_deadline=flush_deadline)
+        sendmsg_calls = 0
+        original_flush = connection.flush
+
+        def counted_flush():
+            nonlocal sendmsg_calls
+            sendmsg_calls += 1
+            original_flush()
+
+        connection.flush = counted_flush
+
+        async def producer(count):
+            # Forward in bursts, as a handler does with the messages of one read
+            for index in range(count):
+                connection.send(f"{time.perf_counter()!r}\n".encode())
+                await connection.drain()
+                if index % 8 == 7:
+                    await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(producer(messages // producers) for _ in range(producers)))
+        await done
+        elapsed = time.perf_counter() - start
+        connection.close()
+        server.close()
+        latencies.sort()
+        percentile = lambda fraction: latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1e6
+        print(f"{batch_size:>6}{flush_deadline * 1e3:>10.2f}{len(latencies) / elapsed:>12.0f}{sendmsg_calls:>10}"
+              f"{percentile(0.5):>10.0f}{percentile(0.99):>10.0f}{percentile(0.999):>10.0f}")
+
+    print(f"{'batch':>6}{'deadline':>10}{'msg/s':>12}{'flushes':>10}{'p50 us':>10}{'p99 us':>10}{'p99.9 us':>10}")
+    for batch_size, flush_deadline in settings:
+        asyncio.run(run(batch_size, flush_deadline))
+
+
+async def receive_packets(reader, on_packet, link_rate=None):
+    """
+    Read the packets of a neighbor link until it closes.
+
+    Parameters:
+    reader (asyncio.StreamReader): The stream of the link.
+    on_packet (callable): Called with the buffer, the offset of a packet and the time it arrived.
+    link_rate (float): Bytes per second to read at, emulating a slower link. Default is no limit.
+
+    Returns:
+    int: The bytes received.
+    """
+    import asyncio
+    from Packet import MAGIC, packet_size
+
+    received = 0
+    buffer = bytearray()
+    while True:
+        data = await reader.read(1 << 14)
+        if not data:
+            return received
+        now = time.perf_counter()
+        received += len(data)
+        buffer += data
+        start = 0
+        while True:
+            if start < len(buffer) and buffer[start] != MAGIC:
+                # The neighbor hello
+                start = buffer.index(b"\n", start) + 1
+                continue
+            size = packet_size(buffer, start, len(buffer))
+            if size is None or len(buffer) - start < size:
+                break
+            on_packet(buffer, start, now)
+            start += size
+        del buffer[:start]
+        if link_rate:
+            await asyncio.sleep(len(data) / link_rate)
+
+
+def bench_qos(duration=2.0, link_rate=20e6, loads=None):
+    """
+    Report per-class latency percentiles and link throughput under mixed load,
+    with every class in one FIFO queue and with QoS scheduling.
+
+    A bulk sender keeps the link saturated while the other classes send at a
+    steady rate. The receiver reads at `link_rate` bytes per second with a small
+    receive buffer, so the backlog builds up in the sender's egress queues.
+
+    Parameters:
+    duration (float): Seconds of traffic per mode. Default is 2.0.
+    link_rate (float): The emulated link rate in bytes per second. Default is 20 MB/s.
+    loads (dict): (payload size, interval in seconds) for every class; an interval of 0 sends as fast
+    as the link drains. Default is bulk, best effort, interactive and control traffic.
+    """
+    import asyncio
+    import socket
+    import struct
+    from ConnectionPool import NeighborConnection
+    from Packet import CLASS_OFFSET, HEADER_SIZE, encode_packet
+    from QoS import BEST_EFFORT, BULK, CLASS_NAMES, CONTROL, INTERACTIVE, DeficitRoundRobin
+
+    loads = loads or {BULK: (1024, 0.0), BEST_EFFORT: (256, 0.0005), INTERACTIVE: (64, 0.001), CONTROL: (64, 0.01)}
+    timestamp = struct.Struct('!d')
+
+    async def run(mode):
+        loop = asyncio.get_running_loop()
+        latencies = {traffic_class: [] for traffic_class in loads}
+        received = 0
+
+        def on_packet(buffer, start, now):
+            (sent,) = timestamp.unpack_from(buffer, start + HEADER_SIZE)
+            latencies[buffer[start + CLASS_OFFSET]].append(now - sent)
+
+        async def sink(reader, writer):
+            nonlocal received
+            received = await receive_packets(reader, on_packet, link_rate)
+
+        # A small receive buffer keeps the backlog on the sending side
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+        listener.bind(('localhost', 0))
+        server = await asyncio.start_server(sink, sock=listener)
+        port = listener.getsockname()[1]
+        scheduler = DeficitRoundRobin() if mode == 'qos' else DeficitRoundRobin({BEST_EFFORT: 1}, strict_classes=())
+        connection = NeighborConnection('localhost', port, 0, scheduler=scheduler)
+        stop = loop.time() + duration
+
+        async def producer(traffic_class, payload_size, interval):
+            padding = b"x" * (payload_size - timestamp.size)
+            queue_class = traffic_class if mode == 'qos' else BEST_EFFORT
+            while loop.time() < stop:
+                payload = timestamp.pack(time.perf_counter()) + padding
+                connection.send(encode_packet(1, 0, payload, traffic_class=traffic_class), traffic_class=queue_class)
+                if interval:
+                    await asyncio.sleep(interval)
+                else:
+                    await connection.drain()
+                    await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(producer(traffic_class, *load) for traffic_class, load in loads.items()))
+        elapsed = time.perf_counter() - start
+        connection.close()
+        # Let the receiver see the end of the stream
+        await asyncio.sleep(0.05)
+        server.close()
+        for traffic_class, samples in latencies.items():
+            samples.sort()
+            percentile = lambda fraction: samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1e3 if samples else 0.0
+            print(f"{mode:>6}{CLASS_NAMES[traffic_class]:>13}{len(samples):>10}{received / elapsed / 1e6:>10.1f}"
+                  f"{percentile(0.5):>10.2f}{percentile(0.99):>10.2f}{percentile(0.999):>10.2f}")
+
+    print(f"{'mode':>6}{'class':>13}{'packets':>10}{'MB/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}")
+    for mode in ('fifo', 'qos'):
+        asyncio.run(run(mode))
+
+
+def bench_shaping(link_rate=2e6, loads=(0.5, 0.8, 0.95, 1.1), duration=2.0, payload_size=1024, seed=1):
+    """
+    Report the throughput and queueing delay of a shaped link at different
+    offered loads.
+
+    Packets arrive as a Poisson process at a fraction of the link rate. The
+    link is shaped by a token bucket at `link_rate`, so delay grows with load
+    as on a real link and the queue builds without bound past saturation.
+
+    Parameters:
+    link_rate (float): The shaped link rate in bytes per second. Default is 2 MB/s.
+    loads (tuple): Offered loads as fractions of the link rate.
+    duration (float): Seconds of traffic per load. Default is 2.0.
+    payload_size (int): The payload size of every packet. Default is 1024.
+    seed (int): The random seed of the arrivals. Default is 1.
+    """
+    import asyncio
+    import struct
+    from ConnectionPool import NeighborConnection
+    from Packet import HEADER_SIZE, encode_packet
+    from Shaping import LinkShaper, TokenBucket
+
+    timestamp = struct.Struct('!d')
+    padding = b"x" * (payload_size - timestamp.size)
+
+    async def run(load):
+        rng = random.Random(seed)
+        latencies = []
+        received = 0
+
+        def on_packet(buffer, start, now):
+            (sent,) = timestamp.unpack_from(buffer, start + HEADER_SIZE)
+            latencies.append(now - sent)
+
+        async def sink(reader, writer):
+            nonlocal received
+            received = await receive_packets(reader, on_packet)
+
+        server = await asyncio.start_server(sink, 'localhost', 0)
+        port = server.sockets[0].getsockname()[1]
+        # Queue the whole run rather than push back on the sender
+        connection = NeighborConnection('localhost', port, 0, high_water=1 << 30)
+        shaper = LinkShaper()
+        connection.shape(TokenBucket(link_rate), shaper)
+        packet_rate = load * link_rate / (HEADER_SIZE + payload_size)
+        start = time.perf_counter()
+        arrival = start
+        sent = 0
+        while arrival - start < duration:
+            now = time.perf_counter()
+            # Send every packet that has arrived by now
+            while arrival <= now:
+                connection.send(encode_packet(1, 0, timestamp.pack(arrival) + padding))
+                sent += 1
+                arrival += rng.expovariate(packet_rate)
+            await asyncio.sleep(arrival - now)
+        sent_time = time.perf_counter() - start
+        connection.flush()
+        # Give the queue up to one more run to drain
+        deadline = time.perf_counter() + duration
+        while (connection.queue or connection.scheduler) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        shaper.close()
+        connection.close()
+        await asyncio.sleep(0.05)
+        server.close()
+        latencies.sort()
+        percentile = lambda fraction: latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1e3
+        print(f"{load:>6.2f}{sent * (HEADER_SIZE + payload_size) / sent_time / 1e6:>14.2f}"
+              f"{received / elapsed / 1e6:>12.2f}{percentile(0.5):>10.2f}{percentile(0.99):>10.2f}{percentile(1.0):>10.2f}")
+
+    print(f"link rate {link_rate / 1e6:.2f} MB/s")
+    print(f"{'load':>6}{'offered MB/s':>14}{'link MB/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for load in loads:
+        asyncio.run(run(load))
+
+
+def bench_startup(build_network, worker_counts=(1, 4), controller_port=18888):
+    """
+    Report the time from launch until every router of a topology holds a table.
+
+    Parameters:
+    build_network (callable): Builds the Network to launch; it must be picklable.
+    worker_counts (tuple): The router worker process counts to compare. Default is (1, 4).
+    controller_port (int): The port of the controller. Default is 18888.
+    """
+    import os
+    import tempfile
+    from Launcher import Launcher
+
+    topology_file = os.path.join(tempfile.mkdtemp(), 'topology.json')
+    results = []
+    for workers in worker_counts:
+        launcher = Launcher(build_network, controller_port, topology_file, workers)
+        try:
+            results.append((workers, launcher.start()))
+        finally:
+            launcher.stop()
+    print(f"{'workers':>8}{'ready s':>10}")
+    for workers, ready in results:
+        print(f"{workers:>8}{ready:>10.2f}")
+
+
+def bench_simulation(network, flow_count=100, load=0.2e6, duration=60.0, seed=1):
+    """
+    Report how much faster than real time the discrete-event simulator runs a
+    random traffic matrix, and what the traffic saw.
+
+    Parameters:
+    network (Network): The network to simulate.
+    flow_count (int): The number of flows between random pairs of nodes. Default is 100.
+    load (float): The rate of every flow in bytes per second. Default is 0.2 MB/s.
+    duration (float): The simulated seconds. Default is 60.
+    seed (int): The random seed. Default is 1.
+    """
+    from Simulator import Simulator
+
+    rng = random.Random(seed)
+    names = sorted(node.name for node in network.nodes.values())
+    traffic = {}
+    while len(traffic) < min(flow_count, len(names) * (len(names) - 1)):
+        source, destination = rng.sample(names, 2)
+        traffic[(source, destination)] = load
+    start = time.perf_counter()
+    simulator = Simulator(network)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    flows = simulator.run(traffic, duration, seed=seed)
+    elapsed = time.perf_counter() - start
+    sent = sum(flow.sent for flow in flows)
+    delivered = sum(flow.delivered for flow in flows)
+    latencies = sorted(latency for flow in flows for latency in flow.latencies)
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e3 if latencies else 0.0
+    print(f"{len(network.nodes)} nodes, {len(traffic)} flows: {sent} packets, {delivered / max(sent, 1):.1%} delivered, "
+          f"p99 {p99:.1f} ms")
+    hops = sum(link.packets_sent for link in simulator.links.values())
+    print(f"setup {setup:.2f}s, simulated {duration:.0f}s in {elapsed:.2f}s ({duration / elapsed:.0f}x real time, "
+          f"{(sent + hops) / elapsed:.0f} events/s)")
+
+
+def run_compression():
+    bench_compression(build_nsfnet())
+    bench_compression(build_synthetic(300))
+
+
+def run_hierarchical():
+    bench_hierarchical(build_nsfnet())
+    bench_hierarchical(build_synthetic(1000))
+
+
+def run_batching():
+    bench_batching()
+
+
+def run_qos():
+    bench_qos()
+
+
+def run_shaping():
+    bench_shaping()
+
+
+def run_simulation():
+    bench_simulation(build_nsfnet(), flow_count=40)
+    bench_simulation(build_synthetic(1000))
+
+
+def run_startup():
+    import functools
+    bench_startup(build_nsfnet)
+    bench_startup(functools.partial(build_synthetic, 200))
+
+
+BENCHMARKS = {
+    'batching': run_batching,
+    'compression': run_compression,
+    'hierarchical': run_hierarchical,
+    'qos': run_qos,
+    'shaping': run_shaping,
+    'simulation': run_simulation,
+    'startup': run_startup,
+}
+
+# Example usage
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,750 @@
+import json
+import itertools
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from Liveness import UP
+
+# Replica N serves routers on CONTROLLER_PORT + N
+CONTROLLER_PORT = 8888
+
+# Log operations and the publisher method that applies each one
+OPERATIONS = {'remove': 'remove_node', 'restore': 'restore_node'}
+
+
+def log_address(replica_id, directory):
+    """
+    Get the Unix socket path a replica serves its log on.
+
+    Parameters:
+    replica_id (int): The replica ID.
+    directory (str): The private directory of the cluster.
+
+    Returns:
+    str: The socket path.
+    """
+    return os.path.join(directory, f'nsfnet-controller-{replica_id}.sock')
+
+
+def cluster_directory():
+    """
+    Create a private directory for the log sockets and state of a new cluster.
+
+    Only this user can open the sockets or the state in it, and no state of an
+    earlier cluster is picked up by accident.
+
+    Returns:
+    str: The directory, readable and writable by this user only.
+    """
+    return tempfile.mkdtemp(prefix='nsfnet-cluster-')
+
+
+def check_directory(directory):
+    """
+    Check that a cluster directory is private to this user.
+
+    Parameters:
+    directory (str): The directory.
+
+    Raises:
+    ValueError: If another user owns the directory or may write to it.
+    """
+    status = os.stat(directory)
+    if status.st_uid != os.getuid() or status.st_mode & 0o022:
+        raise ValueError(f"Cluster directory {directory} is not private to this user")
+
+
+def controller_addresses(replica_count, host='localhost'):
+    """
+    Get the router-facing addresses of every replica.
+
+    Parameters:
+    replica_count (int): The number of replicas.
+    host (str): The host the replicas listen on. Default is 'localhost'.
+
+    Returns:
+    list: (host, port) tuples, one per replica.
+    """
+    return [(host, CONTROLLER_PORT + replica_id) for replica_id in range(replica_count)]
+
+
+class FollowerChannel:
+    """
+    The leader's stream to one follower.
+
+    Messages are queued and sent by a thread of the channel's own, so the
+    leader never waits on a follower while it holds its lock. A follower that
+    falls `limit` messages behind is disconnected and resyncs when it
+    reconnects.
+    """
+
+    def __init__(self, peer_socket, match_index, limit=10000):
+        """
+        Initialize the channel and start its sender thread.
+
+        Parameters:
+        peer_socket (socket.socket): The socket connected to the follower.
+        match_index (int): The last index the follower is known to hold.
+        limit (int): The most messages queued before the follower is dropped. Default is 10000.
+        """
+        self.socket = peer_socket
+        self.match_index = match_index
+        self.limit = limit
+        self.queue = queue.Queue()
+        self.closed = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def send(self, message):
+        """
+        Queue a message for the follower.
+
+        Parameters:
+        message (bytes): The message.
+        """
+        if self.closed:
+            return
+        if self.queue.qsize() >= self.limit:
+            print("Dropping a follower that stopped reading the log")
+            self.close()
+            return
+        self.queue.put(message)
+
+    def run(self):
+        """
+        Send queued messages until the channel closes.
+        """
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            try:
+                self.socket.sendall(message)
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        """
+        Stop the channel and wake the thread reading from the follower.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class ClusterReplica:
+    """
+    One controller replica in a cluster that replicates topology mutations
+    through an ordered log.
+
+    The leader sequences every mutation: it appends it to the log, tagged
+    with its term, and sends it to every follower. An entry is committed once
+    a majority of replicas hold it, and every replica applies committed
+    entries strictly in log order, so every replica publishes the same
+    snapshots. Followers forward their own mutations to the leader and keep
+    them until the entry comes back in the log; every mutation carries an
+    ID, so one sent again after a leader change is logged only once.
+
+    A replica that finds no leader waits a delay that grows with its ID and
+    asks the others to elect it for a new term. Each replica votes once per
+    term, and only for a candidate whose log is at least as up to date as its
+    own, so a majority leader holds every committed entry. A replica that
+    sees a higher term steps down. A follower whose log runs ahead of the
+    leader's is cut back to the last entry they share. The term, the vote and
+    the log are kept on disk, so a restarted replica neither votes twice in a
+    term nor forgets entries it acknowledged when it is restarted to restore
+    them.
+
+    A replica exposes `current`, `remove_node` and `restore_node` like a
+    SnapshotPublisher, so a TCPServer can serve routers from it directly.
+    """
+
+    def __init__(self, replica_id, replica_count, publisher, directory, restore=False):
+        """
+        Initialize the replica.
+
+        Parameters:
+        replica_id (int): The ID of this replica.
+        replica_count (int): The number of replicas in the cluster.
+        publisher (SnapshotPublisher): The local publisher the log is applied to.
+        directory (str): The private directory holding the log sockets and replica state, from cluster_directory().
+        restore (bool): Whether to restore the term, vote and log this replica saved in the directory, as when
+        the replica restarts. Default is False, which starts a new cluster.
+
+        Raises:
+        ValueError: If the directory is not private to this user.
+        """
+        check_directory(directory)
+        self.replica_id = replica_id
+        self.replica_count = replica_count
+        self.publisher = publisher
+        self.directory = directory
+        self.state_path = os.path.join(directory, f'nsfnet-controller-{replica_id}.state')
+        # (term, operation, node ID, mutation ID) of every entry; index N is self.log[N - 1]
+        self.log = []
+        self.mutation_ids = set()
+        # Mutation IDs are unique to this run of this replica
+        self.incarnation = os.urandom(4).hex()
+        self.sequence_numbers = itertools.count(1)
+        self.term = 0
+        self.voted_for = None
+        self.commit_index = 0
+        self.applied_index = 0
+        # The FollowerChannel of every follower, keyed by its socket
+        self.followers = {}
+        # Mutations forwarded to a leader that are not in the log yet, keyed by mutation ID
+        self.unconfirmed = {}
+        self.leader_socket = None
+        # Serializes writes to the leader socket
+        self.send_lock = threading.Lock()
+        self.is_leader = False
+        self.stepped_down = threading.Event()
+        self.liveness = None
+        # Guards the term, the log, the followers and the unconfirmed mutations
+        self.lock = threading.RLock()
+        if restore:
+            self.load_state()
+
+    @property
+    def current(self):
+        """
+        The current topology snapshot of this replica.
+        """
+        return self.publisher.current
+
+    def load_state(self):
+        """
+        Restore the term, the vote and the log saved by an earlier run.
+        """
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring replica state {self.state_path}: {e}")
+            return
+        self.term = state['term']
+        self.voted_for = state['voted_for']
+        self.log = [tuple(entry) for entry in state['log']]
+        self.mutation_ids = {entry[3] for entry in self.log}
+        print(f"Replica {self.replica_id} restored term {self.term} with {len(self.log)} log entries")
+
+    def save_state(self):
+        """
+        Save the term, the vote and the log, atomically. Called with the lock held,
+        before the replica answers for them.
+        """
+        state = {'term': self.term, 'voted_for': self.voted_for, 'log': self.log}
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=f'.nsfnet-controller-{self.replica_id}-')
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump(state, file)
+            os.replace(temporary, self.state_path)
+        except OSError:
+            os.unlink(temporary)
+            raise
+
+    def last_term(self):
+        """
+        Get the term of the last log entry.
+
+        Returns:
+        int: The term, or 0 if the log is empty.
+        """
+        return self.log[-1][0] if self.log else 0
+
+    def start(self):
+        """
+        Start serving the log and join the cluster.
+        """
+        threading.Thread(target=self.serve_log, daemon=True).start()
+        threading.Thread(target=self.follow, daemon=True).start()
+
+    def remove_node(self, node_id):
+        """
+        Replicate the removal of a node.
+
+        Parameters:
+        node_id (int): The ID of the node to be removed.
+        """
+        self.replicate('remove', node_id)
+
+    def restore_node(self, node_id):
+        """
+        Replicate the restore of a removed node.
+
+        Parameters:
+        node_id (int): The ID of the node to be restored.
+        """
+        self.replicate('restore', node_id)
+
+    def replicate(self, operation, node_id):
+        """
+        Sequence a mutation, or forward it to the leader.
+
+        Parameters:
+        operation (str): The log operation.
+        node_id (int): The ID of the node.
+        """
+        with self.lock:
+            mutation_id = f"{self.replica_id}.{self.incarnation}.{next(self.sequence_numbers)}"
+            if self.is_leader:
+                self.sequence(operation, node_id, mutation_id)
+                return
+            # Kept until the entry arrives, and sent again to every new leader until then
+            self.unconfirmed[mutation_id] = (operation, node_id)
+            leader_socket = self.leader_socket
+        if leader_socket is not None:
+            self.forward(leader_socket, [(mutation_id, operation, node_id)])
+
+    def forward(self, leader_socket, mutations):
+        """
+        Send mutations to the leader.
+
+        Parameters:
+        leader_socket (socket.socket): The socket connected to the leader.
+        mutations (list): (mutation ID, operation, node ID) of every mutation.
+        """
+        message = "".join(f"mutate-{operation}-{node_id}-{mutation_id}\n"
+                          for mutation_id, operation, node_id in mutations)
+        self.send_to_leader(leader_socket, message)
+
+    def send_to_leader(self, leader_socket, message):
+        """
+        Write to the leader socket; a failed write is left to the follow loop, which reconnects.
+
+        Parameters:
+        leader_socket (socket.socket): The socket connected to the leader.
+        message (str): The message.
+        """
+        try:
+            with self.send_lock:
+                leader_socket.sendall(message.encode())
+        except OSError as e:
+            print(f"Error writing to leader: {e}")
+
+    def sequence(self, operation, node_id, mutation_id):
+        """
+        Append a mutation to the log in the current term and send it to the followers. Leader only.
+
+        Parameters:
+        operation (str): The log operation.
+        node_id (int): The ID of the node.
+        mutation_id (str): The ID of the mutation; a mutation already in the log is not logged again.
+        """
+        with self.lock:
+            if mutation_id in self.mutation_ids:
+                return
+            self.log.append((self.term, operation, node_id, mutation_id))
+            self.mutation_ids.add(mutation_id)
+            self.save_state()
+            entry = f"entry-{len(self.log)}-{self.term}-{operation}-{node_id}-{mutation_id}\n".encode()
+            for channel in self.followers.values():
+                channel.send(entry)
+            self.advance_commit()
+
+    def advance_commit(self):
+        """
+        Commit the entries a majority of replicas hold and tell the followers. Leader only.
+
+        Only entries of the current term are counted; earlier entries are
+        committed along with them.
+        """
+        with self.lock:
+            indexes = sorted([len(self.log), *(channel.match_index for channel in self.followers.values())],
+                             reverse=True)
+            majority = self.replica_count // 2 + 1
+            if len(indexes) < majority:
+                return
+            index = indexes[majority - 1]
+            if index <= self.commit_index or self.log[index - 1][0] != self.term:
+                return
+            self.commit_index = index
+            message = f"commit-{index}\n".encode()
+            for channel in self.followers.values():
+                channel.send(message)
+            self.apply_committed()
+
+    def apply_committed(self):
+        """
+        Apply every committed entry not applied yet, in log order.
+        """
+        with self.lock:
+            while self.applied_index < min(self.commit_index, len(self.log)):
+                self.applied_index += 1
+                _, operation, node_id, _ = self.log[self.applied_index - 1]
+                self.apply(operation, node_id)
+
+    def apply(self, operation, node_id):
+        """
+        Apply a log entry to the local publisher.
+
+        Parameters:
+        operation (str): The log operation.
+        node_id (int): The ID of the node.
+        """
+        if operation not in OPERATIONS:
+            # A new leader's marker entry
+            return
+        getattr(self.publisher, OPERATIONS[operation])(node_id)
+        if operation == 'remove' and self.liveness is not None and self.liveness.state(node_id) == UP:
+            # The router failed over to this replica before another one withdrew it
+            self.replicate('restore', node_id)
+
+    def adopt_term(self, term):
+        """
+        Move to a higher term, stepping down if this replica was leading.
+
+        Parameters:
+        term (int): The term seen on another replica.
+        """
+        with self.lock:
+            if term <= self.term:
+                return
+            self.term = term
+            self.voted_for = None
+            self.save_state()
+            if self.is_leader:
+                print(f"Replica {self.replica_id} stepping down for term {term}")
+                self.is_leader = False
+                for channel in self.followers.values():
+                    channel.close()
+                self.followers = {}
+                self.stepped_down.set()
+
+    def serve_log(self):
+        """
+        Accept connections from followers, candidates and peers looking for the leader.
+        """
+        path = log_address(self.replica_id, self.directory)
+        if os.path.exists(path):
+            os.unlink(path)
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(path)
+        server_socket.listen(self.replica_count)
+        print(f"Replica {self.replica_id} serving its log on {path}")
+        while True:
+            peer_socket, _ = server_socket.accept()
+            threading.Thread(target=self.handle_peer, args=(peer_socket,), daemon=True).start()
+
+    def handle_peer(self, peer_socket):
+        """
+        Handle requests from another replica.
+
+        Parameters:
+        peer_socket (socket.socket): The socket connected to the other replica.
+        """
+        try:
+            for line in peer_socket.makefile('r'):
+                data_split = line.strip().split("-")
+                if data_split[0] == 'role':
+                    role = 'leader' if self.is_leader else 'follower'
+                    peer_socket.sendall(f"role-{role}-{self.term}\n".encode())
+                elif data_split[0] == 'vote':
+                    term, candidate, last_index, last_term = map(int, data_split[1:5])
+                    peer_socket.sendall(f"vote-{self.term}-{int(self.vote(term, candidate, last_index, last_term))}\n"
+                                        .encode())
+                elif data_split[0] == 'sync':
+                    self.adopt_term(int(data_split[1]))
+                    index, index_term = int(data_split[2]), int(data_split[3])
+                    with self.lock:
+                        if not self.is_leader:
+                            reply = b"not-leader\n"
+                        elif index > len(self.log) or (index > 0 and self.log[index - 1][0] != index_term):
+                            # The follower backs off one entry and asks again
+                            reply = f"mismatch-{self.term}\n".encode()
+                        else:
+                            reply = None
+                    if reply is not None:
+                        peer_socket.sendall(reply)
+                        if reply == b"not-leader\n":
+                            break
+                        continue
+                    with self.lock:
+                        if not self.is_leader:
+                            break
+                        # The logs agree up to index: send the rest, then stream new entries
+                        channel = self.followers[peer_socket] = FollowerChannel(peer_socket, index)
+                        channel.send(f"match-{self.term}-{index}\n".encode())
+                        for entry_index in range(index, len(self.log)):
+                            term, operation, node_id, mutation_id = self.log[entry_index]
+                            channel.send(f"entry-{entry_index + 1}-{term}-{operation}-{node_id}-{mutation_id}\n"
+                                         .encode())
+                        channel.send(f"commit-{self.commit_index}\n".encode())
+                elif data_split[0] == 'ack':
+                    with self.lock:
+                        channel = self.followers.get(peer_socket)
+                        if channel is not None:
+                            channel.match_index = max(channel.match_index, int(data_split[1]))
+                            self.advance_commit()
+                elif data_split[0] == 'mutate':
+                    with self.lock:
+                        if self.is_leader:
+                            self.sequence(data_split[1], int(data_split[2]), data_split[3])
+                            continue
+                    # The sender keeps the mutation and sends it to the leader it finds next
+                    peer_socket.sendall(b"not-leader\n")
+                    break
+        except (OSError, ValueError) as e:
+            print(f"Error handling replica: {e}")
+        finally:
+            with self.lock:
+                channel = self.followers.pop(peer_socket, None)
+            if channel is not None:
+                channel.close()
+            peer_socket.close()
+
+    def vote(self, term, candidate, last_index, last_term):
+        """
+        Decide whether to vote for a candidate.
+
+        Parameters:
+        term (int): The term the candidate is running for.
+        candidate (int): The ID of the candidate.
+        last_index (int): The length of the candidate's log.
+        last_term (int): The term of the last entry of the candidate's log.
+
+        Returns:
+        bool: True if this replica votes for the candidate.
+        """
+        with self.lock:
+            self.adopt_term(term)
+            if term < self.term or self.voted_for not in (None, candidate):
+                return False
+            if (last_term, last_index) < (self.last_term(), len(self.log)):
+                # The candidate may be missing committed entries
+                return False
+            self.voted_for = candidate
+            self.save_state()
+            return True
+
+    def request(self, replica_id, message):
+        """
+        Send one request to another replica and read its answer.
+
+        Parameters:
+        replica_id (int): The ID of the other replica.
+        message (str): The request.
+
+        Returns:
+        list or None: The fields of the answer, or None if the replica is unreachable.
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as peer_socket:
+                peer_socket.settimeout(1.0)
+                peer_socket.connect(log_address(replica_id, self.directory))
+                peer_socket.sendall(f"{message}\n".encode())
+                answer = peer_socket.makefile('r').readline().strip().split("-")
+                return answer if len(answer) == 3 else None
+        except OSError:
+            return None
+
+    def find_leader(self):
+        """
+        Find the leader of the current term.
+
+        Returns:
+        int or None: The ID of the leader, or None if no reachable replica leads.
+        """
+        for replica_id in range(self.replica_count):
+            if replica_id == self.replica_id:
+                continue
+            answer = self.request(replica_id, "role")
+            if answer is None:
+                continue
+            term = int(answer[2])
+            self.adopt_term(term)
+            if answer[1] == 'leader' and term >= self.term:
+                return replica_id
+        return None
+
+    def elect(self):
+        """
+        Stand for leader in a new term.
+
+        Returns:
+        bool: True if a majority voted for this replica.
+        """
+        with self.lock:
+            self.term += 1
+            self.voted_for = self.replica_id
+            self.save_state()
+            term, last_index, last_term = self.term, len(self.log), self.last_term()
+        votes = 1
+        for replica_id in range(self.replica_count):
+            if replica_id == self.replica_id:
+                continue
+            answer = self.request(replica_id, f"vote-{term}-{self.replica_id}-{last_index}-{last_term}")
+            if answer is None:
+                continue
+            self.adopt_term(int(answer[1]))
+            votes += int(answer[2])
+        with self.lock:
+            if self.term != term or 2 * votes <= self.replica_count:
+                return False
+            self.is_leader = True
+            self.stepped_down.clear()
+            print(f"Replica {self.replica_id} is the leader for term {term} at log index {len(self.log)}")
+            # Commits whatever earlier leaders left uncommitted as soon as a majority holds it
+            self.sequence('leader', self.replica_id, f"{self.replica_id}.{self.incarnation}.term{term}")
+            unconfirmed, self.unconfirmed = self.unconfirmed, {}
+            for mutation_id, (operation, node_id) in unconfirmed.items():
+                self.sequence(operation, node_id, mutation_id)
+            return True
+
+    def follow(self):
+        """
+        Follow the leader's log, standing for leader when there is none.
+        """
+        while True:
+            if self.is_leader:
+                self.stepped_down.wait()
+                continue
+            leader_id = self.find_leader()
+            if leader_id is not None:
+                try:
+                    self.follow_leader(leader_id)
+                except (OSError, ValueError) as e:
+                    print(f"Lost leader replica {leader_id}: {e}")
+                with self.lock:
+                    self.leader_socket = None
+                time.sleep(0.5)
+                continue
+            # Lower IDs stand first, and the jitter breaks ties between replicas that start together
+            time.sleep(0.3 * (1 + self.replica_id) + random.uniform(0, 0.2))
+            if self.find_leader() is None and not self.elect():
+                time.sleep(random.uniform(0.2, 0.5))
+
+    def truncate(self, length):
+        """
+        Drop the log entries the leader does not have. They were never committed, so
+        none of them was applied.
+
+        Parameters:
+        length (int): The number of entries to keep.
+        """
+        with self.lock:
+            if length < len(self.log):
+                print(f"Replica {self.replica_id} dropping {len(self.log) - length} entries the leader does not have")
+                del self.log[length:]
+                self.mutation_ids = {entry[3] for entry in self.log}
+                self.save_state()
+
+    def follow_leader(self, leader_id):
+        """
+        Stream and apply the leader's log until the connection is lost.
+
+        Parameters:
+        leader_id (int): The ID of the leader.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as leader_socket:
+            leader_socket.connect(log_address(leader_id, self.directory))
+            lines = leader_socket.makefile('r')
+            with self.lock:
+                index = len(self.log)
+            # Walk back until the leader's log agrees with ours
+            while True:
+                with self.lock:
+                    index_term = self.log[index - 1][0] if index > 0 else 0
+                    term = self.term
+                leader_socket.sendall(f"sync-{term}-{index}-{index_term}\n".encode())
+                data_split = lines.readline().strip().split("-")
+                if data_split[0] != 'mismatch' or index == 0:
+                    break
+                index -= 1
+            if data_split[0] != 'match':
+                return
+            self.adopt_term(int(data_split[1]))
+            self.truncate(int(data_split[2]))
+            with self.lock:
+                self.leader_socket = leader_socket
+                unconfirmed = [(mutation_id, operation, node_id)
+                               for mutation_id, (operation, node_id) in self.unconfirmed.items()]
+            print(f"Replica {self.replica_id} following replica {leader_id} in term {self.term}")
+            if unconfirmed:
+                # The leader drops any it already logged
+                self.forward(leader_socket, unconfirmed)
+            leader_term = self.term
+            for line in lines:
+                if self.term > leader_term:
+                    # Another replica stood for a later term; this leader's entries no longer count
+                    return
+                data_split = line.strip().split("-")
+                if data_split[0] == 'commit':
+                    with self.lock:
+                        self.commit_index = max(self.commit_index, int(data_split[1]))
+                        self.apply_committed()
+                    continue
+                if data_split[0] != 'entry':
+                    return
+                index, term, operation = int(data_split[1]), int(data_split[2]), data_split[3]
+                node_id, mutation_id = int(data_split[4]), data_split[5]
+                with self.lock:
+                    if index <= len(self.log) and self.log[index - 1][0] == term:
+                        continue
+                    if index > len(self.log) + 1:
+                        # A gap the next sync fills in
+                        return
+                    self.truncate(index - 1)
+                    self.log.append((term, operation, node_id, mutation_id))
+                    self.mutation_ids.add(mutation_id)
+                    self.unconfirmed.pop(mutation_id, None)
+                    self.save_state()
+                self.send_to_leader(leader_socket, f"ack-{index}\n")
+
+
+def start_cluster(replica_count, directory=None):
+    """
+    Start every replica of a cluster as a separate process on this machine.
+
+    Parameters:
+    replica_count (int): The number of replicas.
+    directory (str): The private directory of the cluster. Default is a new one.
+
+    Returns:
+    list: The replica processes.
+    """
+    directory = directory or cluster_directory()
+    return [subprocess.Popen([sys.executable, __file__, str(replica_count), str(replica_id), directory])
+            for replica_id in range(replica_count)]
+
+
+# Example usage
+if __name__ == "__main__":
+    # python Cluster.py <replicas>                                  start a whole cluster
+    # python Cluster.py <replicas> <replica> <directory> [restore]  run one replica in this process
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    if len(sys.argv) < 3:
+        processes = start_cluster(count)
+        for process in processes:
+            process.wait()
+        sys.exit(0)
+
+    from Controler import TCPServer, build_nsfnet
+    from Liveness import LivenessTracker
+    from Metrics import REGISTRY, MetricsServer
+    from Snapshot import SnapshotPublisher
+    from TimerWheel import TimerWheel
+
+    replica_index = int(sys.argv[2])
+    publisher = SnapshotPublisher(build_nsfnet(), {"message": "ASK"}, f'HSF_{replica_index}.json')
+    replica = ClusterReplica(replica_index, count, publisher, sys.argv[3], restore="restore" in sys.argv[4:])
+    wheel = TimerWheel(tick=0.1)
+    wheel.start()
+    replica.liveness = LivenessTracker(wheel, replica.remove_node, replica.restore_node)
+    replica.start()
+    server = TCPServer("localhost", CONTROLLER_PORT + replica_index, replica, liveness=replica.liveness)
+    MetricsServer(REGISTRY, 'localhost', 9100 + replica_index).start()
+    server.start()
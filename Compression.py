@@ -0,0 +1,142 @@
+import zlib
+
+# Largest preset dictionary zlib can use (size of its sliding window)
+MAX_DICTIONARY_SIZE = 32768
+
+
+class Codec:
+    """
+    A pass-through codec used when a session negotiates no compression.
+    """
+    name = 'none'
+
+    def __init__(self, dictionary=b''):
+        """
+        Initialize the codec.
+
+        Parameters:
+        dictionary (bytes): Preset dictionary shared by both ends. Default is b''.
+        """
+        self.dictionary = dictionary
+
+    def compress(self, data):
+        """
+        Compress a payload.
+
+        Parameters:
+        data (bytes): The payload to compress.
+
+        Returns:
+        bytes: The compressed payload.
+        """
+        return data
+
+    def decompress(self, data):
+        """
+        Decompress a payload.
+
+        Parameters:
+        data (bytes): The payload to decompress.
+
+        Returns:
+        bytes: The original payload.
+        """
+        return data
+
+
+class ZlibCodec(Codec):
+    """
+    A codec that compresses each payload independently with zlib.
+    """
+    name = 'zlib'
+
+    def __init__(self, dictionary=b'', level=6):
+        super().__init__(dictionary)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZdictCodec(ZlibCodec):
+    """
+    A zlib codec primed with a preset dictionary built from the topology.
+    """
+    name = 'zdict'
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+# Codecs in order of preference
+CODECS = {codec.name: codec for codec in (ZdictCodec, ZlibCodec, Codec)}
+SUPPORTED_CODECS = list(CODECS)
+
+
+def build_dictionary(routing_tables):
+    """
+    Build a preset compression dictionary from node names and ports.
+
+    Parameters:
+    routing_tables (dict): The routing tables as stored in HSF.json.
+
+    Returns:
+    bytes: The dictionary, with the most frequent fragments placed last.
+    """
+    # Count how often each node appears in a path
+    usage = {node_name: 0 for node_name in routing_tables}
+    for node_data in routing_tables.values():
+        for path in node_data['routing_table'].values():
+            for hop in path:
+                if hop in usage:
+                    usage[hop] += 1
+    fragments = ['{"message": "ASK"}']
+    for node_name in sorted(usage, key=usage.get):
+        port = routing_tables[node_name]['port']
+        fragments.append(f'"{node_name}": [{port}, {port}, ')
+    dictionary = ''.join(fragments).encode()
+    # zlib favours matches close to the end of the dictionary
+    return dictionary[-MAX_DICTIONARY_SIZE:]
+
+
+def negotiate_codec(offered, accepted=None, dictionary=b''):
+    """
+    Pick the codec for a session from the codecs offered by the peer.
+
+    Parameters:
+    offered (list): Codec names offered by the peer, most preferred first.
+    accepted (list): Codec names this end is willing to use. Default is all supported codecs.
+    dictionary (bytes): Preset dictionary for dictionary-based codecs. Default is b''.
+
+    Returns:
+    Codec: The codec both ends support, or the pass-through codec.
+    """
+    accepted = SUPPORTED_CODECS if accepted is None else accepted
+    for name in offered:
+        if name in accepted and name in CODECS:
+            if name == ZdictCodec.name and not dictionary:
+                continue
+            return CODECS[name](dictionary)
+    return Codec()
+
+
+def make_codec(name, dictionary=b''):
+    """
+    Create the codec chosen by the peer during negotiation.
+
+    Parameters:
+    name (str): The codec name.
+    dictionary (bytes): Preset dictionary for dictionary-based codecs. Default is b''.
+
+    Returns:
+    Codec: The codec instance.
+    """
+    return CODECS.get(name, Codec)(dictionary)
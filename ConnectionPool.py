@@ -0,0 +1,468 @@
+import asyncio
+import collections
+import itertools
+import os
+import socket
+import time
+from Metrics import REGISTRY
+from QoS import BEST_EFFORT, DeficitRoundRobin
+from Shaping import LinkShaper, TokenBucket
+
+# Labelled by router as well as neighbor, since one process serves many routers
+LINK_BYTES = REGISTRY.counter('router_link_bytes_total', 'Bytes scheduled onto each neighbor link.',
+                              ('router', 'neighbor'))
+LINK_THROTTLED = REGISTRY.counter('router_link_throttled_total', 'Times a neighbor link ran out of tokens.',
+                                  ('router', 'neighbor'))
+
+# The most buffers a single sendmsg() call accepts
+IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+
+class NeighborConnection:
+    """
+    A persistent connection to one neighbor router, reconnected with backoff.
+
+    Messages are queued on the connection and written in batches: the queue is
+    flushed with one vectored sendmsg() once `batch_size` messages are waiting,
+    or `flush_deadline` seconds after the first one was queued, whichever comes
+    first. Whatever the socket does not accept is finished when it becomes
+    writable.
+
+    Every traffic class has its own egress queue, and a deficit round robin
+    scheduler picks the order they go out in, `burst` bytes at a time. The
+    kernel is only allowed to hold `notsent_lowat` unsent bytes, so a backlog
+    builds up in the class queues, where latency-sensitive traffic can
+    overtake it, rather than in the socket buffer.
+
+    A shaped connection also takes tokens from a token bucket for every byte
+    it schedules. Once the bucket is empty the class queues wait for the
+    router's LinkShaper to wake the connection, so the link runs at its
+    emulated rate and its queueing delay becomes real.
+
+    Messages may be memoryviews into a receive buffer. They are written without
+    copying when they go out in the same event loop iteration, and copied only
+    if they have to wait longer, because the buffer is reused on the next read.
+
+    The connection opens with a `neighbor-<port>` line so the neighbor knows
+    that the packets on it come from a router rather than a host.
+    """
+
+    def __init__(self, host, port, local_port, connect_timeout=1.0, max_reconnect_delay=5.0, high_water=1 << 20,
+                 batch_size=64, flush_deadline=0.0, scheduler=None, burst=1 << 15, notsent_lowat=1 << 15):
+        """
+        Initialize the connection.
+
+        Parameters:
+        host (str): The host address of the neighbor.
+        port (int): The port of the neighbor.
+        local_port (int): The port of this router, announced to the neighbor.
+        connect_timeout (float): Seconds to wait for the neighbor to accept. Default is 1.0.
+        max_reconnect_delay (float): The longest wait between reconnect attempts. Default is 5.0.
+        high_water (int): Queued bytes above which the connection is congested. Default is 1 MiB.
+        batch_size (int): Queued messages that trigger an immediate flush; 1 disables batching. Default is 64.
+        flush_deadline (float): The longest a queued message waits for a flush, in seconds. Default is 0.0,
+        which flushes once the event loop has run every ready handler.
+        scheduler (DeficitRoundRobin): The egress scheduler. Default is one with the default class weights.
+        burst (int): The bytes the scheduler moves to the wire at a time. Default is 32 KiB.
+        notsent_lowat (int): The unsent bytes the kernel may hold; None leaves it unlimited. Default is 32 KiB.
+        """
+        self.host = host
+        self.port = port
+        self.local_port = local_port
+        self.connect_timeout = connect_timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.high_water = high_water
+        self.batch_size = batch_size
+        self.flush_deadline = flush_deadline
+        self.scheduler = scheduler or DeficitRoundRobin()
+        self.burst = burst
+        self.notsent_lowat = notsent_lowat
+        self.bucket = None
+        self.shaper = None
+        self.throttled = False
+        self.sock = None
+        self.connecting = None
+        self.queue = collections.deque()
+        self.queued_bytes = 0
+        # Running totals for the controller's telemetry
+        self.bytes_sent = 0
+        self.messages_sent = 0
+        self.link_bytes = LINK_BYTES.labels(local_port, port)
+        self.link_throttled = LINK_THROTTLED.labels(local_port, port)
+        self.batched = 0
+        self.offset = 0
+        self.has_views = False
+        self.flush_handle = None
+        self.writing = False
+        self.drain_callbacks = []
+        self.reconnect_delay = 0.1
+        self.next_attempt = 0.0
+
+    def start_connect(self):
+        """
+        Open the connection in the background unless it is open, opening or backing off.
+
+        Returns:
+        bool: False if the neighbor is backing off after a failed attempt.
+        """
+        if self.sock is not None or self.connecting is not None:
+            return True
+        if time.monotonic() < self.next_attempt:
+            return False
+        self.connecting = asyncio.get_running_loop().create_task(self.connect())
+        return True
+
+    async def connect(self):
+        """
+        Open the connection and write whatever was queued while it was closed.
+        """
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (self.host, self.port)), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            print(f"Error connecting to neighbor {self.port}, retrying in {self.reconnect_delay:.1f}s: {e}")
+            self.next_attempt = time.monotonic() + self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+            self.discard()
+            return
+        finally:
+            self.connecting = None
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.notsent_lowat is not None and hasattr(socket, 'TCP_NOTSENT_LOWAT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, self.notsent_lowat)
+        print(f"Connected to neighbor {self.port}")
+        self.sock = sock
+        self.reconnect_delay = 0.1
+        # Neighbors never write on this connection, so anything readable means it closed
+        loop.add_reader(sock, self.on_readable)
+        hello = f"neighbor-{self.local_port}\n".encode()
+        self.queue.appendleft(hello)
+        self.queued_bytes += len(hello)
+        self.flush()
+
+    def on_readable(self):
+        """
+        Close the connection once the neighbor has closed it.
+        """
+        try:
+            if self.sock.recv(4096):
+                return
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            pass
+        self.lost()
+
+    def lost(self):
+        """
+        Drop the connection and every message still queued on it.
+        """
+        if self.sock is not None:
+            print(f"Lost connection to neighbor {self.port}, dropping {len(self.scheduler)} queued message(s)")
+            self.close()
+
+    def close(self):
+        """
+        Close the connection and discard every message still queued on it.
+        """
+        if self.sock is None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.sock)
+        if self.writing:
+            loop.remove_writer(self.sock)
+            self.writing = False
+        self.sock.close()
+        self.sock = None
+        self.discard()
+
+    def discard(self):
+        """
+        Drop every queued message and release anyone waiting for the queue to drain.
+        """
+        self.queue.clear()
+        self.scheduler.clear()
+        self.queued_bytes = 0
+        self.batched = 0
+        self.offset = 0
+        self.has_views = False
+        self.throttled = False
+        self.wake_senders()
+
+    def send(self, *buffers, traffic_class=BEST_EFFORT):
+        """
+        Queue a message, opening the connection in the background if needed.
+
+        Parameters:
+        buffers (bytes or memoryview): The packet, in one or more pieces.
+        traffic_class (int): The QoS traffic class. Default is BEST_EFFORT.
+
+        Returns:
+        bool: False if the neighbor is unreachable and the message was dropped.
+        """
+        if self.sock is None and not self.start_connect():
+            return False
+        # Views are only safe until the end of this event loop iteration
+        flushes_soon = self.sock is not None and not (self.writing or self.throttled) and self.flush_deadline <= 0
+        size = 0
+        for data in buffers:
+            if type(data) is memoryview:
+                if flushes_soon:
+                    self.has_views = True
+                else:
+                    buffers = tuple(bytes(data) if type(data) is memoryview else data for data in buffers)
+                    size = sum(map(len, buffers))
+                    break
+            size += len(data)
+        self.scheduler.enqueue(traffic_class, buffers, size)
+        self.queued_bytes += size
+        self.messages_sent += 1
+        self.batched += 1
+        if self.sock is None or self.throttled:
+            # The connection flushes once it is open, or once its bucket has refilled
+            return True
+        if self.batched >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None and not self.writing:
+            loop = asyncio.get_running_loop()
+            if self.flush_deadline > 0:
+                self.flush_handle = loop.call_later(self.flush_deadline, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+        return True
+
+    def shape(self, bucket, shaper):
+        """
+        Limit the connection to the rate of a token bucket.
+
+        Parameters:
+        bucket (TokenBucket): The bucket of the link, or None to stop shaping.
+        shaper (LinkShaper): The timer that wakes the connection when the bucket refills.
+        """
+        self.bucket = bucket
+        self.shaper = shaper
+        if bucket is None and self.throttled:
+            self.throttled = False
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def congested(self):
+        """
+        Check whether the neighbor has fallen far behind.
+
+        Returns:
+        bool: True if more than `high_water` bytes are queued.
+        """
+        return self.queued_bytes > self.high_water
+
+    def on_drained(self, callback):
+        """
+        Call a function once the queue has drained below half of `high_water`.
+
+        Parameters:
+        callback (callable): The function to call.
+        """
+        self.drain_callbacks.append(callback)
+
+    async def drain(self):
+        """
+        Wait until the connection is no longer congested.
+        """
+        if self.congested():
+            drained = asyncio.get_running_loop().create_future()
+            self.on_drained(lambda: drained.done() or drained.set_result(None))
+            await drained
+
+    def flush(self):
+        """
+        Write the queued messages in scheduling order, with as few sendmsg() calls as
+        the socket allows.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.sock is None:
+            return
+        self.batched = 0
+        self.throttled = False
+        queue = self.queue
+        scheduler = self.scheduler
+        bucket = self.bucket
+        while True:
+            if not queue:
+                if not scheduler:
+                    break
+                budget = self.burst
+                if bucket is not None:
+                    tokens = bucket.available(time.monotonic())
+                    if tokens <= 0:
+                        self.throttle()
+                        break
+                    budget = min(budget, int(tokens) + 1)
+                # Messages already handed to the wire queue are never reordered
+                moved = scheduler.dequeue(budget, queue)
+                if bucket is not None:
+                    bucket.consume(moved)
+                self.link_bytes.inc(moved)
+                self.bytes_sent += moved
+            buffers = list(itertools.islice(queue, IOV_MAX))
+            if self.offset:
+                buffers[0] = memoryview(buffers[0])[self.offset:]
+            try:
+                sent = self.sock.sendmsg(buffers)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                print(f"Error writing to neighbor {self.port}: {e}")
+                self.lost()
+                return
+            self.queued_bytes -= sent
+            full = sent == sum(map(len, buffers))
+            sent += self.offset
+            while queue and sent >= len(queue[0]):
+                sent -= len(queue.popleft())
+            self.offset = sent
+            if not full:
+                # The socket buffer is full
+                break
+        loop = asyncio.get_running_loop()
+        if (queue or scheduler) and self.has_views:
+            # The receive buffers behind these views are about to be reused
+            self.queue = queue = collections.deque(
+                bytes(data) if type(data) is memoryview else data for data in queue)
+            scheduler.materialize()
+        self.has_views = False
+        if queue:
+            if not self.writing:
+                # Finish once the socket becomes writable again
+                loop.add_writer(self.sock, self.flush)
+                self.writing = True
+        else:
+            if self.writing:
+                loop.remove_writer(self.sock)
+                self.writing = False
+        if self.queued_bytes <= self.high_water // 2:
+            self.wake_senders()
+
+    def throttle(self):
+        """
+        Wait for the shaper to flush the connection once its bucket is half full again.
+        """
+        self.throttled = True
+        self.link_throttled.inc()
+        self.shaper.wake(self, self.bucket.ready_at(self.bucket.burst / 2))
+
+    def wake_senders(self):
+        """
+        Run the callbacks waiting for the queue to drain.
+        """
+        callbacks, self.drain_callbacks = self.drain_callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class ConnectionPool:
+    """
+    Persistent connections to every neighbor of a router, shared by all of its
+    connection handlers on the event loop.
+    """
+
+    def __init__(self, local_port, host='localhost', shaper=None, **options):
+        """
+        Initialize the pool.
+
+        Parameters:
+        local_port (int): The port of this router.
+        host (str): The host address of the neighbors. Default is 'localhost'.
+        shaper (LinkShaper): The timer waking throttled links. Default is one for this pool.
+        options: Extra arguments for every NeighborConnection.
+        """
+        self.local_port = local_port
+        self.host = host
+        self.options = options
+        self.connections = {}
+        # The totals of every link at the last telemetry report
+        self.reported = {}
+        # One timer wakes every shaped link
+        self.owns_shaper = shaper is None
+        self.shaper = shaper or LinkShaper()
+
+    def get(self, port):
+        """
+        Get the connection to a neighbor, creating it on first use.
+
+        Parameters:
+        port (int): The port of the neighbor.
+
+        Returns:
+        NeighborConnection: The connection.
+        """
+        connection = self.connections.get(port)
+        if connection is None:
+            connection = self.connections[port] = NeighborConnection(self.host, port, self.local_port, **self.options)
+        return connection
+
+    def send(self, port, *buffers, traffic_class=BEST_EFFORT):
+        """
+        Queue a message for a neighbor.
+
+        Parameters:
+        port (int): The port of the neighbor.
+        buffers (bytes or memoryview): The packet, in one or more pieces.
+        traffic_class (int): The QoS traffic class. Default is BEST_EFFORT.
+
+        Returns:
+        bool: False if the neighbor is unreachable and the message was dropped.
+        """
+        return self.get(port).send(*buffers, traffic_class=traffic_class)
+
+    def shape(self, rates):
+        """
+        Shape the links to neighbors to their rates. Buckets of links whose rate is
+        unchanged are kept, so a new routing table does not reset them.
+
+        Parameters:
+        rates (dict): The rate of every link in bytes per second, keyed by neighbor port.
+        """
+        for port, rate in rates.items():
+            connection = self.get(port)
+            if connection.bucket is None or connection.bucket.rate != rate:
+                connection.shape(TokenBucket(rate), self.shaper)
+
+    def warm(self, ports):
+        """
+        Open connections to neighbors in the background, before traffic needs them.
+
+        Parameters:
+        ports (iterable): The ports of the neighbors.
+        """
+        for port in ports:
+            self.get(port).start_connect()
+
+    def telemetry(self):
+        """
+        Take the load of every link since the last call.
+
+        Returns:
+        list: (neighbor port, bytes, messages, queued bytes) of every link, where bytes and
+        messages count what was scheduled onto the link since the last call and queued bytes
+        is the backlog now.
+        """
+        report = []
+        for port, connection in self.connections.items():
+            last_bytes, last_messages = self.reported.get(port, (0, 0))
+            report.append((port, connection.bytes_sent - last_bytes, connection.messages_sent - last_messages,
+                           connection.queued_bytes))
+            self.reported[port] = (connection.bytes_sent, connection.messages_sent)
+        return report
+
+    def close(self):
+        """
+        Close every connection.
+        """
+        if self.owns_shaper:
+            self.shaper.close()
+        for connection in self.connections.values():
+            connection.close()
@@ -1,24 +1,31 @@
 import socket
+import sys
 import threading
+import time
 from Node import Node
 from Link import Link
 import networkx as nx
 import matplotlib.pyplot as plt
 import json
-
-# Define a lock for synchronization
-lock = threading.Lock()
-
-def write_json(data, filename='data.json'):
-    """
-    Write a Python dictionary to a JSON file.
-
-    Parameters:
-    data (dict): The data to be written to the JSON file.
-    filename (str): The name of the JSON file. Default is 'data.json'.
-    """
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
+from Areas import HierarchicalRouting
+from Backpressure import SendBuffer, SessionWriter
+from Compression import SUPPORTED_CODECS, negotiate_codec
+from Liveness import LivenessTracker
+from Metrics import REGISTRY, MetricsServer
+from Profiling import PROFILER, is_control, span
+from Protocol import encode_frame
+from Snapshot import SnapshotPublisher, write_json
+from StreamBuffer import StreamBuffer
+from Telemetry import AdaptiveRouting, parse_report
+from TimerWheel import TimerWheel
+
+# Message types reported as metric labels; anything else is counted as 'other'
+MESSAGE_TYPES = ('hello', 'heartbeat', 'telemetry', 'data')
+# The first line of a session that negotiates a codec; it always ends with a newline
+HELLO = b"hello-"
+REQUESTS = REGISTRY.counter('controller_requests_total', 'Messages handled by the controller.', ('type',))
+REQUEST_SECONDS = REGISTRY.histogram('controller_request_duration_seconds', 'Time to handle one controller message.', ('type',))
+TABLE_BYTES = REGISTRY.counter('controller_table_bytes_total', 'Routing table bytes queued to routers, after compression.')
 
 def read_json(filename='data.json'):
     """
@@ -30,7 +37,7 @@ def read_json(filename='data.json'):
     Returns:
     dict: The data from the JSON file.
     """
-    with open(filename, 'r') as file:
+    with span('read_json'), open(filename, 'r') as file:
         data = json.load(file)
         return data
 
@@ -46,6 +53,9 @@ class Network:
         self.nodes = {}
         self.links = []
         self.graph = nx.Graph()
+        # Removed nodes and links are kept so the nodes can be restored later
+        self.removed_nodes = {}
+        self.removed_links = []
 
     def find_shortest_path(self, network, source_name, destination_name, weight='weight'):
         """
@@ -71,7 +81,7 @@ class Network:
             print(f"Node {e} not found in the network.")
             return None
 
-    def visualize_shortest_path(self, network, source_name, destination_name):
+    def visualize_shortest_path(self, network, source_name, destination_name, filename=None):
         """
         Visualize the shortest path between two nodes in the network.
 
@@ -79,6 +89,7 @@ class Network:
         network (Network): The network object.
         source_name (str): The name of the source node.
         destination_name (str): The name of the destination node.
+        filename (str): The image file to write instead of showing a window. Default is None.
         """
         path = nx.dijkstra_path(network.graph, source=source_name, target=destination_name)
         pos = nx.spring_layout(network.graph)
@@ -86,31 +97,42 @@ class Network:
         path_edges = list(zip(path, path[1:]))
         nx.draw_networkx_nodes(network.graph, pos, nodelist=path, node_color='red')
         nx.draw_networkx_edges(network.graph, pos, edgelist=path_edges, edge_color='red', width=2)
-        plt.show()
+        if filename is None:
+            plt.show()
+        else:
+            plt.savefig(filename)
+            plt.close()
 
-    def compute_all_shortest_paths(self, network):
+    def build_routing_tables(self, network):
         """
-        Compute all shortest paths in the network and save the routing tables to a JSON file.
+        Compute all shortest paths in the network and build the routing tables.
 
         Parameters:
         network (Network): The network object.
+
+        Returns:
+        dict: The routing tables keyed by node name, as stored in HSF.json.
         """
-        all_paths = dict(nx.all_pairs_dijkstra_path(network.graph))
+        with span('all_pairs_dijkstra_path'):
+            all_paths = dict(nx.all_pairs_dijkstra_path(network.graph))
+        nodes_by_name = {node.name: node for node in network.nodes.values()}
         routing_tables = {}
         for source, destinations in all_paths.items():
             routing_table = {}
             for destination, path in destinations.items():
                 routing_table[destination] = path
-            if source in network.nodes:  # Check if the source node exists
-                ip, port, node_id = network.get_node_p(source)
+            if source in nodes_by_name:  # Check if the source node exists
+                node = nodes_by_name[source]
+                ip, port, node_id = node.ip_address, node.port, node.node_id
                 routing_tables[source] = {
                     'ip': ip,
                     'port': port,
                     'node_id': node_id,
-                    'routing_table': routing_table
+                    'routing_table': routing_table,
+                    # Capacity of every link to a neighbor, for shaping; the routing weight may be raised by load
+                    'links': {neighbor: data['bandwidth'] for neighbor, data in network.graph[source].items()}
                 }
-        write_json(routing_tables, 'HSF.json')
-        print("Routing tables saved to HSF.json")
+        return routing_tables
 
     def add_node(self, node_id, name, ip_address=None, port=None, node_type='router'):
         """
@@ -138,7 +160,8 @@ class Network:
         """
         if source_id in self.nodes and destination_id in self.nodes:
             self.links.append(Link(self.nodes[source_id], self.nodes[destination_id], bandwidth))
-            self.graph.add_edge(self.nodes[source_id].name, self.nodes[destination_id].name, weight=bandwidth)
+            self.graph.add_edge(self.nodes[source_id].name, self.nodes[destination_id].name, weight=bandwidth,
+                                bandwidth=bandwidth)
         else:
             print("Error: One or both nodes not found in the network.")
 
@@ -153,26 +176,36 @@ class Network:
             node_name = self.nodes[node_id].name
             self.graph.remove_node(node_name)
             # Remove any links associated with this node
+            self.removed_links.extend(link for link in self.links if link.source.node_id == node_id or link.destination.node_id == node_id)
             self.links = [link for link in self.links if link.source.node_id != node_id and link.destination.node_id != node_id]
-            del self.nodes[node_id]
+            self.removed_nodes[node_id] = self.nodes.pop(node_id)
             print(f"Node {node_name} and its associated links have been removed from the network.")
         else:
             print(f"Node ID {node_id} not found in the network.")
 
-    def get_node_p(self, node_name):
+    def restore_node(self, node_id):
         """
-        Get the IP address, port, and node ID for a given node name.
+        Restore a removed node and its links to nodes that are still in the network.
 
         Parameters:
-        node_name (str): The name of the node.
-
-        Returns:
-        tuple: A tuple containing the IP address, port, and node ID of the node.
+        node_id (int): The ID of the node to be restored.
         """
-        for node_id, node in self.nodes.items():
-            if node.name == node_name:
-                return node.ip_address, node.port, node.node_id
-        return None, None, None
+        if node_id in self.removed_nodes:
+            node = self.removed_nodes.pop(node_id)
+            self.nodes[node_id] = node
+            self.graph.add_node(node.name, node_type=node.node_type)
+            pending = []
+            for link in self.removed_links:
+                if link.source.node_id in self.nodes and link.destination.node_id in self.nodes:
+                    self.links.append(link)
+                    self.graph.add_edge(link.source.name, link.destination.name, weight=link.bandwidth,
+                                        bandwidth=link.bandwidth)
+                else:
+                    pending.append(link)
+            self.removed_links = pending
+            print(f"Node {node.name} and its associated links have been restored to the network.")
+        else:
+            print(f"Node ID {node_id} was not removed from the network.")
 
     def display_network(self):
         """
@@ -195,23 +228,70 @@ class Network:
         nx.draw_networkx_edge_labels(self.graph, pos, edge_labels=labels)
         plt.show()
 
+class Session:
+    """
+    The state of one client connection to the controller.
+    """
+
+    def __init__(self, client_socket, send_buffer_limit):
+        """
+        Initialize the session.
+
+        Parameters:
+        client_socket (socket): The socket connected to the client.
+        send_buffer_limit (int): The most bytes that may wait to be sent to the client.
+        """
+        self.client_socket = client_socket
+        self.send_buffer = SendBuffer(client_socket, send_buffer_limit)
+        # Sessions that never say hello keep the legacy unframed text replies
+        self.codec = None
+        self.node_id = None
+        self.reader = StreamBuffer(4096)
+
 class TCPServer:
     """
     A class to represent a TCP server.
     """
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, publisher, codecs=None, liveness=None, max_sessions=256, backlog=128,
+                 send_buffer_limit=1 << 20, write_timeout=5.0, writer=None, adaptive=None):
         """
         Initialize the server with a host address and port.
 
         Parameters:
         host (str): The host address for the server.
         port (int): The port number for the server.
+        publisher (SnapshotPublisher): The source of topology snapshots.
+        codecs (list): Codec names the server accepts for table transfers. Default is all supported codecs.
+        liveness (LivenessTracker): Tracks router heartbeats. Default is None, which removes a
+        node as soon as its session closes.
+        max_sessions (int): The most sessions served at once; extra connections are refused. Default is 256.
+        backlog (int): The listen backlog. Default is 128.
+        send_buffer_limit (int): The most bytes that may wait to be sent to one session. Default is 1 MiB.
+        write_timeout (float): Seconds a session may accept no data before it is dropped. Default is 5.0.
+        writer (SessionWriter): Sends the data queued for every session. Default is a new SessionWriter.
+        adaptive (AdaptiveRouting): Reroutes around links the routers report as hot. Default is None, which
+        routes on link capacity alone.
         """
         self.host = host
         self.port = port
+        self.publisher = publisher
+        self.liveness = liveness
+        self.adaptive = adaptive
+        self.codecs = SUPPORTED_CODECS if codecs is None else codecs
+        self.backlog = backlog
+        self.send_buffer_limit = send_buffer_limit
+        self.admission = threading.BoundedSemaphore(max_sessions)
+        self.writer = writer or SessionWriter(write_timeout)
         self.server_socket = None
         self.clients = []
+        REGISTRY.gauge('controller_active_sessions', 'Sessions currently served.', lambda: len(self.clients))
+        REGISTRY.gauge('controller_topology_nodes', 'Nodes in the current topology snapshot.',
+                       lambda: len(self.publisher.current.routing_tables))
+        REGISTRY.gauge('controller_topology_links', 'Links in the current topology snapshot.',
+                       lambda: self.publisher.current.link_count)
+        REGISTRY.gauge('controller_snapshot_version', 'Version of the current topology snapshot.',
+                       lambda: self.publisher.current.version)
 
     def start(self):
         """
@@ -219,14 +299,22 @@ class TCPServer:
         """
         # Create a TCP server socket
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # A restarted controller must not wait for the old sessions to leave TIME_WAIT
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         # Bind the socket to the address and port
         self.server_socket.bind((self.host, self.port))
         # Listen for incoming connections
-        self.server_socket.listen(10)
+        self.server_socket.listen(self.backlog)
+        self.writer.start()
         print(f"Server listening on {self.host}:{self.port}...")
         while True:
             # Accept a new connection
             client_socket, client_address = self.server_socket.accept()
+            if not self.admission.acquire(blocking=False):
+                # Refuse instead of queueing so an accept storm cannot exhaust threads
+                print(f"Refusing connection from {client_address}: session limit reached")
+                client_socket.close()
+                continue
             print(f"Connection established with {client_address}")
             # Add the client socket to the list of clients
             self.clients.append(client_socket)
@@ -245,58 +333,135 @@ class TCPServer:
                 client_socket (socket): The socket connected to the client.
                 """
 
-        node_remove = None
+        session = Session(client_socket, self.send_buffer_limit)
         try:
             while True:
                 # Receive data from the client
-                data = client_socket.recv(1024).decode()
-                if not data:
+                if not session.reader.recv_from(client_socket):
                     break
-
-                # Split the data
-                data_split = data.split("-")
-                if data_split[0] == 'data':
-                    # Process data
-                    client_ip = data_split[1]
-                    client_port = int(data_split[2])
-                    # node_rec = int(data_split[3])
-                    # node_cr = data_split[4]
-                    # Load routing tables from JSON file
-                    data_jsonH = read_json('HSF.json')
-                    data_jsonA = read_json('ASK.json')
-                    json_dataA = json.dumps(data_jsonA)
-                    ip_port_list = []
-
-                    for node_name, node_data in data_jsonH.items():
-                        ip_address = node_data.get('ip')
-                        port = node_data.get('port')
-                        ip_port_list.append((ip_address, port))
-                        if ip_address == client_ip and port == client_port:
-                            node_client = node_name
-                            node_remove = node_data.get('node_id')
-
-                    if (client_ip, client_port) in ip_port_list:
-                        client_table = data_jsonH[node_client]['routing_table']
-                        ip_table = {}
-                        for node_name, path in client_table.items():
-                            ip_table[node_name] = [data_jsonH[n]['port'] for n in path]
-
-                        table_send = json.dumps(ip_table)
-                        data_all = table_send + " - " + json_dataA
-                        client_socket.sendall(data_all.encode())
-
-                    else:
-                        print(f"No routing table found for node {client_socket.getpeername()}")
+                self.handle_received(session)
 
         except Exception as e:
             print(f"Error handling node: {e}")
 
         finally:
-            nsfnet.remove_node(node_remove)
-            nsfnet.compute_all_shortest_paths(nsfnet)
-            print(f"Node ID {node_remove} not found in the network.")
+            if session.node_id is not None:
+                if self.liveness is not None:
+                    # Hold the node down instead of removing it right away
+                    self.liveness.disconnected(session.node_id)
+                else:
+                    # The writer thread recomputes the routes; this thread does not wait for it
+                    self.publisher.remove_node(session.node_id)
+                    print(f"Scheduled removal of node ID {session.node_id}.")
             self.clients.remove(client_socket)
-            client_socket.close()
+            # The writer thread closes the socket once it stops watching it
+            self.writer.release(session.send_buffer)
+            self.admission.release()
+
+    def handle_data(self, session, data):
+        """
+        Handle bytes received from a client some other way than from its socket.
+
+        Parameters:
+        session (Session): The session the bytes arrived on.
+        data (bytes): The bytes received.
+        """
+        session.reader.feed(data)
+        self.handle_received(session)
+
+    def handle_received(self, session):
+        """
+        Handle every whole message waiting in a session's receive buffer.
+
+        Parameters:
+        session (Session): The session.
+        """
+        reader = session.reader
+        while reader:
+            # Messages end with a newline, whatever reads they arrive in
+            line = reader.read_line()
+            if line is None:
+                if session.codec is not None or reader.pending_startswith(HELLO):
+                    break
+                # Legacy sessions send one message per packet, without a newline
+                line = reader.read_rest()
+            message = line.decode(errors='replace').strip()
+            if message:
+                start = time.perf_counter()
+                self.handle_message(session, message)
+                message_type = message.split("-", 1)[0]
+                if message_type not in MESSAGE_TYPES:
+                    message_type = 'other'
+                REQUESTS.labels(message_type).inc()
+                REQUEST_SECONDS.labels(message_type).observe(time.perf_counter() - start)
+
+    def handle_message(self, session, data):
+        """
+        Handle one message received from a client.
+
+        Parameters:
+        session (Session): The session the message arrived on.
+        data (str): The message.
+        """
+        client_socket = session.client_socket
+        # Split the data
+        data_split = data.split("-")
+        if data_split[0] == 'hello':
+            # Negotiate the codec used for routing table transfers
+            offered = data_split[1].split(",") if len(data_split) > 1 else []
+            session.codec = negotiate_codec(offered, self.codecs, self.publisher.current.dictionary)
+            self.writer.send(session.send_buffer, encode_frame(f"codec-{session.codec.name}".encode()))
+            if session.codec.dictionary:
+                self.writer.send(session.send_buffer, encode_frame(session.codec.dictionary))
+            print(f"Negotiated codec {session.codec.name} with {client_socket.getpeername()}")
+
+        elif is_control(data_split):
+            self.writer.send(session.send_buffer, PROFILER.handle_control(data).encode())
+
+        elif data_split[0] == 'heartbeat':
+            if self.liveness is not None and session.node_id is not None:
+                self.liveness.heartbeat(session.node_id)
+
+        elif data_split[0] == 'telemetry':
+            if self.adaptive is not None and session.node_id is not None:
+                try:
+                    _, interval, links = parse_report(data)
+                except ValueError as e:
+                    print(f"Ignoring telemetry from node ID {session.node_id}: {e}")
+                    return
+                # Trust the session's node ID over the one in the report
+                self.adaptive.report(session.node_id, interval, links)
+
+        elif data_split[0] == 'data':
+            # Process data
+            client_ip = data_split[1]
+            client_port = int(data_split[2])
+            # node_rec = int(data_split[3])
+            # node_cr = data_split[4]
+            # Read the current snapshot; it never changes under us
+            snapshot = self.publisher.current
+            node_client = snapshot.node_for(client_ip, client_port)
+
+            if node_client is None:
+                print(f"No routing table found for node {client_socket.getpeername()}")
+                return
+            session.node_id = snapshot.node_ids[node_client]
+            withdrawn = node_client not in snapshot.routing_tables
+            if self.liveness is not None:
+                # A router withdrawn elsewhere, then failed over to this controller, is restored
+                self.liveness.heartbeat(session.node_id, withdrawn)
+            if withdrawn:
+                print(f"Node {node_client} is withdrawn; no routing table sent.")
+                return
+            with span('json_encode'):
+                data_all = snapshot.table_payload(node_client)
+            if session.codec is not None:
+                with span('compress'):
+                    data_all = encode_frame(session.codec.compress(data_all))
+            # A newer table replaces one the router has not started to receive yet
+            with span('sendall'):
+                self.writer.send(session.send_buffer, data_all, replaceable=True)
+            TABLE_BYTES.inc(len(data_all))
 
     def stop(self):
         """""
@@ -307,9 +472,13 @@ class TCPServer:
         for client_socket in self.clients:
             client_socket.close()
 
-# Example usage
-if __name__ == "__main__":
+def build_nsfnet():
+    """
+    Build the 14-node NSFNET topology.
 
+    Returns:
+    Network: The NSFNET network.
+    """
     nsfnet = Network()
     nsfnet.add_node(1, 'WA',  ip_address='192.168.1.10', port=8000)
     nsfnet.add_node(2, 'CA1', ip_address='192.168.1.11', port=8001)
@@ -343,11 +512,16 @@ if __name__ == "__main__":
         (14, 6, 3600), (14, 12, 600), (14, 13, 300)
     ]:
         nsfnet.add_link(*link)
+    return nsfnet
+
+# Example usage
+if __name__ == "__main__":
+
+    nsfnet = build_nsfnet()
 
     # display the network
     #nsfnet.display_network()
     nsfnet.visualize_network()
-    nsfnet.compute_all_shortest_paths(nsfnet)
 
 
     message = {
@@ -356,5 +530,17 @@ if __name__ == "__main__":
     # Write the example data to 'ASK.json'
     write_json(message, 'ASK.json')
 
-    server = TCPServer("localhost", 8888)
+    # Split the network into areas with area-local tables plus summaries
+    routing = HierarchicalRouting(nsfnet) if "--hierarchical" in sys.argv else None
+
+    # From here on only the publisher's writer thread touches nsfnet
+    publisher = SnapshotPublisher(nsfnet, message, 'HSF.json', routing)
+    # One timer wheel tracks the heartbeats of every router
+    wheel = TimerWheel(tick=0.1)
+    wheel.start()
+    liveness = LivenessTracker(wheel, publisher.remove_node, publisher.restore_node)
+    # Routers report link load with every heartbeat; hot links are routed around
+    adaptive = AdaptiveRouting(publisher) if "--adaptive" in sys.argv else None
+    server = TCPServer("localhost", 8888, publisher, liveness=liveness, adaptive=adaptive)
+    MetricsServer(REGISTRY, 'localhost', 9100).start()
     server.start()
\ No newline at end of file
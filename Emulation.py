@@ -0,0 +1,673 @@
+import collections
+import time
+from AsyncRouter import RouterProtocol, TCPClient, TCPServer as RouterServer
+from Compression import make_codec
+from Controler import Session, TCPServer as ControllerServer, build_nsfnet
+from Packet import decode_packet, encode_packet
+from Snapshot import SnapshotPublisher
+from StreamBuffer import StreamBuffer
+
+
+class Emulator:
+    """
+    A deterministic scheduler for in-memory channels.
+
+    Every write is delivered as a callback queued in order; running the queue
+    until it is empty replays the same deliveries in the same order every
+    time, with no sockets, threads or timers involved.
+    """
+
+    def __init__(self):
+        self.callbacks = collections.deque()
+
+    def call_soon(self, callback, *args):
+        """
+        Queue a callback.
+
+        Parameters:
+        callback (callable): The callback.
+        args: Its arguments.
+        """
+        self.callbacks.append((callback, args))
+
+    def run(self, limit=None):
+        """
+        Run queued callbacks, including those they queue, until none is left.
+
+        Parameters:
+        limit (int): The most callbacks to run. Default is no limit.
+
+        Returns:
+        int: The number of callbacks run.
+        """
+        callbacks = self.callbacks
+        count = 0
+        while callbacks and (limit is None or count < limit):
+            callback, args = callbacks.popleft()
+            callback(*args)
+            count += 1
+        return count
+
+
+class MemoryTransport:
+    """
+    One end of an in-memory stream, standing in for both an asyncio transport
+    and the socket calls the controller makes.
+
+    Bytes written on one end are copied and delivered to the protocol of the
+    other end by the emulator, exactly as they would arrive over TCP.
+    """
+
+    def __init__(self, emulator, protocol, peername):
+        """
+        Initialize the end.
+
+        Parameters:
+        emulator (Emulator): The scheduler delivering the bytes.
+        protocol: Receives the bytes arriving on this end, as an asyncio protocol would.
+        peername (tuple): The address reported for the other end.
+        """
+        self.emulator = emulator
+        self.protocol = protocol
+        self.peername = peername
+        self.peer = None
+        self.closing = False
+        self.paused = False
+        self.backlog = []
+
+    @staticmethod
+    def pair(emulator, protocol, peername, peer_protocol, peer_peername):
+        """
+        Connect two protocols with an in-memory stream.
+
+        Parameters:
+        emulator (Emulator): The scheduler delivering the bytes.
+        protocol: The protocol of the first end.
+        peername (tuple): The address the first end reports for the second.
+        peer_protocol: The protocol of the second end.
+        peer_peername (tuple): The address the second end reports for the first.
+
+        Returns:
+        tuple: The transports of the first and second ends.
+        """
+        transport = MemoryTransport(emulator, protocol, peername)
+        peer = MemoryTransport(emulator, peer_protocol, peer_peername)
+        transport.peer, peer.peer = peer, transport
+        return transport, peer
+
+    def write(self, data):
+        if not self.closing:
+            # Copy now: the caller may reuse a buffer it wrote a view of
+            self.emulator.call_soon(self.peer.feed, bytes(data))
+
+    def writelines(self, chunks):
+        self.write(b''.join(chunks))
+
+    def send(self, data, flags=0):
+        self.write(data)
+        return len(data)
+
+    def feed(self, data):
+        """
+        Deliver bytes that arrived on this end to its protocol.
+
+        Parameters:
+        data (bytes): The bytes.
+        """
+        if self.closing:
+            return
+        if self.paused:
+            self.backlog.append(data)
+            return
+        protocol = self.protocol
+        if not hasattr(protocol, 'get_buffer'):
+            protocol.data_received(data)
+            return
+        view = memoryview(data)
+        while view:
+            buffer = protocol.get_buffer(len(view))
+            size = min(len(buffer), len(view))
+            buffer[:size] = view[:size]
+            protocol.buffer_updated(size)
+            view = view[size:]
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+        backlog, self.backlog = self.backlog, []
+        for data in backlog:
+            self.emulator.call_soon(self.feed, data)
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.emulator.call_soon(self.protocol.connection_lost, None)
+        self.emulator.call_soon(self.peer.close)
+
+    def shutdown(self, how):
+        self.close()
+
+    def get_extra_info(self, name, default=None):
+        return self.peername if name == 'peername' else default
+
+    def getpeername(self):
+        return self.peername
+
+
+class MemoryWriter:
+    """
+    Stands in for the controller's SessionWriter: in-memory sockets accept
+    everything at once, so data is sent inline and no writer thread is needed.
+    """
+
+    def send(self, buffer, data, replaceable=False):
+        with buffer.lock:
+            if buffer.closed or not buffer.push(data, replaceable):
+                return False
+            buffer.flush()
+        return True
+
+    def release(self, buffer):
+        with buffer.lock:
+            buffer.closed = True
+            buffer.released = True
+        buffer.sock.close()
+
+
+class EmulatedPublisher(SnapshotPublisher):
+    """
+    A snapshot publisher that applies every mutation as it is submitted,
+    instead of on a writer thread, and writes no topology file.
+    """
+
+    def __init__(self, network, ask_data, routing=None):
+        """
+        Initialize the publisher and publish the first snapshot.
+
+        Parameters:
+        network (Network): The network owned by the publisher from now on.
+        ask_data (dict): The ASK message appended to every table.
+        routing (HierarchicalRouting): Builds the routing tables. Default is the flat tables of the network.
+        """
+        self.network = network
+        self.routing = routing if routing is not None else network
+        self.ask_data = ask_data
+        self.current = self.build_snapshot(1)
+
+    def submit(self, function, *args):
+        function(self.network, *args)
+        self.current = self.build_snapshot(self.current.version + 1)
+
+
+class ControllerSession:
+    """
+    The controller's end of a router's session: text arriving on it is handled
+    by the controller's TCPServer as if read from a socket.
+    """
+
+    def __init__(self, server):
+        """
+        Initialize the session.
+
+        Parameters:
+        server (Controler.TCPServer): The controller.
+        """
+        self.server = server
+        self.session = None
+
+    def data_received(self, data):
+        self.server.handle_data(self.session, data)
+
+    def connection_lost(self, exc):
+        self.server.writer.release(self.session.send_buffer)
+
+
+class ControllerLink:
+    """
+    The router's end of its controller session: negotiates the codec, asks for
+    the routing table and installs every table that arrives, as
+    TCPClient.connect_to_controller does over TCP.
+    """
+
+    def __init__(self, client):
+        """
+        Initialize the link.
+
+        Parameters:
+        client (AsyncRouter.TCPClient): The router's controller session.
+        """
+        self.client = client
+        self.transport = None
+        self.stream = StreamBuffer(4096)
+        self.codec_name = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(f"hello-{','.join(self.client.codecs)}\n".encode())
+
+    def request_table(self):
+        """
+        Ask the controller for the current routing table.
+        """
+        client = self.client
+        self.transport.write(f"data-{client.client_ip}-{client.client_port}-{client.node_id}\n".encode())
+
+    def data_received(self, data):
+        self.stream.feed(data)
+        frame = self.stream.read_frame()
+        while frame is not None:
+            self.handle_frame(frame)
+            frame = self.stream.read_frame()
+
+    def handle_frame(self, frame):
+        """
+        Handle one frame from the controller.
+
+        Parameters:
+        frame (bytes): The frame payload.
+        """
+        client = self.client
+        if client.codec is not None:
+            client.install_table(client.codec.decompress(frame).decode())
+        elif self.codec_name is None:
+            self.codec_name = frame.decode().split("-", 1)[1]
+            if self.codec_name != 'zdict':
+                client.codec = make_codec(self.codec_name, b'')
+                self.request_table()
+        else:
+            # The zdict codec sends its dictionary right after the reply
+            client.codec = make_codec(self.codec_name, frame)
+            self.request_table()
+
+    def connection_lost(self, exc):
+        pass
+
+
+class EmulatedLink:
+    """
+    The sending end of an in-memory connection to a neighbor router.
+    """
+
+    def __init__(self, port):
+        """
+        Initialize the link.
+
+        Parameters:
+        port (int): The port of the neighbor.
+        """
+        self.port = port
+        self.transport = None
+        self.sent = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        pass
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def send(self, *buffers, traffic_class=None):
+        if self.transport is None:
+            return False
+        self.transport.writelines(buffers)
+        self.sent += 1
+        return True
+
+    def congested(self):
+        return False
+
+    def on_drained(self, callback):
+        callback()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class EmulatedPool:
+    """
+    The neighbor connections of an emulated router, over in-memory streams.
+
+    Links are not shaped: every write is delivered in order as soon as the
+    emulator runs.
+    """
+
+    def __init__(self, emulation, local_port):
+        """
+        Initialize the pool.
+
+        Parameters:
+        emulation (Emulation): The emulated network.
+        local_port (int): The port of this router.
+        """
+        self.emulation = emulation
+        self.local_port = local_port
+        self.connections = {}
+        self.rates = {}
+
+    def get(self, port):
+        connection = self.connections.get(port)
+        if connection is None or connection.transport is None:
+            # Connect on first use, and again once a stopped neighbor is back
+            connection = self.connections[port] = EmulatedLink(port)
+            if self.emulation.connect(connection, port, self.local_port):
+                connection.send(f"neighbor-{self.local_port}\n".encode())
+        return connection
+
+    def send(self, port, *buffers, traffic_class=None):
+        return self.get(port).send(*buffers, traffic_class=traffic_class)
+
+    def shape(self, rates):
+        self.rates.update(rates)
+
+    def warm(self, ports):
+        for port in ports:
+            self.get(port)
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+
+
+class EmulatedHost:
+    """
+    A host attached to an emulated router, speaking the binary packet format.
+    """
+
+    def __init__(self, port):
+        """
+        Initialize the host.
+
+        Parameters:
+        port (int): The port of its router.
+        """
+        self.port = port
+        self.transport = None
+        self.stream = StreamBuffer()
+        self.received = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send_data(self, destination_port, data, **fields):
+        """
+        Send a packet through the router.
+
+        Parameters:
+        destination_port (int): The port of the destination router.
+        data (bytes): The payload.
+        fields: Extra header fields for encode_packet.
+        """
+        self.transport.write(encode_packet(destination_port, self.port, data, **fields))
+
+    def data_received(self, data):
+        self.stream.feed(data)
+        packet = self.stream.read_packet()
+        while packet is not None:
+            self.received.append(decode_packet(packet))
+            packet = self.stream.read_packet()
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+class DeliveryLog:
+    """
+    Records the deliveries of one emulated router instead of rendering them.
+    """
+
+    def __init__(self, emulation, port):
+        self.emulation = emulation
+        self.port = port
+
+    def submit(self, source):
+        self.emulation.deliveries.append((self.port, source))
+
+    def close(self):
+        pass
+
+
+class Emulation:
+    """
+    A whole network in one thread: the controller's TCPServer and every
+    router's forwarding logic, connected by in-memory streams instead of TCP.
+
+    The bytes on every stream are those the real components exchange, so the
+    controller and routers run unchanged; only sockets, threads and the event
+    loop are replaced by the deterministic Emulator.
+    """
+
+    def __init__(self, network, ask_data=None, routing=None):
+        """
+        Initialize the emulation. Nothing is connected until start().
+
+        Parameters:
+        network (Network): The network to emulate.
+        ask_data (dict): The ASK message appended to every table. Default is {"message": "ASK"}.
+        routing (HierarchicalRouting): Builds the routing tables. Default is the flat tables of the network.
+        """
+        self.emulator = Emulator()
+        self.publisher = EmulatedPublisher(network, ask_data or {"message": "ASK"}, routing)
+        self.controller = ControllerServer("emulated", 0, self.publisher, writer=MemoryWriter())
+        self.nodes = {node.node_id: node for node in network.nodes.values()}
+        self.clients = {}
+        self.servers = {}
+        self.links = {}
+        self.hosts = {}
+        # The router ends of the connections to every router, closed when it stops
+        self.transports = {}
+        # (router port, node name) of every delivery, in order
+        self.deliveries = []
+        for node_id in sorted(self.nodes):
+            self.create_router(self.nodes[node_id])
+
+    def create_router(self, node):
+        """
+        Create a router with no table, as a router process starts.
+
+        Parameters:
+        node (Node): The node the router serves.
+        """
+        client = TCPClient("emulated", 0, node.ip_address, node.port, node.node_id,
+                           pool=EmulatedPool(self, node.port))
+        self.clients[node.port] = client
+        self.servers[node.port] = RouterServer("emulated", node.port, client, visualizer=DeliveryLog(self, node.port))
+        self.transports[node.port] = []
+
+    def connect_controller(self, port):
+        """
+        Open a router's controller session.
+
+        Parameters:
+        port (int): The port of the router.
+        """
+        controller_session = ControllerSession(self.controller)
+        link = ControllerLink(self.clients[port])
+        link_transport, controller_transport = MemoryTransport.pair(
+            self.emulator, link, ("emulated", 0), controller_session, ("emulated", port))
+        controller_session.session = Session(controller_transport, self.controller.send_buffer_limit)
+        self.links[port] = link
+        link.connection_made(link_transport)
+
+    def stop_router(self, port):
+        """
+        Stop a router as if its process exited: every connection to or from it closes.
+
+        Parameters:
+        port (int): The port of the router.
+        """
+        self.links.pop(port).transport.close()
+        self.clients.pop(port).pool.close()
+        del self.servers[port]
+        for transport in self.transports.pop(port):
+            transport.close()
+        self.hosts.pop(port, None)
+        self.run()
+
+    def connect(self, protocol, port, local_port):
+        """
+        Open an in-memory connection to a router.
+
+        Parameters:
+        protocol: The protocol of the connecting end.
+        port (int): The port of the router.
+        local_port (int): The port reported for the connecting end.
+
+        Returns:
+        bool: False if no router listens on the port.
+        """
+        server = self.servers.get(port)
+        if server is None:
+            return False
+        router_protocol = RouterProtocol(server)
+        transport, router_transport = MemoryTransport.pair(self.emulator, protocol, ("emulated", port),
+                                                           router_protocol, ("emulated", local_port))
+        router_protocol.connection_made(router_transport)
+        protocol.connection_made(transport)
+        self.transports[port].append(router_transport)
+        return True
+
+    def start(self):
+        """
+        Connect every router to the controller and run until every table is installed.
+
+        Returns:
+        int: The number of deliveries run.
+        """
+        for port in self.clients:
+            self.connect_controller(port)
+        return self.run()
+
+    def refresh(self):
+        """
+        Make every router ask for its table again, as routers do periodically, and run until they have it.
+
+        Returns:
+        int: The number of deliveries run.
+        """
+        for link in self.links.values():
+            link.request_table()
+        return self.run()
+
+    def remove_node(self, node_id):
+        """
+        Stop a node's router, remove the node from the topology and give every other router its new table.
+
+        Parameters:
+        node_id (int): The ID of the node to be removed.
+        """
+        self.stop_router(self.nodes[node_id].port)
+        self.publisher.remove_node(node_id)
+        self.refresh()
+
+    def restore_node(self, node_id):
+        """
+        Restore a removed node, start a fresh router for it and give every router its new table.
+
+        Parameters:
+        node_id (int): The ID of the node to be restored.
+        """
+        node = self.nodes[node_id]
+        self.publisher.restore_node(node_id)
+        self.create_router(node)
+        self.connect_controller(node.port)
+        self.refresh()
+
+    def attach_host(self, port):
+        """
+        Attach a host to a router.
+
+        Parameters:
+        port (int): The port of the router.
+
+        Returns:
+        EmulatedHost: The host.
+        """
+        host = EmulatedHost(port)
+        if not self.connect(host, port, port):
+            raise ValueError(f"No router on port {port}")
+        return host
+
+    def check_all_pairs(self, payload=b"probe"):
+        """
+        Send a packet from a host on every running router to every other one.
+
+        Parameters:
+        payload (bytes): The payload of every packet. Default is b"probe".
+
+        Returns:
+        list: (source port, destination port) of every packet that did not arrive, sorted.
+        """
+        for port in self.servers:
+            host = self.hosts.get(port)
+            if host is None or host.transport is None:
+                host = self.hosts[port] = self.attach_host(port)
+                # The router learns its host from the first packet the host sends
+                host.send_data(port, b"register")
+        self.run()
+        for host in self.hosts.values():
+            host.received.clear()
+        for source, host in self.hosts.items():
+            for destination in self.hosts:
+                if destination != source:
+                    host.send_data(destination, payload)
+        self.run()
+        missing = set()
+        for destination, host in self.hosts.items():
+            arrived = {packet[2] for packet in host.received if packet[-1] == payload}
+            missing.update((source, destination) for source in self.hosts
+                           if source != destination and source not in arrived)
+        return sorted(missing)
+
+    def run(self, limit=None):
+        """
+        Deliver everything in flight.
+
+        Parameters:
+        limit (int): The most deliveries to run. Default is no limit.
+
+        Returns:
+        int: The number of deliveries run.
+        """
+        return self.emulator.run(limit)
+
+
+# Example usage
+if __name__ == "__main__":
+    import contextlib
+    import io
+
+    # A regression check of the whole topology: every pair of routers reaches each
+    # other, before and after a node fails and once it is back
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulation = Emulation(build_nsfnet())
+        emulation.start()
+        missing = emulation.check_all_pairs()
+    assert not missing, f"Undelivered with every node up: {missing}"
+    pairs = len(emulation.hosts) * (len(emulation.hosts) - 1)
+    print(f"{pairs} pairs delivered across {len(emulation.clients)} routers in "
+          f"{(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    # IL is a transit node on many shortest paths
+    removed = next(node.node_id for node in emulation.nodes.values() if node.name == 'IL')
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulation.remove_node(removed)
+        missing = emulation.check_all_pairs()
+    assert emulation.nodes[removed].port not in emulation.servers, "The removed node's router is still running"
+    assert not missing, f"Undelivered with IL removed: {missing}"
+    print(f"{len(emulation.hosts) * (len(emulation.hosts) - 1)} pairs delivered with IL removed")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        emulation.restore_node(removed)
+        missing = emulation.check_all_pairs()
+    assert not missing, f"Undelivered after IL was restored: {missing}"
+    print(f"{pairs} pairs delivered with IL restored in {(time.perf_counter() - start) * 1e3:.1f} ms total")
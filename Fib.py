@@ -0,0 +1,114 @@
+import json
+from types import MappingProxyType
+
+
+def area_key(area):
+    """
+    Get the routing table key of the summary route toward an area.
+
+    Parameters:
+    area (str): The area ID.
+
+    Returns:
+    str: The routing table key.
+    """
+    return f"area:{area}"
+
+
+def next_hop_port(path, local_port):
+    """
+    Find the hop after a router on a path.
+
+    Parameters:
+    path (list): The ports along the path.
+    local_port (int): The port of the router.
+
+    Returns:
+    int or None: The next hop port, or None if the path ends at the router.
+    """
+    next_hop_index = path.index(local_port) + 1 if local_port in path else 0
+    if next_hop_index < len(path):
+        return int(path[next_hop_index])
+    return None
+
+
+class ForwardingTable:
+    """
+    A forwarding information base compiled from a router's routing table.
+
+    Every destination port maps straight to its next hop, so forwarding a
+    message takes one dictionary lookup instead of a scan of every path. The
+    table is never modified once built; routers replace it as a whole when a
+    new routing table arrives, with one reference swap, so a packet is always
+    forwarded by one consistent version of the table.
+    """
+
+    def __init__(self, routing_table=None, local_port=None, area_ports=None, version=0, links=None, payload=None):
+        """
+        Compile the forwarding table.
+
+        Parameters:
+        routing_table (dict): The paths received from the controller, keyed by destination. Default is None.
+        local_port (int): The port of the router. Default is None.
+        area_ports (dict): The summary route key of every port in a remote area. Default is None.
+        version (int): The version of the table, increasing with every table the router installs. Default is 0.
+        links (dict): The bandwidth of the link to every neighbor port. Default is None.
+        payload (str): The controller payload the table was parsed from. Default is None.
+        """
+        routing_table = routing_table or {}
+        entries = {}
+        for indicator, path in routing_table.items():
+            if path:
+                # The first path ending at a port wins, as with a scan of the table
+                entries.setdefault(int(path[-1]), (indicator, next_hop_port(path, local_port)))
+        # Hierarchical tables only hold a summary route toward remote areas
+        for port, indicator in (area_ports or {}).items():
+            if port not in entries and routing_table.get(indicator):
+                entries[port] = (indicator, next_hop_port(routing_table[indicator], local_port))
+        self.local_port = local_port
+        self.version = version
+        self.payload = payload
+        self.routing_table = MappingProxyType(routing_table)
+        self.area_ports = MappingProxyType(dict(area_ports or {}))
+        self.links = MappingProxyType(dict(links or {}))
+        self.entries = MappingProxyType(entries)
+        # The neighbors traffic can be forwarded to
+        self.next_hops = frozenset(hop for _, hop in entries.values() if hop is not None)
+
+    @classmethod
+    def from_payload(cls, payload, local_port, version):
+        """
+        Parse a routing table payload from the controller and compile it.
+
+        Parameters:
+        payload (str): The decompressed payload.
+        local_port (int): The port of the router.
+        version (int): The version of the new table.
+
+        Returns:
+        ForwardingTable: The table.
+        """
+        json_parts = payload.split(' - ')
+        routing_table = json.loads(json_parts[0])
+        # Hierarchical tables carry the ports of every area as a third part
+        areas = json.loads(json_parts[2]) if len(json_parts) > 2 else None
+        links = json.loads(json_parts[3]) if len(json_parts) > 3 else {}
+        area_ports = {port: area_key(area) for area, ports in (areas or {}).items() for port in ports}
+        links = {int(port): bandwidth for port, bandwidth in links.items()}
+        return cls(routing_table, local_port, area_ports, version, links, payload)
+
+    def lookup(self, destination_port):
+        """
+        Look up the route toward a destination port.
+
+        Parameters:
+        destination_port (int): The destination port.
+
+        Returns:
+        tuple or None: The routing table key and the next hop port, which is None
+        if the destination is this router, or None if there is no route.
+        """
+        return self.entries.get(destination_port)
+
+    def __len__(self):
+        return len(self.entries)
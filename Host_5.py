@@ -1,11 +1,19 @@
+import itertools
+import os
 import socket
 import threading
+from Packet import decode_packet, encode_packet
+from QoS import INTERACTIVE
+from StreamBuffer import StreamBuffer
 
 class TCPClient:
     def __init__(self, server_host, server_port):
         self.server_host = server_host
         self.server_port = server_port
         self.client_socket = None
+        # One flow per host process, identified by its process ID; its packets are numbered from 1
+        self.flow = os.getpid()
+        self.sequence = itertools.count(1)
 
     def connect(self):
         """
@@ -18,29 +26,40 @@ class TCPClient:
         receive_thread = threading.Thread(target=self.receive_messages)
         receive_thread.start()
 
-    def send_data(self, data):
+    def send_data(self, destination_port, data, traffic_class=INTERACTIVE):
         """
-        Sends data to the server and waits for a response.
+        Sends data to a destination router as one packet.
 
         Parameters:
-        data (str): The data to be sent to the server.
+        destination_port (int): The port of the destination router.
+        data (str): The data to be sent.
+        traffic_class (int): The QoS traffic class. Default is INTERACTIVE.
 
         Returns:
-        str: The response received from the server.
+        int: The sequence number of the packet.
         """
-        self.client_socket.sendall(data.encode())
-        response = self.client_socket.recv(1024).decode()
-        return response
+        sequence = next(self.sequence)
+        packet = encode_packet(destination_port, self.server_port, data.encode(), self.flow, sequence,
+                               traffic_class=traffic_class)
+        self.client_socket.sendall(packet)
+        return sequence
 
     def receive_messages(self):
         """
         Continuously listens for messages from the server and prints them.
         """
+        reader = StreamBuffer()
         while True:
             try:
-                response = self.client_socket.recv(1024).decode()
-                if response:
-                    print(f"Received message from server: {response}")
+                if not reader.recv_from(self.client_socket):
+                    break
+                # One read may hold several packets, or only part of one
+                packet = reader.read_packet()
+                while packet is not None:
+                    traffic_class, destination, source, ttl, flow, sequence, payload = decode_packet(packet)
+                    print(f"Received message from {source} (flow {flow}, seq {sequence}, ttl {ttl}): "
+                          f"{payload.decode(errors='replace')}")
+                    packet = reader.read_packet()
             except Exception as e:
                 print(f"Error receiving data from server: {e}")
                 break
@@ -82,9 +101,8 @@ if __name__ == "__main__":
 
             if destination.lower() in destination_ports:
                 destination_port = destination_ports[destination.lower()]
-                message_send = f"{message}-{destination_port}-{client.server_port}-{destination.upper()}"
-                response = client.send_data(message_send)
-                print(response)
+                sequence = client.send_data(int(destination_port), message)
+                print(f"Sent packet {sequence} to {destination.upper()}")
             else:
                 print("Invalid host destination")
 
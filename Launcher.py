@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from Router import RouterRuntime, load_topology
+
+
+def serve_controller(build_network, port, filename, adaptive=False, metrics_port=None):
+    """
+    Serve the routing tables of a network. Runs in the controller process.
+
+    Parameters:
+    build_network (callable): Builds the Network to serve. None serves NSFNET.
+    port (int): The port of the controller.
+    filename (str): The topology file the controller writes.
+    adaptive (bool): Whether to route around links the routers report as hot. Default is False.
+    metrics_port (int): The port serving the controller's metrics. Default is None, which serves none.
+    """
+    from Controler import TCPServer, build_nsfnet
+    from Liveness import LivenessTracker
+    from Metrics import REGISTRY, MetricsServer
+    from Snapshot import SnapshotPublisher
+    from Telemetry import AdaptiveRouting
+    from TimerWheel import TimerWheel
+
+    network = (build_network or build_nsfnet)()
+    # Writes the topology file before the server listens, so a listening controller has a current file
+    publisher = SnapshotPublisher(network, {"message": "ASK"}, filename)
+    wheel = TimerWheel(tick=0.1)
+    wheel.start()
+    liveness = LivenessTracker(wheel, publisher.remove_node, publisher.restore_node)
+    # Every router holds one session, plus room for reconnects still being torn down
+    server = TCPServer("localhost", port, publisher, liveness=liveness,
+                       max_sessions=max(256, 2 * len(network.nodes)), backlog=1024,
+                       adaptive=AdaptiveRouting(publisher) if adaptive else None)
+    if metrics_port is not None:
+        MetricsServer(REGISTRY, 'localhost', metrics_port).start()
+    server.start()
+
+
+def serve_routers(routers, controller_port, barrier, ready_timeout, metrics_port=None):
+    """
+    Serve a share of the routers and report them ready. Runs in a router worker process.
+
+    Parameters:
+    routers (list): (name, ip, port, node_id) of every router of this worker.
+    controller_port (int): The port of the controller.
+    barrier (multiprocessing.Barrier): The readiness barrier shared with the launcher.
+    ready_timeout (float): Seconds to wait at the barrier.
+    metrics_port (int): The port serving the metrics of the worker's routers. Default is None, which serves none.
+    """
+    async def run():
+        runtime = RouterRuntime(routers, controller_port=controller_port, metrics_port=metrics_port)
+        task = asyncio.create_task(runtime.run())
+        await runtime.wait_ready()
+        # The barrier blocks, so it is waited on outside the event loop
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait, ready_timeout)
+        await task
+
+    asyncio.run(run())
+
+
+def attach_host(port, barrier, ready_timeout):
+    """
+    Attach a host to a router and print what it receives. Runs in a host process.
+    The router takes the connection as its host when it accepts it.
+
+    Parameters:
+    port (int): The port of the router.
+    barrier (multiprocessing.Barrier): The barrier shared with the launcher, passed once the host is connected.
+    ready_timeout (float): Seconds to wait at the barrier.
+    """
+    from Host_1 import TCPClient
+    client = TCPClient("localhost", port)
+    client.connect()
+    barrier.wait(ready_timeout)
+    # The receive thread runs until the router closes the connection
+    threading.Event().wait()
+
+
+def wait_for_port(host, port, timeout, process=None):
+    """
+    Wait until a server accepts connections.
+
+    Parameters:
+    host (str): The host address of the server.
+    port (int): The port of the server.
+    timeout (float): The longest wait in seconds.
+    process (multiprocessing.Process): The process of the server; the wait fails as soon as it exits. Default is None.
+
+    Raises:
+    TimeoutError: If the server does not accept connections in time.
+    RuntimeError: If the server process exits first.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return
+        except OSError:
+            if process is not None and not process.is_alive():
+                raise RuntimeError(f"Server for {host}:{port} exited with code {process.exitcode}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Nothing listening on {host}:{port} after {timeout:.0f}s")
+            time.sleep(0.02)
+
+
+class Launcher:
+    """
+    Brings up a whole network with one call: the controller, the routers and the hosts.
+
+    The controller starts first and writes the topology file. The routers it
+    lists are split across a pool of worker processes, each serving its share
+    on one event loop. The launcher waits on a barrier that every worker
+    reaches once all of its routers hold a table, so the network is ready the
+    moment it returns. Hosts are attached after that, and the launcher waits
+    until each is connected to its router.
+    """
+
+    def __init__(self, build_network=None, controller_port=8888, topology_file='HSF.json', workers=None,
+                 hosts=(), ready_timeout=60.0, adaptive=False, metrics_port=None):
+        """
+        Initialize the launcher.
+
+        Parameters:
+        build_network (callable): Builds the Network to serve; it must be picklable. Default is NSFNET.
+        controller_port (int): The port of the controller. Default is 8888.
+        topology_file (str): The topology file the controller writes. Default is 'HSF.json'.
+        workers (int): The number of router worker processes. Default is one per CPU.
+        hosts (list): The ports of the routers to attach a host to once the network is ready. Default is none.
+        ready_timeout (float): Seconds to wait for the network to be ready. Default is 60.0.
+        adaptive (bool): Whether the controller routes around links the routers report as hot. Default is False.
+        metrics_port (int): The controller serves its metrics on this port and router worker N on the port
+        N + 1 above it. Default is None, which serves none.
+        """
+        self.build_network = build_network
+        self.controller_port = controller_port
+        self.topology_file = topology_file
+        self.workers = workers or os.cpu_count() or 1
+        self.hosts = hosts
+        self.ready_timeout = ready_timeout
+        self.adaptive = adaptive
+        self.metrics_port = metrics_port
+        # Children start clean instead of inheriting the launcher's threads and sockets
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = []
+        self.routers = []
+
+    def spawn(self, target, *args):
+        """
+        Start a process. Router workers start visualization workers of their own, so none is a daemon.
+
+        Parameters:
+        target (callable): The function the process runs.
+        args: Its arguments.
+        """
+        process = self.context.Process(target=target, args=args)
+        process.start()
+        self.processes.append(process)
+
+    def start(self):
+        """
+        Start the network and wait until every router holds a table and every host is attached.
+
+        Returns:
+        float: The time to ready in seconds.
+
+        Raises:
+        TimeoutError: If the network is not ready or the hosts are not attached within ready_timeout.
+        RuntimeError: If the controller exits before it listens.
+        """
+        start = time.perf_counter()
+        self.spawn(serve_controller, self.build_network, self.controller_port, self.topology_file,
+                   self.adaptive, self.metrics_port)
+        try:
+            wait_for_port("localhost", self.controller_port, self.ready_timeout, self.processes[0])
+        except (TimeoutError, RuntimeError):
+            self.stop()
+            raise
+        controller_ready = time.perf_counter() - start
+
+        self.routers = load_topology(self.topology_file)
+        workers = min(self.workers, len(self.routers))
+        barrier = self.context.Barrier(workers + 1)
+        for index in range(workers):
+            share = self.routers[index * len(self.routers) // workers:(index + 1) * len(self.routers) // workers]
+            metrics_port = self.metrics_port + index + 1 if self.metrics_port is not None else None
+            self.spawn(serve_routers, share, self.controller_port, barrier, self.ready_timeout, metrics_port)
+        try:
+            barrier.wait(max(0.0, self.ready_timeout - controller_ready))
+        except threading.BrokenBarrierError:
+            self.stop()
+            raise TimeoutError(f"Network not ready after {self.ready_timeout:.0f}s")
+        ready = time.perf_counter() - start
+
+        if self.hosts:
+            # Packets sent once start returns reach every attached host
+            barrier = self.context.Barrier(len(self.hosts) + 1)
+            for port in self.hosts:
+                self.spawn(attach_host, port, barrier, self.ready_timeout)
+            try:
+                barrier.wait(self.ready_timeout)
+            except threading.BrokenBarrierError:
+                self.stop()
+                raise TimeoutError(f"Hosts not attached after {self.ready_timeout:.0f}s")
+        print(f"Controller ready in {controller_ready:.2f}s, {len(self.routers)} router(s) on {workers} "
+              f"worker(s) ready in {ready:.2f}s")
+        return ready
+
+    def stop(self):
+        """
+        Stop every process of the network.
+        """
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+
+# Example usage
+if __name__ == "__main__":
+    # python Launcher.py [workers] [host_port,host_port,...]
+    worker_count = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    host_ports = [int(port) for port in sys.argv[2].split(",")] if len(sys.argv) > 2 else [8000, 8013]
+    launcher = Launcher(workers=worker_count, hosts=host_ports, metrics_port=9100)
+    launcher.start()
+    try:
+        for process in launcher.processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
@@ -0,0 +1,220 @@
+import math
+import threading
+import time
+
+UP = 'up'
+HOLD = 'hold'
+DOWN = 'down'
+SUPPRESSED = 'suppressed'
+
+
+class NodeLiveness:
+    """
+    The liveness state of one router.
+    """
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.state = UP
+        self.heartbeats = 0
+        self.misses = 0
+        self.penalty = 0.0
+        self.penalty_time = time.monotonic()
+        self.check_timer = None
+        self.hold_timer = None
+        self.reuse_timer = None
+
+
+class LivenessTracker:
+    """
+    Track router liveness from heartbeats using a shared TimerWheel.
+
+    A router that misses `miss_threshold` heartbeat intervals, or whose session
+    closes, is held down for `hold_down` seconds before it is withdrawn, so a
+    brief reconnect does not change the topology. Every withdrawal adds a flap
+    penalty that decays with `half_life`; a router whose penalty exceeds
+    `suppress_limit` stays withdrawn until the penalty decays below `reuse_limit`.
+    """
+
+    def __init__(self, wheel, on_down, on_up, interval=1.0, miss_threshold=3, hold_down=5.0,
+                 flap_penalty=1000.0, suppress_limit=2000.0, reuse_limit=750.0, half_life=60.0):
+        """
+        Initialize the tracker.
+
+        Parameters:
+        wheel (TimerWheel): The wheel that drives every liveness timer.
+        on_down (callable): Called with a node ID when the router is withdrawn.
+        on_up (callable): Called with a node ID when a withdrawn router is restored.
+        interval (float): The expected heartbeat interval in seconds. Default is 1.0.
+        miss_threshold (int): Missed intervals before a router is held down. Default is 3.
+        hold_down (float): Seconds a router is held down before it is withdrawn. Default is 5.0.
+        flap_penalty (float): Penalty added on every withdrawal. Default is 1000.0.
+        suppress_limit (float): Penalty above which a returning router stays withdrawn. Default is 2000.0.
+        reuse_limit (float): Penalty below which a suppressed router is restored. Default is 750.0.
+        half_life (float): Seconds for the penalty to decay by half. Default is 60.0.
+        """
+        self.wheel = wheel
+        self.on_down = on_down
+        self.on_up = on_up
+        self.interval = interval
+        self.miss_threshold = miss_threshold
+        self.hold_down = hold_down
+        self.flap_penalty = flap_penalty
+        self.suppress_limit = suppress_limit
+        self.reuse_limit = reuse_limit
+        self.half_life = half_life
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def decayed_penalty(self, liveness):
+        """
+        Decay a router's flap penalty to the current time.
+
+        Parameters:
+        liveness (NodeLiveness): The router state.
+
+        Returns:
+        float: The current penalty.
+        """
+        now = time.monotonic()
+        liveness.penalty *= math.pow(0.5, (now - liveness.penalty_time) / self.half_life)
+        liveness.penalty_time = now
+        return liveness.penalty
+
+    def heartbeat(self, node_id, withdrawn=False):
+        """
+        Record a heartbeat from a router.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        withdrawn (bool): Whether the current topology lacks the router. A router this tracker has
+        not seen yet is then taken to be coming back, as when another controller withdrew it. Default is False.
+        """
+        restored = False
+        with self.lock:
+            liveness = self.nodes.get(node_id)
+            if liveness is None:
+                liveness = self.nodes[node_id] = NodeLiveness(node_id)
+                if withdrawn:
+                    liveness.state = DOWN
+                liveness.check_timer = self.wheel.schedule(self.interval, self.check, node_id)
+            liveness.heartbeats += 1
+            liveness.misses = 0
+            if liveness.state == HOLD:
+                # Back before the hold-down expired; the topology never changed
+                liveness.hold_timer.cancel()
+                liveness.state = UP
+            elif liveness.state == DOWN:
+                if self.decayed_penalty(liveness) < self.suppress_limit:
+                    liveness.state = UP
+                    restored = True
+                else:
+                    liveness.state = SUPPRESSED
+                    self.schedule_reuse(liveness)
+            if liveness.check_timer is None:
+                liveness.check_timer = self.wheel.schedule(self.interval, self.check, node_id)
+        if restored:
+            print(f"Node ID {node_id} is alive again.")
+            self.on_up(node_id)
+
+    def disconnected(self, node_id):
+        """
+        Record that a router's session closed.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        """
+        with self.lock:
+            liveness = self.nodes.get(node_id)
+            if liveness is not None and liveness.state == UP:
+                self.hold(liveness)
+
+    def check(self, node_id):
+        """
+        Count a missed interval if no heartbeat arrived since the last check.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        """
+        with self.lock:
+            liveness = self.nodes[node_id]
+            liveness.check_timer = None
+            if liveness.heartbeats:
+                liveness.heartbeats = 0
+            else:
+                liveness.misses += 1
+            if liveness.state == UP and liveness.misses >= self.miss_threshold:
+                self.hold(liveness)
+            if liveness.state in (UP, HOLD):
+                liveness.check_timer = self.wheel.schedule(self.interval, self.check, node_id)
+
+    def hold(self, liveness):
+        """
+        Hold a router down before withdrawing it. Must be called with the lock held.
+
+        Parameters:
+        liveness (NodeLiveness): The router state.
+        """
+        liveness.state = HOLD
+        liveness.hold_timer = self.wheel.schedule(self.hold_down, self.withdraw, liveness.node_id)
+        print(f"Node ID {liveness.node_id} is unresponsive; holding down for {self.hold_down}s.")
+
+    def withdraw(self, node_id):
+        """
+        Withdraw a router whose hold-down expired.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        """
+        with self.lock:
+            liveness = self.nodes[node_id]
+            if liveness.state != HOLD:
+                return
+            liveness.state = DOWN
+            if liveness.check_timer is not None:
+                liveness.check_timer.cancel()
+                liveness.check_timer = None
+            self.decayed_penalty(liveness)
+            liveness.penalty += self.flap_penalty
+        print(f"Node ID {node_id} is down.")
+        self.on_down(node_id)
+
+    def schedule_reuse(self, liveness):
+        """
+        Schedule the restore of a suppressed router. Must be called with the lock held.
+
+        Parameters:
+        liveness (NodeLiveness): The router state.
+        """
+        delay = self.half_life * math.log2(liveness.penalty / self.reuse_limit)
+        liveness.reuse_timer = self.wheel.schedule(delay, self.reuse, liveness.node_id)
+        print(f"Node ID {liveness.node_id} is flapping; suppressed for {delay:.1f}s.")
+
+    def reuse(self, node_id):
+        """
+        Restore a suppressed router if it is still sending heartbeats.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        """
+        with self.lock:
+            liveness = self.nodes[node_id]
+            if liveness.state != SUPPRESSED:
+                return
+            # Treat the router as withdrawn; its next heartbeat restores it
+            self.decayed_penalty(liveness)
+            liveness.state = DOWN
+            liveness.heartbeats = 0
+
+    def state(self, node_id):
+        """
+        Get the liveness state of a router.
+
+        Parameters:
+        node_id (int): The ID of the router.
+
+        Returns:
+        str or None: The state, or None if the router never sent a heartbeat.
+        """
+        liveness = self.nodes.get(node_id)
+        return liveness.state if liveness is not None else None
@@ -0,0 +1,303 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(label_names, label_values, extra=()):
+    """
+    Format Prometheus labels.
+
+    Parameters:
+    label_names (tuple): The label names.
+    label_values (tuple): The label values.
+    extra (tuple): Extra (name, value) pairs. Default is ().
+
+    Returns:
+    str: The label set, or '' if there are no labels.
+    """
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """
+    A monotonically increasing counter.
+
+    Every thread adds to its own shard, so increments take no lock and are
+    never lost; a scrape sums the shards.
+    """
+
+    def __init__(self):
+        self.shards = {}
+
+    def inc(self, amount=1):
+        """
+        Increase the counter.
+
+        Parameters:
+        amount (float): The amount to add. Default is 1.
+        """
+        ident = threading.get_ident()
+        shards = self.shards
+        shards[ident] = shards.get(ident, 0) + amount
+
+    def value(self):
+        """
+        Get the counter value.
+
+        Returns:
+        float: The sum of every shard.
+        """
+        return sum(list(self.shards.values()))
+
+
+class Histogram:
+    """
+    A histogram of observed values with fixed buckets, sharded per thread like Counter.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the histogram.
+
+        Parameters:
+        buckets (tuple): The upper bounds of the buckets. Default is DEFAULT_BUCKETS.
+        """
+        self.buckets = tuple(buckets)
+        self.shards = {}
+
+    def observe(self, value):
+        """
+        Record one observation.
+
+        Parameters:
+        value (float): The observed value.
+        """
+        ident = threading.get_ident()
+        shard = self.shards.get(ident)
+        if shard is None:
+            # Bucket counts, followed by the sum of the observations
+            shard = self.shards[ident] = [0] * (len(self.buckets) + 2)
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """
+        Merge the shards.
+
+        Returns:
+        tuple: The cumulative bucket counts, the total count and the sum.
+        """
+        merged = [0] * (len(self.buckets) + 2)
+        for shard in list(self.shards.values()):
+            for index, value in enumerate(shard):
+                merged[index] += value
+        cumulative = []
+        total = 0
+        for count in merged[:len(self.buckets)]:
+            total += count
+            cumulative.append(total)
+        return cumulative, total + merged[len(self.buckets)], merged[-1]
+
+
+class Metric:
+    """
+    A named metric family, with one child per combination of label values.
+    """
+
+    def __init__(self, kind, name, help_text, label_names, factory):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.factory = factory
+        self.children = {}
+        if not self.label_names:
+            self.children[()] = factory()
+
+    def labels(self, *label_values):
+        """
+        Get the child metric for a combination of label values.
+
+        Parameters:
+        label_values: One value per label name.
+
+        Returns:
+        Counter or Histogram: The child metric.
+        """
+        child = self.children.get(label_values)
+        if child is None:
+            child = self.children.setdefault(label_values, self.factory())
+        return child
+
+    def __getattr__(self, attribute):
+        # Unlabelled metrics forward inc/observe to their only child
+        child = self.__dict__.get('children', {}).get(())
+        if child is None:
+            raise AttributeError(f"{type(self).__name__} {self.__dict__.get('name')!r} has no attribute {attribute!r}; "
+                                 f"labelled metrics are updated through labels()")
+        return getattr(child, attribute)
+
+    def render(self):
+        """
+        Render the metric family in the Prometheus text format.
+
+        Returns:
+        list: The lines of the family.
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, child in sorted(self.children.items()):
+            if self.kind == 'counter':
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {child.value()}")
+            else:
+                cumulative, total, value_sum = child.snapshot()
+                for bound, count in zip(child.buckets, cumulative):
+                    labels = format_labels(self.label_names, label_values, [('le', bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.label_names, label_values, [('le', '+Inf')])
+                lines.append(f"{self.name}_bucket{labels} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, label_values)} {total}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, label_values)} {value_sum}")
+        return lines
+
+
+class Gauge:
+    """
+    A gauge whose value is computed by a callback when the metrics are scraped.
+    """
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics rendered together.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text, label_names=()):
+        """
+        Register a counter.
+
+        Parameters:
+        name (str): The metric name.
+        help_text (str): The metric description.
+        label_names (tuple): The label names. Default is ().
+
+        Returns:
+        Metric: The counter family.
+        """
+        return self.metrics.setdefault(name, Metric('counter', name, help_text, label_names, Counter))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        Register a histogram.
+
+        Parameters:
+        name (str): The metric name.
+        help_text (str): The metric description.
+        label_names (tuple): The label names. Default is ().
+        buckets (tuple): The upper bounds of the buckets. Default is DEFAULT_BUCKETS.
+
+        Returns:
+        Metric: The histogram family.
+        """
+        return self.metrics.setdefault(name, Metric('histogram', name, help_text, label_names,
+                                                    lambda: Histogram(buckets)))
+
+    def gauge(self, name, help_text, function):
+        """
+        Register a gauge, replacing any gauge with the same name.
+
+        Parameters:
+        name (str): The metric name.
+        help_text (str): The metric description.
+        function (callable): Returns the current value.
+        """
+        self.metrics[name] = Gauge(name, help_text, function)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+        str: The exposition text.
+        """
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registry shared by the controller modules
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    A local HTTP endpoint serving a registry in the Prometheus text format.
+    """
+
+    def __init__(self, registry=REGISTRY, host='localhost', port=9100):
+        """
+        Initialize the server.
+
+        Parameters:
+        registry (MetricsRegistry): The metrics to serve. Default is REGISTRY.
+        host (str): The host address for the endpoint. Default is 'localhost'.
+        port (int): The port number for the endpoint. Default is 9100.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.http_server = None
+
+    def start(self):
+        """
+        Serve /metrics from a background thread.
+        """
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """
+        Stop the endpoint.
+        """
+        if self.http_server:
+            self.http_server.shutdown()
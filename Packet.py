@@ -0,0 +1,96 @@
+import struct
+from QoS import BEST_EFFORT
+
+# Marks the start of every data packet; text lines never start with it
+MAGIC = 0xA5
+
+# Magic, traffic class, destination ID, source ID, TTL, flow ID, sequence number, payload length
+HEADER = struct.Struct('!BBHHBIIH')
+HEADER_SIZE = HEADER.size
+
+# Offsets of the fields routers read or rewrite in place
+CLASS_OFFSET = 1
+DESTINATION_OFFSET = 2
+TTL_OFFSET = 6
+LENGTH_OFFSET = 15
+
+# Hops a packet may take before routers drop it
+DEFAULT_TTL = 64
+
+# The largest payload the length field can describe
+MAX_PAYLOAD = 0xFFFF
+
+
+def encode_packet(destination, source, payload, flow=0, sequence=0, ttl=DEFAULT_TTL, traffic_class=BEST_EFFORT):
+    """
+    Build a data packet.
+
+    Parameters:
+    destination (int): The ID of the destination router, which is its port.
+    source (int): The ID of the source router, which is its port.
+    payload (bytes): The payload.
+    flow (int): The flow ID. Default is 0.
+    sequence (int): The sequence number within the flow. Default is 0.
+    ttl (int): The hops the packet may take. Default is 64.
+    traffic_class (int): The QoS traffic class. Default is BEST_EFFORT.
+
+    Returns:
+    bytes: The packet.
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    return HEADER.pack(MAGIC, traffic_class, destination, source, ttl, flow, sequence, len(payload)) + payload
+
+
+def decode_packet(packet):
+    """
+    Split a data packet into its header fields and payload.
+
+    Parameters:
+    packet (bytes): The packet.
+
+    Returns:
+    tuple: The traffic class, destination, source, TTL, flow ID, sequence number and payload.
+    """
+    magic, traffic_class, destination, source, ttl, flow, sequence, length = HEADER.unpack_from(packet)
+    if magic != MAGIC:
+        raise ValueError(f"Not a data packet: {bytes(packet[:HEADER_SIZE])!r}")
+    return traffic_class, destination, source, ttl, flow, sequence, bytes(packet[HEADER_SIZE:HEADER_SIZE + length])
+
+
+def packet_size(buffer, start, end):
+    """
+    Find the size of the packet at an offset of a receive buffer.
+
+    Parameters:
+    buffer (bytearray): The receive buffer.
+    start (int): The offset of the packet.
+    end (int): The offset just past the received bytes.
+
+    Returns:
+    int or None: The size of the packet, or None until its header has been received.
+    """
+    if end - start < HEADER_SIZE:
+        return None
+    return HEADER_SIZE + (buffer[start + LENGTH_OFFSET] << 8 | buffer[start + LENGTH_OFFSET + 1])
+
+
+def destination_of(buffer, start):
+    """
+    Read the destination ID of the packet at an offset of a receive buffer.
+
+    Parameters:
+    buffer (bytearray): The receive buffer.
+    start (int): The offset of the packet.
+
+    Returns:
+    int: The destination ID.
+    """
+    return buffer[start + DESTINATION_OFFSET] << 8 | buffer[start + DESTINATION_OFFSET + 1]
+
+
+# Example usage
+if __name__ == "__main__":
+    packet = encode_packet(8013, 8000, b"hello", flow=7, sequence=1)
+    print(f"{len(packet)} bytes: {packet!r}")
+    print(decode_packet(packet))
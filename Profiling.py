@@ -0,0 +1,257 @@
+import cProfile
+import io
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from Metrics import REGISTRY
+
+# Profiles are only ever written here, whatever name a control message asks for
+PROFILE_DIRECTORY = 'profiles'
+
+SPAN_SECONDS = REGISTRY.histogram('profile_span_seconds', 'Time spent in named profiling spans.', ('span',))
+
+
+class NullSpan:
+    """
+    The span used while profiling is off; entering and leaving it does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """
+    A named timing span, optionally profiled with cProfile.
+    """
+    __slots__ = ('profiler', 'name', 'start', 'profiled')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.profiled = False
+
+    def __enter__(self):
+        # A span that enabled cProfile disables it on exit, even if profiling stopped in between
+        self.profiled = self.profiler.cprofile
+        if self.profiled:
+            self.profiler.enter_cprofile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        SPAN_SECONDS.labels(self.name).observe(time.perf_counter() - self.start)
+        if self.profiled:
+            self.profiler.exit_cprofile()
+        return False
+
+
+class Profiler:
+    """
+    Named timing spans around hot paths, with cProfile and tracemalloc capture
+    that can be switched on and off at runtime.
+
+    cProfile runs only inside spans, with one profile per thread, so every
+    handler thread is covered; the profiles are merged when dumped. A thread
+    hands its profile back, disabled, when its outermost span ends, and a
+    dump takes only the profiles handed back; a thread whose profile was
+    dumped starts a new one.
+    """
+
+    def __init__(self, directory=PROFILE_DIRECTORY):
+        self.directory = directory
+        self.enabled = False
+        self.cprofile = False
+        # The disabled profiles of threads outside any span
+        self.profiles = set()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        """
+        Get a context manager timing a named span.
+
+        Parameters:
+        name (str): The span name.
+
+        Returns:
+        Span or NullSpan: The span, or a no-op span while profiling is off.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def enter_cprofile(self):
+        """
+        Take back and enable this thread's cProfile when the outermost span starts.
+        """
+        local = self.local
+        depth = getattr(local, 'depth', 0)
+        if depth == 0:
+            profile = getattr(local, 'profile', None)
+            with self.lock:
+                if profile in self.profiles:
+                    self.profiles.remove(profile)
+                else:
+                    # The first span of this thread, or its profile was dumped
+                    profile = local.profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler already owns this thread
+                pass
+        local.depth = depth + 1
+
+    def exit_cprofile(self):
+        """
+        Disable this thread's cProfile and hand it back for the next dump when the outermost span ends.
+        """
+        local = self.local
+        local.depth = getattr(local, 'depth', 1) - 1
+        if local.depth == 0 and getattr(local, 'profile', None) is not None:
+            local.profile.disable()
+            with self.lock:
+                self.profiles.add(local.profile)
+
+    def start(self, cprofile=True, memory=True):
+        """
+        Start capturing.
+
+        Parameters:
+        cprofile (bool): Whether to run cProfile inside spans. Default is True.
+        memory (bool): Whether to trace allocations with tracemalloc. Default is True.
+        """
+        self.cprofile = cprofile
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self.enabled = True
+        print(f"Profiling started (cProfile={cprofile}, tracemalloc={memory})")
+
+    def stop(self):
+        """
+        Stop capturing. Captured data is kept until the next dump.
+        """
+        self.enabled = False
+        self.cprofile = False
+        print("Profiling stopped")
+
+    def dump(self, filename=None):
+        """
+        Write the span timings, cProfile statistics and top allocations to a file
+        in the profile directory.
+
+        Parameters:
+        filename (str): The name of the output file, without a directory. Default is profile-<pid>.txt.
+
+        Returns:
+        str: The path of the file written.
+
+        Raises:
+        ValueError: If the name is not a plain file name.
+        """
+        filename = filename or f"profile-{os.getpid()}.txt"
+        # The name may come from the network, so it must not leave the profile directory
+        if os.path.basename(filename) != filename or filename in ('.', '..'):
+            raise ValueError(f"Profile name must be a plain file name: {filename!r}")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, filename)
+        output = io.StringIO()
+        output.write("Spans:\n")
+        for (name,), histogram in sorted(SPAN_SECONDS.children.items()):
+            _, count, total = histogram.snapshot()
+            if count:
+                output.write(f"  {name:<32}{count:>10} calls {total * 1e3:>12.3f} ms {total / count * 1e6:>12.1f} us/call\n")
+        # Profiles still running are handed back at the end of their span and go into the next dump
+        with self.lock:
+            profiles, self.profiles = self.profiles, set()
+        stats = None
+        for profile in profiles:
+            try:
+                profile.create_stats()
+            except Exception:
+                continue
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile, stream=output)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            output.write("\ncProfile:\n")
+            stats.sort_stats('cumulative').print_stats(40)
+        if tracemalloc.is_tracing():
+            output.write("\ntracemalloc:\n")
+            for statistic in tracemalloc.take_snapshot().statistics('lineno')[:25]:
+                output.write(f"  {statistic}\n")
+            if not self.enabled:
+                tracemalloc.stop()
+        with open(path, 'w') as file:
+            file.write(output.getvalue())
+        print(f"Profile written to {path}")
+        return path
+
+    def handle_control(self, data):
+        """
+        Apply a profiling control message.
+
+        Parameters:
+        data (str): 'profile-start[-cprofile,tracemalloc]', 'profile-stop' or 'profile-dump[-filename]'.
+
+        Returns:
+        str: The reply for the sender.
+        """
+        data_split = data.strip().split("-", 2)
+        command = data_split[1] if len(data_split) > 1 else ''
+        if command == 'start':
+            options = data_split[2].split(",") if len(data_split) > 2 else ['cprofile', 'tracemalloc']
+            self.start('cprofile' in options, 'tracemalloc' in options)
+            return "profile-started"
+        if command == 'stop':
+            self.stop()
+            return "profile-stopped"
+        if command == 'dump':
+            try:
+                return f"profile-dumped-{self.dump(data_split[2] if len(data_split) > 2 else None)}"
+            except ValueError as e:
+                return f"profile-rejected-{e}"
+        return f"profile-unknown-{command}"
+
+
+def is_control(data_split):
+    """
+    Check whether a split message is a profiling control message.
+
+    Parameters:
+    data_split (list): The message split on '-'.
+
+    Returns:
+    bool: True for profiling control messages.
+    """
+    return data_split[0] == 'profile' and len(data_split) > 1 and data_split[1] in ('start', 'stop', 'dump')
+
+
+# Profiler shared by every module in the process
+PROFILER = Profiler()
+span = PROFILER.span
+
+
+# Example usage
+if __name__ == "__main__":
+    # python Profiling.py <port> start|stop|dump [options]
+    port, command = int(sys.argv[1]), sys.argv[2]
+    message = "-".join(["profile", command] + sys.argv[3:4])
+    with socket.create_connection(("localhost", port)) as control_socket:
+        control_socket.sendall(message.encode())
+        control_socket.settimeout(5)
+        print(control_socket.recv(1024).decode())
@@ -0,0 +1,38 @@
+import asyncio
+import struct
+
+# Length prefix used for every framed message on a negotiated session
+FRAME_HEADER = struct.Struct('!I')
+
+
+def encode_frame(payload):
+    """
+    Encode a payload as a length-prefixed frame.
+
+    Parameters:
+    payload (bytes): The frame payload.
+
+    Returns:
+    bytes: The frame.
+    """
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """
+    Read one length-prefixed frame from an asyncio stream.
+
+    Parameters:
+    reader (asyncio.StreamReader): The stream reader.
+
+    Returns:
+    bytes or None: The frame payload, or None if the peer closed the connection.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (length,) = FRAME_HEADER.unpack(header)
+        if length == 0:
+            return b''
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
@@ -0,0 +1,149 @@
+import collections
+
+# Traffic classes carried in the packet header
+CONTROL = 0
+INTERACTIVE = 1
+BEST_EFFORT = 2
+BULK = 3
+
+CLASS_NAMES = {CONTROL: 'control', INTERACTIVE: 'interactive', BEST_EFFORT: 'best-effort', BULK: 'bulk'}
+
+# Classes served before any other, in this order
+STRICT_CLASSES = (CONTROL,)
+
+# The share of the link each remaining class gets while all of them are backlogged
+DEFAULT_WEIGHTS = {INTERACTIVE: 4, BEST_EFFORT: 2, BULK: 1}
+
+
+class DeficitRoundRobin:
+    """
+    Per-class egress queues served by deficit round robin.
+
+    Strict-priority classes are always served first. The others take turns,
+    each sending up to its quantum of bytes per turn plus whatever it could not
+    use on its last turn, so backlogged classes share the link in proportion to
+    their weights whatever the size of their messages: the O(1) approximation
+    of weighted fair queueing. A class that is not backlogged gives up its turn
+    and its deficit, so latency-sensitive traffic never waits behind a bulk
+    queue for more than one turn.
+    """
+
+    def __init__(self, weights=None, quantum=1500, strict_classes=STRICT_CLASSES):
+        """
+        Initialize the scheduler.
+
+        Parameters:
+        weights (dict): The weight of every round-robin class. Default is DEFAULT_WEIGHTS.
+        quantum (int): The bytes a class of weight 1 may send per turn. Default is 1500.
+        strict_classes (tuple): The classes served first, highest priority first. Default is (CONTROL,).
+        """
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        class_count = max(list(weights) + list(strict_classes)) + 1
+        self.queues = [collections.deque() for _ in range(class_count)]
+        self.quanta = [weights.get(traffic_class, 1) * quantum for traffic_class in range(class_count)]
+        self.deficits = [0] * class_count
+        self.strict_classes = strict_classes
+        self.strict = [traffic_class in strict_classes for traffic_class in range(class_count)]
+        # Backlogged round-robin classes, the one whose turn it is first
+        self.active = collections.deque()
+        self.in_turn = False
+        self.pending = 0
+
+    def __len__(self):
+        return self.pending
+
+    def enqueue(self, traffic_class, message, size):
+        """
+        Queue a message in its class.
+
+        Parameters:
+        traffic_class (int): The traffic class; unknown classes are served as best effort.
+        message (tuple): The buffers of the message.
+        size (int): The size of the message in bytes.
+        """
+        if traffic_class >= len(self.queues):
+            traffic_class = BEST_EFFORT
+        queue = self.queues[traffic_class]
+        queue.append((message, size))
+        self.pending += 1
+        if len(queue) == 1 and not self.strict[traffic_class]:
+            self.active.append(traffic_class)
+
+    def dequeue(self, budget, out):
+        """
+        Move messages to the wire in scheduling order.
+
+        Parameters:
+        budget (int): The bytes to move; the last message may overshoot it.
+        out (collections.deque): The wire queue the buffers are appended to.
+
+        Returns:
+        int: The bytes moved.
+        """
+        moved = 0
+        for traffic_class in self.strict_classes:
+            queue = self.queues[traffic_class]
+            while queue and moved < budget:
+                message, size = queue.popleft()
+                out.extend(message)
+                moved += size
+                self.pending -= 1
+        active = self.active
+        deficits = self.deficits
+        while active and moved < budget:
+            traffic_class = active[0]
+            queue = self.queues[traffic_class]
+            if not self.in_turn:
+                deficits[traffic_class] += self.quanta[traffic_class]
+                self.in_turn = True
+            deficit = deficits[traffic_class]
+            while queue and queue[0][1] <= deficit and moved < budget:
+                message, size = queue.popleft()
+                out.extend(message)
+                deficit -= size
+                moved += size
+                self.pending -= 1
+            if not queue:
+                # Idle classes do not bank credit
+                deficits[traffic_class] = 0
+                active.popleft()
+                self.in_turn = False
+            else:
+                deficits[traffic_class] = deficit
+                if queue[0][1] > deficit:
+                    active.rotate(-1)
+                    self.in_turn = False
+        return moved
+
+    def materialize(self):
+        """
+        Replace every queued memoryview with a copy of its bytes.
+        """
+        for traffic_class, queue in enumerate(self.queues):
+            if queue:
+                self.queues[traffic_class] = collections.deque(
+                    (tuple(bytes(data) if type(data) is memoryview else data for data in message), size)
+                    for message, size in queue)
+
+    def clear(self):
+        """
+        Drop every queued message.
+        """
+        for queue in self.queues:
+            queue.clear()
+        self.deficits = [0] * len(self.queues)
+        self.active.clear()
+        self.in_turn = False
+        self.pending = 0
+
+
+# Example usage
+if __name__ == "__main__":
+    scheduler = DeficitRoundRobin()
+    for index in range(6):
+        scheduler.enqueue(BULK, (b"B" * 1000,), 1000)
+        scheduler.enqueue(INTERACTIVE, (b"i" * 100,), 100)
+    scheduler.enqueue(CONTROL, (b"C",), 1)
+    wire = collections.deque()
+    scheduler.dequeue(4000, wire)
+    print([data[:1].decode() for data in wire])
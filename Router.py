@@ -0,0 +1,103 @@
+import asyncio
+import json
+import sys
+from AsyncRouter import TCPClient, TCPServer
+from Metrics import REGISTRY, MetricsServer
+from Shaping import LinkShaper
+from TableCache import CACHE_DIRECTORY, TableCache
+from Visualization import VisualizationWorker
+
+
+def load_topology(filename='HSF.json', names=None):
+    """
+    Read the routers of a topology file written by the controller.
+
+    Parameters:
+    filename (str): The topology file, with the ip, port and node_id of every node. Default is 'HSF.json'.
+    names (list): The names of the routers to read. Default is every router in the file.
+
+    Returns:
+    list: (name, ip, port, node_id) of every router, ordered by node ID.
+    """
+    with open(filename, 'r') as file:
+        topology = json.load(file)
+    routers = [(name, node['ip'], node['port'], node['node_id']) for name, node in topology.items()
+               if names is None or name in names]
+    return sorted(routers, key=lambda router: router[3])
+
+
+class RouterRuntime:
+    """
+    Many virtual routers served by one process on one event loop.
+
+    Every router keeps its own controller session, forwarding table, listening
+    socket and neighbor connections. What does not need to be per router is
+    shared: one timer shapes every link and one worker renders every delivery.
+    """
+
+    def __init__(self, routers, controller_host='localhost', controller_port=8888, controllers=None,
+                 cache_directory=CACHE_DIRECTORY, metrics_port=None, **options):
+        """
+        Initialize the runtime.
+
+        Parameters:
+        routers (list): (name, ip, port, node_id) of every router to run.
+        controller_host (str): The host address of the controller. Default is 'localhost'.
+        controller_port (int): The port of the controller. Default is 8888.
+        controllers (list): (host, port) of every controller replica. Default is the one controller.
+        cache_directory (str): The directory of every router's table cache; None disables them.
+        Default is ~/.cache/nsfnet.
+        metrics_port (int): The port serving the metrics of every router in the process. Default is None,
+        which serves none.
+        options: Extra arguments for every router's TCPClient.
+        """
+        self.metrics_port = metrics_port
+        self.shaper = LinkShaper()
+        self.visualizer = VisualizationWorker()
+        self.clients = {}
+        self.servers = {}
+        for name, ip, port, node_id in routers:
+            cache = TableCache(node_id, port, cache_directory) if cache_directory is not None else None
+            client = TCPClient(controller_host, controller_port, ip, port, node_id, controllers=controllers,
+                               shaper=self.shaper, cache=cache, **options)
+            self.clients[name] = client
+            self.servers[name] = TCPServer("localhost", port, client, visualizer=self.visualizer)
+
+    async def wait_ready(self):
+        """
+        Wait until every router has installed its first routing table.
+        """
+        await asyncio.gather(*(client.ready.wait() for client in self.clients.values()))
+
+    async def run(self):
+        """
+        Serve every router until cancelled.
+        """
+        if self.metrics_port is not None:
+            # Series carry a router label, so one endpoint serves every router of the process
+            MetricsServer(REGISTRY, 'localhost', self.metrics_port).start()
+        # Listen before asking for tables, so neighbors can connect as soon as they have one
+        await asyncio.gather(*(server.listen() for server in self.servers.values()))
+        tasks = [asyncio.create_task(server.start()) for server in self.servers.values()]
+        tasks += [asyncio.create_task(client.connect_to_controller()) for client in self.clients.values()]
+        print(f"Running {len(self.servers)} router(s)")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.shaper.close()
+            for client in self.clients.values():
+                client.pool.close()
+            self.visualizer.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    # python Router.py [topology] [controller_port] [name,name,...] [metrics_port]
+    topology_file = sys.argv[1] if len(sys.argv) > 1 else 'HSF.json'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8888
+    selected = sys.argv[3].split(",") if len(sys.argv) > 3 and sys.argv[3] != 'all' else None
+    metrics = int(sys.argv[4]) if len(sys.argv) > 4 else 9200
+    runtime = RouterRuntime(load_topology(topology_file, selected), controller_port=port, metrics_port=metrics)
+    asyncio.run(runtime.run())
@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# Bytes per second emulated for every unit of Link.bandwidth, so NSFNET's
+# 300-4800 links run at 0.3-4.8 MB/s
+DEFAULT_SCALE = 1000.0
+
+# Seconds of traffic a link may send back to back after being idle
+DEFAULT_BURST_TIME = 0.01
+
+
+class TokenBucket:
+    """
+    A token bucket limiting a link to its rate.
+
+    Tokens are bytes. They accumulate at `rate` per second up to `burst`, and
+    sending takes them out; a message larger than the tokens left may still go,
+    leaving the bucket in debt until it refills.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Initialize the bucket, full.
+
+        Parameters:
+        rate (float): The link rate in bytes per second.
+        burst (int): The most tokens the bucket holds. Default is 10 ms of traffic, at least 1500 bytes.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(int(rate * DEFAULT_BURST_TIME), 1500)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def available(self, now):
+        """
+        Refill the bucket and get the tokens in it.
+
+        Parameters:
+        now (float): The current time.monotonic().
+
+        Returns:
+        float: The tokens available, negative while in debt.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def consume(self, size):
+        """
+        Take tokens for bytes sent.
+
+        Parameters:
+        size (int): The bytes sent.
+        """
+        self.tokens -= size
+
+    def ready_at(self, tokens):
+        """
+        Get the time the bucket will hold some number of tokens.
+
+        Parameters:
+        tokens (float): The tokens needed.
+
+        Returns:
+        float: The time.monotonic() at which they are available.
+        """
+        return self.updated + max(0.0, tokens - self.tokens) / self.rate
+
+
+class LinkShaper:
+    """
+    The single timer that wakes every throttled link of a router.
+
+    Links out of tokens register the time their bucket will have refilled;
+    one timer handle on the event loop fires for the earliest of them, so a
+    router with any number of shaped links never sleeps per link or per
+    message.
+    """
+
+    def __init__(self):
+        self.wakeups = []
+        self.counter = itertools.count()
+        self.handle = None
+        self.deadline = None
+
+    def wake(self, link, when):
+        """
+        Flush a link once its bucket has refilled.
+
+        Parameters:
+        link (NeighborConnection): The throttled link.
+        when (float): The time.monotonic() to flush it at.
+        """
+        heapq.heappush(self.wakeups, (when, next(self.counter), link))
+        if self.deadline is None or when < self.deadline:
+            self.arm(when)
+
+    def arm(self, when):
+        """
+        Point the timer at a new deadline.
+
+        Parameters:
+        when (float): The time.monotonic() to fire at.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+        loop = asyncio.get_running_loop()
+        # The event loop clock is time.monotonic()
+        self.handle = loop.call_at(when, self.fire)
+        self.deadline = when
+
+    def fire(self):
+        """
+        Flush every link whose wake-up time has come, then rearm for the next one.
+        """
+        self.handle = None
+        self.deadline = None
+        now = time.monotonic()
+        wakeups = self.wakeups
+        while wakeups and wakeups[0][0] <= now:
+            _, _, link = heapq.heappop(wakeups)
+            link.flush()
+        if wakeups:
+            self.arm(wakeups[0][0])
+
+    def close(self):
+        """
+        Cancel the timer and forget every pending wake-up.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle = None
+        self.deadline = None
+        self.wakeups.clear()
+
+
+# Example usage
+if __name__ == "__main__":
+    bucket = TokenBucket(rate=1e6)
+    start = time.monotonic()
+    sent = 0
+    while time.monotonic() - start < 0.5:
+        if bucket.available(time.monotonic()) > 0:
+            bucket.consume(1000)
+            sent += 1000
+    print(f"Sent {sent / (time.monotonic() - start) / 1e6:.2f} MB/s through a 1 MB/s bucket")
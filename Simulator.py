@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import random
+import time
+from Areas import area_members
+from Fib import ForwardingTable, area_key
+from Packet import DEFAULT_TTL, HEADER_SIZE
+from Shaping import DEFAULT_SCALE
+
+# Propagation delay of every link without one of its own, in seconds
+DEFAULT_DELAY = 0.001
+
+# Bytes a link may hold queued before it drops packets
+DEFAULT_QUEUE_LIMIT = 64 * 1024
+
+
+class SimulatedLink:
+    """
+    One direction of a link: a FIFO drop-tail queue in front of a transmitter.
+
+    The queue is not stored: with FIFO service a packet's departure time
+    follows from the time the transmitter frees up, and the backlog from how
+    far that lies in the future, so every hop costs O(1).
+    """
+    __slots__ = ('rate', 'delay', 'queue_limit', 'busy_until', 'bytes_sent', 'packets_sent', 'drops')
+
+    def __init__(self, rate, delay, queue_limit):
+        """
+        Initialize the link.
+
+        Parameters:
+        rate (float): The link rate in bytes per second.
+        delay (float): The propagation delay in seconds.
+        queue_limit (int): The most bytes queued before packets are dropped.
+        """
+        self.rate = rate
+        self.delay = delay
+        self.queue_limit = queue_limit
+        self.busy_until = 0.0
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.drops = 0
+
+    def transmit(self, now, size):
+        """
+        Queue a packet on the link.
+
+        Parameters:
+        now (float): The simulated time the packet reaches the link.
+        size (int): The size of the packet in bytes.
+
+        Returns:
+        float or None: The time the packet arrives at the far end, or None if it was dropped.
+        """
+        backlog = (self.busy_until - now) * self.rate
+        if backlog + size > self.queue_limit:
+            self.drops += 1
+            return None
+        self.busy_until = max(now, self.busy_until) + size / self.rate
+        self.bytes_sent += size
+        self.packets_sent += 1
+        return self.busy_until + self.delay
+
+
+class FlowStats:
+    """
+    What happened to the packets of one entry of the traffic matrix.
+    """
+
+    def __init__(self, source, destination, rate):
+        self.source = source
+        self.destination = destination
+        self.rate = rate
+        self.sent = 0
+        self.delivered = 0
+        self.delivered_bytes = 0
+        self.dropped = 0
+        self.expired = 0
+        self.unroutable = 0
+        self.latencies = []
+
+    def percentile(self, fraction):
+        """
+        Get a percentile of the delivery latency.
+
+        Parameters:
+        fraction (float): The percentile, from 0 to 1.
+
+        Returns:
+        float or None: The latency in seconds, or None if nothing was delivered.
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+class Simulator:
+    """
+    A discrete-event simulator of a network's data plane.
+
+    Links take their rate from Link.bandwidth, scaled as for shaped routers,
+    and every router forwards with the ForwardingTable compiled from the
+    controller's routing table for it, so the simulation takes the paths the
+    real routers would. Events are packet arrivals at routers, kept in one
+    heap ordered by simulated time; a run takes as long as its events take to
+    process, whatever the simulated duration.
+    """
+
+    def __init__(self, network, routing=None, scale=DEFAULT_SCALE, delay=DEFAULT_DELAY, delays=None,
+                 queue_limit=DEFAULT_QUEUE_LIMIT, ttl=DEFAULT_TTL):
+        """
+        Initialize the simulator from a network and its routing tables.
+
+        Parameters:
+        network (Network): The network to simulate.
+        routing (HierarchicalRouting): Builds the routing tables. Default is the flat tables of the network.
+        scale (float): Bytes per second per unit of link bandwidth. Default is 1000.
+        delay (float): The propagation delay of every link, in seconds. Default is 0.001.
+        delays (dict): Propagation delays of particular links, keyed by (source name, destination name). Default is none.
+        queue_limit (int): The bytes every link may queue before it drops packets. Default is 64 KiB.
+        ttl (int): The TTL packets start with. Default is 64.
+        """
+        routing_tables = (routing if routing is not None else network).build_routing_tables(network)
+        self.ports = {name: node_data['port'] for name, node_data in routing_tables.items()}
+        self.ttl = ttl
+        areas = area_members(routing_tables)
+        area_ports = {port: area_key(area) for area, ports in (areas or {}).items() for port in ports}
+        self.fibs = {}
+        for name, node_data in routing_tables.items():
+            # The table the controller would send to this router, in ports
+            table = {destination: [routing_tables[hop]['port'] for hop in path]
+                     for destination, path in node_data['routing_table'].items()}
+            self.fibs[node_data['port']] = ForwardingTable(table, node_data['port'], area_ports)
+        delays = delays or {}
+        self.links = {}
+        for source, destination, data in network.graph.edges(data=True):
+            if source not in self.ports or destination not in self.ports:
+                continue
+            # Links are full duplex: each direction has its own queue
+            for start, end in ((source, destination), (destination, source)):
+                link_delay = delays.get((start, end), delays.get((end, start), delay))
+                rate = data['bandwidth'] * scale
+                self.links[(self.ports[start], self.ports[end])] = SimulatedLink(rate, link_delay, queue_limit)
+
+    def run(self, traffic, duration, packet_size=1024, seed=1):
+        """
+        Simulate a traffic matrix.
+
+        Every entry sends packets with exponentially distributed gaps at its
+        mean rate for `duration` simulated seconds; the run ends once every
+        packet has been delivered or dropped.
+
+        Parameters:
+        traffic (dict): The rate of every flow in bytes per second, keyed by (source name, destination name).
+        duration (float): The simulated seconds traffic is offered for.
+        packet_size (int): The payload bytes per packet. Default is 1024.
+        seed (int): The random seed. Default is 1.
+
+        Returns:
+        list: The FlowStats of every flow, in the order of the traffic matrix.
+        """
+        rng = random.Random(seed)
+        size = HEADER_SIZE + packet_size
+        flows = [FlowStats(source, destination, rate) for (source, destination), rate in traffic.items()]
+        counter = itertools.count()
+        events = []
+        # (time, tie-breaker, router port, flow index, created, ttl); a None port is the flow's next packet
+        for index, flow in enumerate(flows):
+            if flow.rate > 0:
+                heapq.heappush(events, (rng.expovariate(flow.rate / size), next(counter), None, index, 0.0, 0))
+        sources = [self.ports[flow.source] for flow in flows]
+        destinations = [self.ports[flow.destination] for flow in flows]
+        # The outgoing links of every router, keyed by next hop
+        outgoing = {}
+        for (start, end), link in self.links.items():
+            outgoing.setdefault(start, {})[end] = link
+        fibs = self.fibs
+        push, pop = heapq.heappush, heapq.heappop
+        while events:
+            now, _, port, index, created, ttl = pop(events)
+            flow = flows[index]
+            if port is None:
+                # A new packet enters at its source router, and the next one is scheduled
+                flow.sent += 1
+                gap = rng.expovariate(flow.rate / size)
+                if now + gap < duration:
+                    push(events, (now + gap, next(counter), None, index, 0.0, 0))
+                port, created, ttl = sources[index], now, self.ttl
+            route = fibs[port].lookup(destinations[index])
+            if route is None:
+                flow.unroutable += 1
+                continue
+            next_hop = route[1]
+            if next_hop is None:
+                flow.delivered += 1
+                flow.delivered_bytes += packet_size
+                flow.latencies.append(now - created)
+                continue
+            if ttl <= 1:
+                flow.expired += 1
+                continue
+            arrival = outgoing[port][next_hop].transmit(now, size)
+            if arrival is None:
+                flow.dropped += 1
+                continue
+            push(events, (arrival, next(counter), next_hop, index, created, ttl - 1))
+        return flows
+
+    def report(self, flows, duration):
+        """
+        Print the throughput, latency and losses of every flow and the busiest links.
+
+        Parameters:
+        flows (list): The FlowStats returned by run().
+        duration (float): The simulated seconds traffic was offered for.
+        """
+        print(f"{'flow':<14}{'offered MB/s':>14}{'delivered MB/s':>16}{'p50 ms':>9}{'p99 ms':>9}{'drops':>8}")
+        for flow in flows:
+            p50, p99 = flow.percentile(0.5), flow.percentile(0.99)
+            print(f"{flow.source + '->' + flow.destination:<14}{flow.rate / 1e6:>14.2f}"
+                  f"{flow.delivered_bytes / duration / 1e6:>16.2f}"
+                  f"{(p50 or 0) * 1e3:>9.2f}{(p99 or 0) * 1e3:>9.2f}{flow.dropped + flow.expired + flow.unroutable:>8}")
+        names = {port: name for name, port in self.ports.items()}
+        busiest = sorted(self.links.items(), key=lambda item: item[1].bytes_sent / item[1].rate, reverse=True)[:5]
+        for (start, end), link in busiest:
+            print(f"link {names[start]}->{names[end]}: {link.bytes_sent / link.rate / duration:.0%} busy, "
+                  f"{link.drops} drop(s)")
+
+
+# Example usage
+if __name__ == "__main__":
+    from Controler import build_nsfnet
+
+    simulator = Simulator(build_nsfnet())
+    matrix = {('WA', 'DC'): 0.2e6, ('CA1', 'NY'): 0.5e6, ('TX', 'MI'): 1.0e6, ('NJ', 'DC'): 0.4e6}
+    simulated = 60.0
+    start = time.perf_counter()
+    results = simulator.run(matrix, simulated)
+    elapsed = time.perf_counter() - start
+    simulator.report(results, simulated)
+    print(f"Simulated {simulated:.0f}s in {elapsed:.2f}s, {simulated / elapsed:.0f}x real time")
@@ -0,0 +1,228 @@
+import json
+import os
+import queue
+import threading
+import time
+from types import MappingProxyType
+from Areas import area_members
+from Compression import build_dictionary
+from Metrics import REGISTRY
+from Node import Node
+from Profiling import span
+
+
+def write_json(data, filename='data.json'):
+    """
+    Write a Python dictionary to a JSON file, replacing it atomically.
+
+    Parameters:
+    data (dict): The data to be written to the JSON file.
+    filename (str): The name of the JSON file. Default is 'data.json'.
+    """
+    temporary = f"{filename}.tmp"
+    with span('write_json'), open(temporary, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(temporary, filename)
+
+
+RECOMPUTE_SECONDS = REGISTRY.histogram('controller_recompute_duration_seconds', 'Time to recompute every routing table.')
+
+
+def build_table_payload(routing_tables, node_name, ask_data, areas=None):
+    """
+    Build the routing table payload sent to a router.
+
+    The payload is the table, the ASK message, the ports in every area (null
+    for flat tables) and the capacity of the link to every neighbor port,
+    separated by ' - '.
+
+    Parameters:
+    routing_tables (dict): The routing tables as stored in HSF.json.
+    node_name (str): The name of the router the table is for.
+    ask_data (dict): The ASK message appended to the table.
+    areas (dict): The ports in every area, appended for hierarchical tables. Default is None.
+
+    Returns:
+    bytes: The encoded payload.
+    """
+    node_data = routing_tables[node_name]
+    client_table = node_data['routing_table']
+    ip_table = {}
+    for destination, path in client_table.items():
+        ip_table[destination] = [routing_tables[n]['port'] for n in path]
+    links = {routing_tables[neighbor]['port']: bandwidth
+             for neighbor, bandwidth in node_data.get('links', {}).items() if neighbor in routing_tables}
+    payload = " - ".join([json.dumps(ip_table), json.dumps(ask_data), json.dumps(areas), json.dumps(links)])
+    return payload.encode()
+
+
+class TopologySnapshot:
+    """
+    An immutable view of the topology and its routing tables.
+
+    Snapshots are never modified once published, so any number of threads can
+    read one without locking.
+    """
+
+    def __init__(self, version, routing_tables, ask_data, nodes=None, link_count=0):
+        """
+        Initialize the snapshot.
+
+        Parameters:
+        version (int): The snapshot version, increasing with every publish.
+        routing_tables (dict): The routing tables as stored in HSF.json.
+        ask_data (dict): The ASK message appended to every table.
+        nodes (list): Every known node, including removed ones. Default is the nodes in the routing tables.
+        link_count (int): The number of links in the topology. Default is 0.
+        """
+        self.version = version
+        self.link_count = link_count
+        self.routing_tables = MappingProxyType(routing_tables)
+        self.ask_data = MappingProxyType(ask_data)
+        if nodes is None:
+            nodes = [Node(node_data['node_id'], node_name, node_data['ip'], node_data['port'])
+                     for node_name, node_data in routing_tables.items()]
+        self.addresses = MappingProxyType({(node.ip_address, node.port): node.name for node in nodes})
+        self.node_ids = MappingProxyType({node.name: node.node_id for node in nodes})
+        self.areas = area_members(routing_tables)
+        self.dictionary = build_dictionary(routing_tables)
+        self._payloads = {}
+
+    def node_for(self, ip_address, port):
+        """
+        Find the node registered at an address.
+
+        Parameters:
+        ip_address (str): The IP address of the node.
+        port (int): The port of the node.
+
+        Returns:
+        str or None: The node name, or None if no node uses that address. Removed
+        nodes are still found, but have no routing table.
+        """
+        return self.addresses.get((ip_address, port))
+
+    def table_payload(self, node_name):
+        """
+        Get the encoded routing table payload for a node.
+
+        Payloads are built on first use and cached; concurrent builders produce
+        identical bytes, so the cache needs no lock.
+
+        Parameters:
+        node_name (str): The name of the node.
+
+        Returns:
+        bytes: The encoded payload.
+        """
+        payload = self._payloads.get(node_name)
+        if payload is None:
+            payload = build_table_payload(self.routing_tables, node_name, dict(self.ask_data), self.areas)
+            self._payloads[node_name] = payload
+        return payload
+
+
+class SnapshotPublisher:
+    """
+    The single writer that owns the network and publishes topology snapshots.
+
+    Request threads read `current` and submit mutations; only the writer thread
+    touches the network, recomputes routes and swaps in the new snapshot.
+    """
+
+    def __init__(self, network, ask_data, filename='HSF.json', routing=None):
+        """
+        Initialize the publisher and publish the first snapshot.
+
+        Parameters:
+        network (Network): The network owned by the publisher from now on.
+        ask_data (dict): The ASK message appended to every table.
+        filename (str): The JSON file mirroring the current routing tables. Default is 'HSF.json'.
+        routing (HierarchicalRouting): Builds the routing tables. Default is the flat tables of the network.
+        """
+        self.network = network
+        self.routing = routing if routing is not None else network
+        self.ask_data = ask_data
+        self.filename = filename
+        self.mutations = queue.Queue()
+        self.current = self.build_snapshot(1)
+        self.write_snapshot(self.current)
+        self.writer_thread = threading.Thread(target=self.run, daemon=True)
+        self.writer_thread.start()
+
+    def submit(self, function, *args):
+        """
+        Queue a mutation for the writer thread without waiting for it.
+
+        Parameters:
+        function (callable): Called as function(network, *args) on the writer thread.
+        args: Extra arguments for the function.
+        """
+        self.mutations.put((function, args))
+
+    def remove_node(self, node_id):
+        """
+        Queue the removal of a node.
+
+        Parameters:
+        node_id (int): The ID of the node to be removed.
+        """
+        self.submit(lambda network, node_id: network.remove_node(node_id), node_id)
+
+    def restore_node(self, node_id):
+        """
+        Queue the restore of a removed node.
+
+        Parameters:
+        node_id (int): The ID of the node to be restored.
+        """
+        self.submit(lambda network, node_id: network.restore_node(node_id), node_id)
+
+    def run(self):
+        """
+        Apply queued mutations and publish a new snapshot after each batch.
+        """
+        while True:
+            mutations = [self.mutations.get()]
+            # Coalesce everything queued behind the first mutation into one recompute
+            while True:
+                try:
+                    mutations.append(self.mutations.get_nowait())
+                except queue.Empty:
+                    break
+            for function, args in mutations:
+                try:
+                    function(self.network, *args)
+                except Exception as e:
+                    print(f"Error applying topology mutation: {e}")
+            snapshot = self.build_snapshot(self.current.version + 1)
+            # A single reference swap publishes the snapshot to every reader
+            self.current = snapshot
+            self.write_snapshot(snapshot)
+            print(f"Published topology snapshot {snapshot.version} after {len(mutations)} mutation(s)")
+
+    def build_snapshot(self, version):
+        """
+        Recompute the routing tables and wrap them in a snapshot.
+
+        Parameters:
+        version (int): The version of the new snapshot.
+
+        Returns:
+        TopologySnapshot: The new snapshot.
+        """
+        start = time.perf_counter()
+        with span('recompute'):
+            routing_tables = self.routing.build_routing_tables(self.network)
+        RECOMPUTE_SECONDS.observe(time.perf_counter() - start)
+        nodes = list(self.network.nodes.values()) + list(self.network.removed_nodes.values())
+        return TopologySnapshot(version, routing_tables, self.ask_data, nodes, self.network.graph.number_of_edges())
+
+    def write_snapshot(self, snapshot):
+        """
+        Mirror a snapshot to the JSON file, replacing it atomically.
+
+        Parameters:
+        snapshot (TopologySnapshot): The snapshot to write.
+        """
+        write_json(dict(snapshot.routing_tables), self.filename)
@@ -0,0 +1,196 @@
+from Packet import packet_size
+from Protocol import FRAME_HEADER
+
+
+class StreamBuffer:
+    """
+    A receive buffer that turns a byte stream back into whole messages.
+
+    TCP may split a message across reads or coalesce several into one, so a
+    read is never taken to be one message. Reads go straight into a
+    preallocated bytearray with recv_into(); whole lines, frames and packets
+    are cut from the front, and a partial message waits for the rest. The
+    buffer is reused for the life of the stream: the partial message is moved
+    to the front once the end is reached, and the buffer only grows when one
+    message does not fit in it.
+    """
+
+    def __init__(self, size=16384):
+        """
+        Initialize the buffer.
+
+        Parameters:
+        size (int): The initial size of the buffer in bytes. Default is 16384.
+        """
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def get_buffer(self):
+        """
+        Get the free space at the end of the buffer, making room first if there is none.
+
+        Returns:
+        memoryview: The free space. Views returned by the read methods are invalid once it is written.
+        """
+        if self.end == len(self.buffer):
+            self.make_room()
+        return self.view[self.end:]
+
+    def make_room(self):
+        """
+        Move a partial message to the front of the buffer, or grow the buffer if
+        the message fills all of it.
+        """
+        pending = self.end - self.start
+        if self.start > 0:
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        else:
+            buffer = bytearray(len(self.buffer) * 2)
+            buffer[:pending] = self.view
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        self.start = 0
+        self.end = pending
+
+    def buffer_updated(self, nbytes):
+        """
+        Account for bytes written into the space from get_buffer().
+
+        Parameters:
+        nbytes (int): The number of bytes written.
+        """
+        self.end += nbytes
+
+    def recv_from(self, sock):
+        """
+        Receive whatever a socket has into the buffer.
+
+        Parameters:
+        sock (socket.socket): The connected socket.
+
+        Returns:
+        int: The number of bytes received, 0 if the peer closed the connection.
+        """
+        nbytes = sock.recv_into(self.get_buffer())
+        self.end += nbytes
+        return nbytes
+
+    def feed(self, data):
+        """
+        Copy bytes received some other way into the buffer.
+
+        Parameters:
+        data (bytes): The bytes.
+        """
+        view = memoryview(data)
+        while view:
+            space = self.get_buffer()
+            size = min(len(space), len(view))
+            space[:size] = view[:size]
+            self.end += size
+            view = view[size:]
+
+    def consume(self, size):
+        """
+        Drop bytes from the front of the buffer.
+
+        Parameters:
+        size (int): The number of bytes.
+        """
+        self.start += size
+        if self.start == self.end:
+            # Nothing is pending, so the next read starts at the front again
+            self.start = self.end = 0
+
+    def pending_startswith(self, prefix):
+        """
+        Check whether what is pending is, or may become, a message starting with a prefix.
+
+        Parameters:
+        prefix (bytes): The prefix.
+
+        Returns:
+        bool: True if the pending bytes start with the prefix, or are the start of it.
+        """
+        size = min(len(prefix), self.end - self.start)
+        return self.view[self.start:self.start + size] == prefix[:size]
+
+    def read_line(self):
+        """
+        Cut the next newline-terminated line from the buffer.
+
+        Returns:
+        bytes or None: The line without its newline, or None until a whole line has been received.
+        """
+        newline = self.buffer.find(b"\n", self.start, self.end)
+        if newline < 0:
+            return None
+        line = bytes(self.view[self.start:newline])
+        self.consume(newline + 1 - self.start)
+        return line
+
+    def read_rest(self):
+        """
+        Cut everything pending from the buffer.
+
+        Returns:
+        bytes: The pending bytes.
+        """
+        data = bytes(self.view[self.start:self.end])
+        self.consume(len(data))
+        return data
+
+    def read_frame(self):
+        """
+        Cut the next length-prefixed frame from the buffer.
+
+        Returns:
+        bytes or None: The frame payload, or None until the whole frame has been received.
+        """
+        if self.end - self.start < FRAME_HEADER.size:
+            return None
+        (length,) = FRAME_HEADER.unpack_from(self.buffer, self.start)
+        frame_end = self.start + FRAME_HEADER.size + length
+        if frame_end > self.end:
+            return None
+        payload = bytes(self.view[self.start + FRAME_HEADER.size:frame_end])
+        self.consume(frame_end - self.start)
+        return payload
+
+    def read_packet(self):
+        """
+        Cut the next data packet from the buffer, without copying it.
+
+        Returns:
+        memoryview or None: The packet, valid until the buffer is next written, or None
+        until the whole packet has been received.
+        """
+        size = packet_size(self.buffer, self.start, self.end)
+        if size is None or self.end - self.start < size:
+            return None
+        packet = self.view[self.start:self.start + size]
+        self.consume(size)
+        return packet
+
+
+# Example usage
+if __name__ == "__main__":
+    from Packet import decode_packet, encode_packet
+
+    stream = StreamBuffer(32)
+    data = b"neighbor-8000\n" + encode_packet(8013, 8000, b"hello") + encode_packet(8013, 8000, b"x" * 40)
+    # Deliver the stream in uneven pieces, as TCP may
+    for offset in range(0, len(data), 7):
+        stream.feed(data[offset:offset + 7])
+        line = stream.read_line()
+        if line is not None:
+            print(line)
+        packet = stream.read_packet()
+        while packet is not None:
+            print(decode_packet(packet))
+            packet = stream.read_packet()
@@ -0,0 +1,137 @@
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Magic, format version, node ID, router port, table version, compressed length, CRC-32 of the payload
+CACHE_HEADER = struct.Struct('!4sBIHIII')
+CACHE_MAGIC = b'RTBL'
+CACHE_FORMAT = 1
+
+# Private to the user, so nobody else can plant or replace a router's cache
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'nsfnet')
+
+# One thread writes every cache of the process, in the order the tables were installed
+CACHE_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix='table-cache')
+
+
+def cache_path(port, directory=CACHE_DIRECTORY):
+    """
+    Get the path of a router's table cache.
+
+    Parameters:
+    port (int): The port of the router.
+    directory (str): The directory holding the caches. Default is ~/.cache/nsfnet.
+
+    Returns:
+    str: The cache path.
+    """
+    return os.path.join(directory, f'nsfnet-router-{port}.table')
+
+
+class TableCache:
+    """
+    The last routing table a router installed, kept on disk for a warm restart.
+
+    The cache holds the controller's payload, compressed, behind a small
+    header naming the router and the table version. A restarted router maps
+    the file, checks it and forwards with the cached table at once, then
+    swaps in whatever the controller sends, so forwarding does not wait for
+    the controller round trip, or for the controller at all.
+    """
+
+    def __init__(self, node_id, port, directory=CACHE_DIRECTORY):
+        """
+        Initialize the cache.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        port (int): The port of the router.
+        directory (str): The directory holding the caches. Default is ~/.cache/nsfnet.
+        """
+        self.node_id = node_id
+        self.port = port
+        self.directory = directory
+        self.path = cache_path(port, directory)
+
+    def load(self):
+        """
+        Read the cached table.
+
+        Returns:
+        tuple or None: The payload and its table version, or None if there is no
+        valid cache for this router.
+        """
+        try:
+            with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if len(mapped) < CACHE_HEADER.size:
+                    return None
+                magic, format_version, node_id, port, version, length, checksum = CACHE_HEADER.unpack_from(mapped)
+                if (magic, format_version, node_id, port) != (CACHE_MAGIC, CACHE_FORMAT, self.node_id, self.port):
+                    return None
+                if len(mapped) != CACHE_HEADER.size + length:
+                    return None
+                payload = zlib.decompress(mapped[CACHE_HEADER.size:])
+        except FileNotFoundError:
+            # A cold start: nothing has been cached yet
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Ignoring table cache {self.path}: {e}")
+            return None
+        if zlib.crc32(payload) != checksum:
+            print(f"Ignoring table cache {self.path}: checksum mismatch")
+            return None
+        return payload.decode(), version
+
+    def store(self, payload, version):
+        """
+        Replace the cached table, atomically.
+
+        Parameters:
+        payload (str): The decompressed payload from the controller.
+        version (int): The table version.
+        """
+        data = payload.encode()
+        compressed = zlib.compress(data)
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # A fresh private file, so an existing file or link under a known name is never written through
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=f'.nsfnet-router-{self.port}-')
+        except OSError as e:
+            print(f"Error writing table cache {self.path}: {e}")
+            return
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_FORMAT, self.node_id, self.port, version,
+                                             len(compressed), zlib.crc32(data)))
+                file.write(compressed)
+            # A crash mid-write leaves the old cache in place, never half a table
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Error writing table cache {self.path}: {e}")
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+
+    def store_later(self, payload, version):
+        """
+        Replace the cached table on the cache writer thread, so the event loop does not wait for the disk.
+
+        Parameters:
+        payload (str): The decompressed payload from the controller.
+        version (int): The table version.
+
+        Returns:
+        concurrent.futures.Future: Done once the table is written.
+        """
+        return CACHE_WRITER.submit(self.store, payload, version)
+
+
+# Example usage
+if __name__ == "__main__":
+    cache = TableCache(1, 8000)
+    cache.store('{"WA": [8000]} - {"message": "ASK"} - null - {}', 3)
+    print(cache.load())
@@ -0,0 +1,259 @@
+import math
+import threading
+import time
+from Metrics import REGISTRY
+from Shaping import DEFAULT_SCALE
+
+ADAPTIVE_RECOMPUTES = REGISTRY.counter('controller_adaptive_recomputes_total',
+                                       'Recomputes requested because links turned hot or cooled down.')
+LINK_TRANSITIONS = REGISTRY.counter('controller_link_transitions_total', 'Times a link turned hot or cooled down.',
+                                    ('state',))
+
+
+def parse_report(message):
+    """
+    Parse a telemetry report sent by a router.
+
+    Parameters:
+    message (str): The report, telemetry-<node ID>-<interval ms>-<port>:<bytes>:<messages>:<queued bytes>,...
+
+    Returns:
+    tuple: The node ID, the interval in seconds and (neighbor port, bytes, messages, queued bytes) of every link.
+
+    Raises:
+    ValueError: If the report is malformed.
+    """
+    parts = message.split("-")
+    if len(parts) != 4 or parts[0] != 'telemetry':
+        raise ValueError(f"Malformed telemetry report: {message!r}")
+    links = []
+    for counters in parts[3].split(","):
+        fields = counters.split(":")
+        if len(fields) != 4:
+            raise ValueError(f"Malformed link counters: {counters!r}")
+        links.append(tuple(int(field) for field in fields))
+    return int(parts[1]), int(parts[2]) / 1000, links
+
+
+def apply_link_weights(network, hot_links, penalty):
+    """
+    Set the routing weight of every link from its capacity, raised for hot links.
+    Runs on the publisher's writer thread.
+
+    Parameters:
+    network (Network): The network.
+    hot_links (frozenset): The hot links, each a frozenset of the two node names.
+    penalty (float): The factor applied to the weight of a hot link.
+    """
+    for source, destination, data in network.graph.edges(data=True):
+        if frozenset((source, destination)) in hot_links:
+            data['weight'] = data['bandwidth'] * penalty
+        else:
+            data['weight'] = data['bandwidth']
+
+
+class LinkLoad:
+    """
+    The smoothed load of one direction of a link.
+    """
+
+    def __init__(self):
+        self.utilization = 0.0
+        self.queue_delay = 0.0
+        self.hot = False
+        self.hot_since = 0.0
+        self.flaps = 0.0
+        self.flaps_time = 0.0
+
+
+class AdaptiveRouting:
+    """
+    Raise the routing weight of links that routers report as hot.
+
+    Routers report the bytes scheduled onto every neighbor link and its queue
+    depth with each heartbeat. The utilization of every link is smoothed with
+    an exponentially weighted moving average. A link turns hot above
+    `hot_utilization`, or once its queue holds more than `max_queue_delay`
+    seconds of traffic, and cools only below `cool_utilization` with its queue
+    drained, so load hovering around one threshold does not flip it. A link
+    that cools stays hot for at least `hold_time` seconds, doubled for every
+    recent flap, so traffic that returns to a cooled link and heats it again
+    is moved off for longer each time. Hot links are weighted `penalty` times
+    their capacity, and routes are recomputed at most once every
+    `min_interval` seconds, with every change since the last recompute.
+    """
+
+    def __init__(self, publisher, scale=DEFAULT_SCALE, smoothing=0.3, hot_utilization=0.8, cool_utilization=0.5,
+                 max_queue_delay=0.05, penalty=4.0, hold_time=10.0, max_hold_time=300.0, half_life=120.0,
+                 min_interval=5.0):
+        """
+        Initialize the adaptive routing.
+
+        Parameters:
+        publisher (SnapshotPublisher): Applies new link weights and publishes the recomputed tables.
+        scale (float): Bytes per second per unit of link bandwidth, as the routers shape. Default is 1000.
+        smoothing (float): The weight of the newest report in the average utilization. Default is 0.3.
+        hot_utilization (float): The utilization above which a link turns hot. Default is 0.8.
+        cool_utilization (float): The utilization below which a hot link may cool down. Default is 0.5.
+        max_queue_delay (float): Seconds of queued traffic above which a link turns hot. Default is 0.05.
+        penalty (float): The factor applied to the weight of a hot link. Default is 4.0.
+        hold_time (float): The fewest seconds a link stays hot. Default is 10.0.
+        max_hold_time (float): The most seconds a flapping link is held hot. Default is 300.0.
+        half_life (float): Seconds for the flap count of a link to decay by half. Default is 120.0.
+        min_interval (float): The fewest seconds between recomputes. Default is 5.0.
+        """
+        self.publisher = publisher
+        self.scale = scale
+        self.smoothing = smoothing
+        self.hot_utilization = hot_utilization
+        self.cool_utilization = cool_utilization
+        self.max_queue_delay = max_queue_delay
+        self.penalty = penalty
+        self.hold_time = hold_time
+        self.max_hold_time = max_hold_time
+        self.half_life = half_life
+        self.min_interval = min_interval
+        # Keyed by (source name, destination name); each direction is measured on its own
+        self.loads = {}
+        self.applied = frozenset()
+        self.last_recompute = -math.inf
+        self.names = None
+        self.lock = threading.Lock()
+        REGISTRY.gauge('controller_hot_links', 'Links currently weighted as hot.', lambda: len(self.applied))
+
+    def topology(self):
+        """
+        Get the node names by ID and by port of the current snapshot, rebuilt when it changes.
+
+        Returns:
+        tuple: The names keyed by node ID and the names keyed by port.
+        """
+        snapshot = self.publisher.current
+        if self.names is None or self.names[0] != snapshot.version:
+            by_id = {node_id: name for name, node_id in snapshot.node_ids.items()}
+            by_port = {node_data['port']: name for name, node_data in snapshot.routing_tables.items()}
+            self.names = (snapshot.version, by_id, by_port)
+        return self.names[1], self.names[2]
+
+    def report(self, node_id, interval, links, now=None):
+        """
+        Record a router's telemetry report and recompute if the hot links changed.
+
+        Parameters:
+        node_id (int): The ID of the router.
+        interval (float): Seconds covered by the report.
+        links (list): (neighbor port, bytes, messages, queued bytes) of every link of the router.
+        now (float): The current time.monotonic() value. Default is the current time.
+        """
+        if interval <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            by_id, by_port = self.topology()
+            source = by_id.get(node_id)
+            node_data = self.publisher.current.routing_tables.get(source)
+            if node_data is None:
+                # A withdrawn router, or one the controller does not know
+                return
+            capacities = node_data['links']
+            for port, sent, messages, queued in links:
+                destination = by_port.get(port)
+                if destination not in capacities:
+                    continue
+                rate = capacities[destination] * self.scale
+                load = self.loads.get((source, destination))
+                if load is None:
+                    load = self.loads[(source, destination)] = LinkLoad()
+                load.utilization += self.smoothing * (sent / interval / rate - load.utilization)
+                load.queue_delay = queued / rate
+                self.update(source, destination, load, now)
+            self.maybe_recompute(now)
+
+    def decayed_flaps(self, load, now):
+        """
+        Decay a link's flap count to the current time.
+
+        Parameters:
+        load (LinkLoad): The link.
+        now (float): The current time.
+
+        Returns:
+        float: The current flap count.
+        """
+        load.flaps *= math.pow(0.5, (now - load.flaps_time) / self.half_life)
+        load.flaps_time = now
+        return load.flaps
+
+    def update(self, source, destination, load, now):
+        """
+        Move a link between hot and cool.
+
+        Parameters:
+        source (str): The name of the reporting router.
+        destination (str): The name of the neighbor.
+        load (LinkLoad): The load of the link.
+        now (float): The current time.
+        """
+        if not load.hot:
+            if load.utilization >= self.hot_utilization or load.queue_delay >= self.max_queue_delay:
+                load.hot = True
+                load.hot_since = now
+                self.decayed_flaps(load, now)
+                load.flaps += 1
+                LINK_TRANSITIONS.labels('hot').inc()
+                print(f"Link {source}->{destination} is hot: {load.utilization:.0%} utilized, "
+                      f"{load.queue_delay * 1000:.0f} ms queued")
+        elif load.utilization < self.cool_utilization and load.queue_delay < self.max_queue_delay / 2:
+            hold = min(self.max_hold_time, self.hold_time * math.pow(2, max(0.0, self.decayed_flaps(load, now) - 1)))
+            if now - load.hot_since >= hold:
+                load.hot = False
+                LINK_TRANSITIONS.labels('cool').inc()
+                print(f"Link {source}->{destination} cooled down after {now - load.hot_since:.0f}s")
+
+    def hot_links(self):
+        """
+        Get the links with a hot direction.
+
+        Returns:
+        frozenset: The hot links, each a frozenset of the two node names.
+        """
+        return frozenset(frozenset(link) for link, load in self.loads.items() if load.hot)
+
+    def maybe_recompute(self, now):
+        """
+        Apply the hot links if they changed and the last recompute is old enough.
+
+        Parameters:
+        now (float): The current time.
+        """
+        hot_links = self.hot_links()
+        if hot_links == self.applied or now - self.last_recompute < self.min_interval:
+            return
+        self.applied = hot_links
+        self.last_recompute = now
+        ADAPTIVE_RECOMPUTES.inc()
+        print(f"Recomputing routes around {len(hot_links)} hot link(s)")
+        self.publisher.submit(apply_link_weights, hot_links, self.penalty)
+
+
+# Example usage
+if __name__ == "__main__":
+    from Controler import build_nsfnet
+    from Snapshot import SnapshotPublisher
+
+    publisher = SnapshotPublisher(build_nsfnet(), {"message": "ASK"}, '/tmp/adaptive.json')
+    adaptive = AdaptiveRouting(publisher, min_interval=5.0)
+    node_ids = publisher.current.node_ids
+    tables = publisher.current.routing_tables
+    print("WA->DC before:", tables['WA']['routing_table']['DC'])
+    first_hop = tables['WA']['routing_table']['DC'][1]
+    capacity = tables['WA']['links'][first_hop] * DEFAULT_SCALE
+    first_port = tables[first_hop]['port']
+    # The first link of the route runs full for a while, then goes quiet
+    for second in range(60):
+        utilization = 1.0 if second < 8 else 0.1
+        report = f"telemetry-{node_ids['WA']}-1000-{first_port}:{int(capacity * utilization)}:100:0"
+        adaptive.report(*parse_report(report), now=float(second))
+        if second in (8, 59):
+            time.sleep(0.5)
+            print(f"WA->DC after {second}s:", publisher.current.routing_tables['WA']['routing_table']['DC'])
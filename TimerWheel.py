@@ -0,0 +1,142 @@
+import threading
+import time
+
+
+class Timer:
+    """
+    A timer scheduled on a TimerWheel.
+    """
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancel the timer. Cancelled timers are dropped when their slot is reached.
+        """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    A hierarchical timer wheel driven by a single thread.
+
+    Scheduling and cancelling are O(1), so one wheel can track timers for many
+    thousands of sessions. Level 0 has one slot per tick; each higher level
+    covers `slots` times the span of the level below and cascades its timers
+    down as the wheel turns.
+    """
+
+    def __init__(self, tick=0.1, slots=64, levels=4):
+        """
+        Initialize the wheel.
+
+        Parameters:
+        tick (float): The wheel resolution in seconds. Default is 0.1.
+        slots (int): The number of slots per level. Default is 64.
+        levels (int): The number of levels. Default is 4.
+        """
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current_tick = 0
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedule a callback to run after a delay.
+
+        Parameters:
+        delay (float): The delay in seconds, rounded up to whole ticks.
+        callback (callable): The function to call on the wheel thread.
+        args: Arguments for the callback.
+
+        Returns:
+        Timer: The timer, which can be cancelled.
+        """
+        ticks = max(1, int(-(-delay // self.tick)))
+        with self.lock:
+            timer = Timer(self.current_tick + ticks, callback, args)
+            self._place(timer)
+        return timer
+
+    def _place(self, timer):
+        """
+        Put a timer in the slot matching its deadline. Must be called with the lock held.
+
+        Parameters:
+        timer (Timer): The timer to place.
+        """
+        deadline = max(timer.deadline, self.current_tick)
+        remaining = deadline - self.current_tick
+        span = 1
+        for level in range(self.levels):
+            if remaining < span * self.slots or level == self.levels - 1:
+                self.wheels[level][(deadline // span) % self.slots].append(timer)
+                return
+            span *= self.slots
+
+    def advance(self, ticks=1):
+        """
+        Turn the wheel and run the callbacks of every timer that expires.
+
+        Parameters:
+        ticks (int): The number of ticks to advance. Default is 1.
+        """
+        for _ in range(ticks):
+            with self.lock:
+                self.current_tick += 1
+                # Cascade higher levels whose slot boundary was just crossed
+                span = self.slots
+                for level in range(1, self.levels):
+                    if self.current_tick % span:
+                        break
+                    index = (self.current_tick // span) % self.slots
+                    bucket, self.wheels[level][index] = self.wheels[level][index], []
+                    for timer in bucket:
+                        if not timer.cancelled:
+                            self._place(timer)
+                    span *= self.slots
+                index = self.current_tick % self.slots
+                expired, self.wheels[0][index] = self.wheels[0][index], []
+            for timer in expired:
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"Error running timer callback: {e}")
+
+    def run(self):
+        """
+        Advance the wheel in real time until stopped.
+        """
+        while self.running:
+            target = self.start_time + (self.current_tick + 1) * self.tick
+            delay = target - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            due = int((time.monotonic() - self.start_time) / self.tick) - self.current_tick
+            self.advance(max(1, due))
+
+    def start(self):
+        """
+        Start the wheel thread.
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the wheel thread.
+        """
+        self.running = False
@@ -0,0 +1,122 @@
+import collections
+import multiprocessing
+import os
+import sys
+from Metrics import REGISTRY
+
+DROPPED = REGISTRY.counter('router_visualizations_dropped_total', 'Delivery events dropped because the visualization worker fell behind.')
+
+
+def render_deliveries(events, destination, directory):
+    """
+    Render the path of every delivery event until told to stop. Runs in the worker process.
+
+    Parameters:
+    events (multiprocessing.connection.Connection): The read end of the event pipe. Each event is the name of
+    the node that delivered a message.
+    destination (str): The name of the node paths are drawn to.
+    directory (str): The directory the images are written to.
+    """
+    # Yield the CPU to the routers whenever they have work
+    os.nice(19)
+    # Render to files; the worker has no window to show
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from Controler import build_nsfnet
+    # Built once the first event arrives, so routers never load the topology or the plotting libraries
+    network = build_nsfnet()
+    deliveries = collections.Counter()
+    while True:
+        try:
+            source = events.recv_bytes().decode()
+        except EOFError:
+            # The router closed the pipe
+            return
+        deliveries[source] += 1
+        if deliveries[source] > 1:
+            # The topology is fixed, so the path was already drawn
+            continue
+        if network.find_shortest_path(network, source, destination) is None:
+            continue
+        filename = os.path.join(directory, f"path-{source}-{destination}.png")
+        try:
+            network.visualize_shortest_path(network, source, destination, filename)
+            print(f"Path from {source} to {destination} written to {filename}")
+        except Exception as e:
+            print(f"Error visualizing path: {e}")
+
+
+class VisualizationWorker:
+    """
+    Renders delivered messages' paths in a separate process, off the data plane.
+
+    Routers only write a delivery event to a non-blocking pipe, which never
+    waits: when the pipe is full the event is dropped and counted. The pipe
+    buffer is the bounded queue, so queuing takes no lock, no pickling and no
+    feeder thread competing with the event loop. Rendering in its own process
+    keeps layout and drawing from holding the router's event loop or its GIL,
+    and keeps networkx and matplotlib out of router processes. The process is
+    started on the first event.
+    """
+
+    def __init__(self, destination='WA', directory='.'):
+        """
+        Initialize the worker.
+
+        Parameters:
+        destination (str): The name of the node paths are drawn to. Default is 'WA'.
+        directory (str): The directory the images are written to. Default is the current directory.
+        """
+        self.destination = destination
+        self.directory = directory
+        self.context = multiprocessing.get_context('spawn')
+        self.events = None
+        self.process = None
+
+    def start(self):
+        """
+        Start the worker process.
+        """
+        reader, self.events = self.context.Pipe(duplex=False)
+        os.set_blocking(self.events.fileno(), False)
+        self.process = self.context.Process(target=render_deliveries, args=(reader, self.destination, self.directory),
+                                            daemon=True)
+        self.process.start()
+        reader.close()
+
+    def submit(self, source):
+        """
+        Queue a delivery event without waiting.
+
+        Parameters:
+        source (str): The name of the node that delivered a message.
+
+        Returns:
+        bool: False if the queue was full and the event was dropped.
+        """
+        if self.process is None:
+            self.start()
+        try:
+            # Events are far below PIPE_BUF, so each write is all or nothing
+            self.events.send_bytes(source.encode())
+            return True
+        except BlockingIOError:
+            DROPPED.inc()
+            return False
+
+    def close(self):
+        """
+        Stop the worker once it has rendered the queued events.
+        """
+        if self.process is None:
+            return
+        self.events.close()
+        self.process.join(5.0)
+        self.process = None
+
+
+# Example usage
+if __name__ == "__main__":
+    worker = VisualizationWorker(directory=sys.argv[1] if len(sys.argv) > 1 else '.')
+    for name in ['DC', 'NY', 'DC', 'TX']:
+        worker.submit(name)
+    worker.close()